@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from utils import get_field_data
+from extraction_patient_info import (aget_lab_result_text, aprompt_llm, aprompt_llm_grouped,
+                                     aprompt_llm_streaming, extract_json_object, get_other_data,
+                                     merge_field_results, null_field_result)
+from demographics_extraction import split_prefilled_fields
+from utils import generate_combined_string
+from pdf_populate import build_answer_dict, populate_pdf
+from llm_cache import get_llm_response_cache
+from batch_validation import record_errors, validate_records
+from instrumentation import MetricsRegistry, serve_prometheus, stage, track_job, write_prometheus
+
+# Batch mode: run parse -> LLM extract -> validation -> PDF population for many patient bundles.
+#
+# A bundle is a directory containing demographics.json, soap_notes.txt and lab_result.pdf
+# (the same three inputs the single-patient __main__ in extraction_patient_info.py reads from
+# ./data). Bundles can be given either as a directory of bundle directories or as a JSONL manifest,
+# one line per bundle:
+#   {"bundle_id": "...", "demographics": "...", "soap_notes": "...", "lab_result": "..."}
+# Relative manifest paths are resolved against the manifest's directory.
+# A bundle may also name its fillable form ("form" in the manifest, or form_fillable.pdf inside the
+# bundle directory); otherwise DEFAULT_FORM is used. A scanned copy of that form already filled in
+# by hand ("scanned_form" in the manifest, or form_scanned.pdf inside the bundle directory) is read
+# with scanned_form_reader (which needs the ocr extra), and the fields found on it are not extracted
+# again. Form schemas come from the template registry, so each distinct form is compiled once and
+# every later bundle loads it by fingerprint.
+#
+# Every stage that waits on a remote service is awaited, so wall-clock time is bounded by the LLM
+# rate limit (max_concurrency in-flight requests) rather than by the sum of per-patient latencies.
+# With grouped=True every bundle fans out one request per field group; the LLM semaphore then bounds
+# individual group requests, so the rate limit is shared fairly across bundles.
+
+BUNDLE_FILES = {
+    "demographics": "demographics.json",
+    "soap_notes": "soap_notes.txt",
+    "lab_result": "lab_result.pdf",
+}
+DEFAULT_FORM = "./data/form_fillable.pdf"
+
+
+def discover_bundles(bundle_source, default_form=DEFAULT_FORM):
+    """Return a list of bundle dicts from a bundle directory or a JSONL manifest."""
+    bundles = []
+
+    if os.path.isdir(bundle_source):
+        for entry in sorted(os.listdir(bundle_source)):
+            bundle_dir = os.path.join(bundle_source, entry)
+            if not os.path.isdir(bundle_dir):
+                continue
+            bundle = {"bundle_id": entry}
+            for key, file_name in BUNDLE_FILES.items():
+                bundle[key] = os.path.join(bundle_dir, file_name)
+            form_path = os.path.join(bundle_dir, "form_fillable.pdf")
+            bundle["form"] = form_path if os.path.exists(form_path) else default_form
+            scanned_form_path = os.path.join(bundle_dir, "form_scanned.pdf")
+            bundle["scanned_form"] = (scanned_form_path if os.path.exists(scanned_form_path)
+                                      else None)
+            bundles.append(bundle)
+    else:
+        manifest_dir = os.path.dirname(os.path.abspath(bundle_source))
+        with open(bundle_source, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                bundle = {"bundle_id": str(entry["bundle_id"])}
+                for key in BUNDLE_FILES:
+                    bundle[key] = os.path.join(manifest_dir, entry[key])
+                bundle["form"] = (os.path.join(manifest_dir, entry["form"]) if entry.get("form")
+                                  else default_form)
+                bundle["scanned_form"] = (os.path.join(manifest_dir, entry["scanned_form"])
+                                          if entry.get("scanned_form") else None)
+                bundles.append(bundle)
+
+    bundle_ids = [bundle["bundle_id"] for bundle in bundles]
+    if len(bundle_ids) != len(set(bundle_ids)):
+        raise ValueError("Duplicate bundle_id in bundle source; per-bundle outputs would overwrite "
+                         "each other")
+
+    return bundles
+
+
+async def process_bundle(bundle, output_dir, llm_semaphore, parse_semaphore, grouped=False,
+                         source_cutoff=None, fast_path=True, stream=False, metrics_path=None,
+                         profile_stages=None, metrics_registry=None, flatten=False,
+                         incremental=False):
+    bundle_id = bundle["bundle_id"]
+    bundle_output_dir = os.path.join(output_dir, bundle_id)
+    os.makedirs(bundle_output_dir, exist_ok=True)
+
+    status = {"bundle_id": bundle_id, "status": "ok", "stage": None, "error": None}
+    start_time = time.perf_counter()
+
+    with track_job(bundle_id, metrics_path, profile_stages, metrics_registry) as job:
+        try:
+            status["stage"] = "schema"
+            field_data_str, _, field_data_json = get_field_data(bundle["form"])
+
+            status["stage"] = "parse"
+            patient_demographic_data, soap_content = get_other_data(bundle["demographics"],
+                                                                    bundle["soap_notes"])
+            async with parse_semaphore:
+                lab_result_text = await aget_lab_result_text(bundle["lab_result"])
+
+            scanned, llm_field_data = {}, field_data_json
+            if bundle.get("scanned_form"):
+                from scanned_form_reader import get_scanned_form_reader, split_scanned_fields
+
+                with stage("parse"):
+                    scanned_results, scan_report = await asyncio.to_thread(
+                        get_scanned_form_reader(bundle["form"]).read, bundle["scanned_form"])
+                scanned, llm_field_data = split_scanned_fields(scanned_results, field_data_json)
+                status["scanned_fields"] = len(scanned)
+                status["scan_report"] = scan_report
+
+            prefilled = {}
+            if fast_path:
+                prefilled, llm_field_data = split_prefilled_fields(patient_demographic_data,
+                                                                   llm_field_data)
+            if llm_field_data is not field_data_json:
+                field_data_str, _ = generate_combined_string(llm_field_data)
+            status["prefilled_fields"] = len(prefilled)
+
+            status["stage"] = "llm"
+            if not llm_field_data:
+                llm_json = {}
+            elif grouped:
+                llm_json, group_errors, prompt_report = await aprompt_llm_grouped(
+                    patient_demographic_data, soap_content, lab_result_text, llm_field_data,
+                    llm_semaphore, source_cutoff)
+                status["group_errors"] = group_errors
+                status["prompt_tokens"] = {
+                    key: prompt_report[key]
+                    for key in ["prompt_tokens", "full_prompt_tokens", "saved_tokens"]}
+            elif stream:
+                async with llm_semaphore:
+                    llm_json, stream_errors, stream_metrics = await aprompt_llm_streaming(
+                        patient_demographic_data, soap_content, lab_result_text, field_data_str)
+                status["stream_metrics"] = stream_metrics
+                status["stream_validation_errors"] = stream_errors
+                reason = "Response ended before this field was completed"
+                llm_json.update({field_name: null_field_result(reason)
+                                 for field_name in llm_field_data if field_name not in llm_json})
+            else:
+                async with llm_semaphore:
+                    output_text, _ = await aprompt_llm(patient_demographic_data, soap_content,
+                                                       lab_result_text, field_data_str)
+
+                status["stage"] = "json"
+                llm_json = extract_json_object(output_text)
+            out_json = merge_field_results(field_data_json, scanned, prefilled, llm_json)
+            with open(os.path.join(bundle_output_dir, "answers.json"), "w", encoding="utf-8") as f:
+                json.dump(out_json, f, indent=4, ensure_ascii=False)
+
+            status["stage"] = "validation"
+            validation_errors = record_errors(validate_records([out_json])[0])
+            status["validation_errors"] = validation_errors
+            if validation_errors:
+                raise ValueError("; ".join(f"{check}: {error}"
+                                           for check, error in validation_errors.items()))
+
+            status["stage"] = "population"
+            answer_dict = build_answer_dict(out_json, field_data_json)
+            await asyncio.to_thread(populate_pdf, answer_dict,
+                                    os.path.join(bundle_output_dir, "pdf_populated.pdf"),
+                                    bundle["form"], flatten, incremental)
+
+            status["stage"] = "done"
+        except Exception as e:
+            status["status"] = "failed"
+            status["error"] = f"{type(e).__name__}: {e}"
+            job.status, job.error = status["status"], status["error"]
+
+    status["elapsed_s"] = round(time.perf_counter() - start_time, 3)
+    status["metrics"] = job.to_json()
+    with open(os.path.join(bundle_output_dir, "status.json"), "w", encoding="utf-8") as f:
+        json.dump(status, f, indent=4, ensure_ascii=False)
+
+    return status
+
+
+async def run_batch(bundle_source, output_dir="./output/batch", max_concurrency=8,
+                    max_parse_concurrency=4, default_form=DEFAULT_FORM, grouped=False,
+                    source_cutoff=None, fast_path=True, stream=False, profile_stages=None,
+                    metrics_port=None, flatten=False, incremental=False,
+                    metrics_host="127.0.0.1"):
+    bundles = discover_bundles(bundle_source, default_form)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Per-bundle metrics go to <output>/metrics.jsonl; the run's aggregate to <output>/metrics.prom
+    # (and to http://<metrics_host>:<metrics_port>/metrics while the batch is running)
+    metrics_path = os.path.join(output_dir, "metrics.jsonl")
+    metrics_registry = MetricsRegistry()
+    metrics_server = None
+    if metrics_port:
+        metrics_server = serve_prometheus(metrics_port, metrics_registry, metrics_host)
+
+    llm_semaphore = asyncio.Semaphore(max_concurrency)
+    parse_semaphore = asyncio.Semaphore(max_parse_concurrency)
+
+    start_time = time.perf_counter()
+    statuses = await asyncio.gather(*[
+        process_bundle(bundle, output_dir, llm_semaphore, parse_semaphore, grouped, source_cutoff,
+                       fast_path, stream, metrics_path, profile_stages, metrics_registry, flatten,
+                       incremental)
+        for bundle in bundles
+    ])
+    elapsed = time.perf_counter() - start_time
+    write_prometheus(os.path.join(output_dir, "metrics.prom"), metrics_registry)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+    summary = {
+        "bundle_count": len(statuses),
+        "succeeded": sum(1 for s in statuses if s["status"] == "ok"),
+        "failed": sum(1 for s in statuses if s["status"] != "ok"),
+        "elapsed_s": round(elapsed, 3),
+        "bundles_per_s": round(len(statuses) / elapsed, 3) if elapsed > 0 else None,
+        "stage_seconds": {stage_name: round(seconds, 4)
+                          for stage_name, seconds in metrics_registry.stage_seconds.items()},
+        "llm_tokens": dict(metrics_registry.tokens),
+        "counters": dict(metrics_registry.counters),
+        "bundles": statuses,
+    }
+    cache = get_llm_response_cache()
+    if cache is not None:
+        summary["llm_cache"] = cache.stats()
+    with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+
+    return summary
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Run the extraction pipeline over many patient bundles.")
+    arg_parser.add_argument("bundles", help="Directory of bundle directories, or a JSONL manifest")
+    arg_parser.add_argument("--output", default="./output/batch",
+                            help="Directory for per-bundle outputs")
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight LLM requests")
+    arg_parser.add_argument("--parse-concurrency", type=int, default=4,
+                            help="Max in-flight LlamaParse jobs")
+    arg_parser.add_argument("--form", default=DEFAULT_FORM,
+                            help="Fillable form for bundles that do not name one")
+    arg_parser.add_argument("--grouped", action="store_true",
+                            help="Fan out one LLM request per field group")
+    arg_parser.add_argument("--source-cutoff", type=int, default=None,
+                            help="With --grouped, keep only each field's top-N priority sources in "
+                                 "the prompt")
+    arg_parser.add_argument("--no-fast-path", action="store_true",
+                            help="Send demographics fields to the LLM instead of filling them by "
+                                 "rule")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="Stream the completion and parse/validate each field as soon as "
+                                 "it closes")
+    arg_parser.add_argument("--profile", default="",
+                            help="Comma-separated stages to wrap in cProfile/tracemalloc, e.g. "
+                                 "llm,population")
+    arg_parser.add_argument("--metrics-port", type=int, default=None,
+                            help="Serve Prometheus metrics on this port while the batch runs")
+    arg_parser.add_argument("--metrics-host", default="127.0.0.1",
+                            help="Address to serve metrics on (0.0.0.0 lets other hosts scrape "
+                                 "them)")
+    arg_parser.add_argument("--flatten", action="store_true",
+                            help="Write filled forms flattened to page content (print-only, no "
+                                 "form fields)")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="Append the filled fields to the form's own bytes as an "
+                                 "incremental update")
+    args = arg_parser.parse_args()
+
+    summary = asyncio.run(run_batch(args.bundles, args.output, args.concurrency,
+                                    args.parse_concurrency, args.form, args.grouped,
+                                    args.source_cutoff, not args.no_fast_path, args.stream,
+                                    [s for s in args.profile.split(",") if s] or None,
+                                    args.metrics_port, args.flatten, args.incremental,
+                                    args.metrics_host))
+    print(f"{summary['succeeded']}/{summary['bundle_count']} bundles succeeded in "
+          f"{summary['elapsed_s']}s")
+
+
+if __name__ == "__main__":
+    main()
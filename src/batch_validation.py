@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import time
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from data_validation import ADDRESS_REGION_RE, DATE_FIELDS, validate_address
+from nanp_area_codes import NANP_AREA_CODES
+from postal_index import (get_postal_index, missing_index_error, pgeocode_fallback_enabled,
+                          SLOT_FUNCTIONS)
+from instrumentation import stage
+
+# Columnar validation of many extracted records at once.
+#
+# validate_records() takes a list of extraction outputs ({field name: {"value": ...}} as written to
+# answers.json, or plain {field name: value}) and checks every record in one pass per column:
+#   phone parts      phonea/phonea1 are 3 digits, phoneb/phoneb1 are 4 digits
+#   area codes       areacode/areacode1 looked up in a 1000-entry table of NANP area codes built
+#                    once, then cross-checked against the state/province at the end of the address
+#   date triples     every (d, m, y) in DATE_FIELDS (at most 2, 2 and 4 digits) is a real calendar
+#                    date; the date of birth must also not be in the future and give an age within
+#                    [MIN_AGE, MAX_AGE]
+#   address          postal code and state/province pulled from the end of the address and checked
+#                    against the postal code index (see postal_index.py), or with pgeocode when it
+#                    has not been built; unchecked when that lookup fails or
+#                    POSTAL_LOOKUP_FALLBACK=none turns it off
+#
+# Nothing is raised. Each record gets {check name: {"status", "value", "error"}} where status is
+# one of
+#   ok        the check passed
+#   invalid   the value is wrong; error says why
+#   missing   the value (or part of a date) is null, so there is nothing to check
+#   unchecked the value could not be checked (e.g. no postal code found in the address)
+#   mismatch  the value is valid on its own but disagrees with another field (an area code from
+#             another province than the address); reported, but not counted by record_errors
+
+PHONE_PART_LENGTHS = {"phonea": 3, "phoneb": 4, "phonea1": 3, "phoneb1": 4}
+AREA_CODE_FIELDS = ["areacode", "areacode1"]
+ADDRESS_FIELD = "address"
+DOB_CHECK = "date_of_birth"
+
+MIN_AGE = 0
+MAX_AGE = 150
+MIN_YEAR = 1000
+MAX_YEAR = 2200
+# day, month, year; longer values are invalid before any int conversion
+DATE_PART_MAX_DIGITS = (2, 2, 4)
+
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+@lru_cache(maxsize=1)
+def nanp_area_code_table():
+    """
+        Boolean array indexed by area code (0-999): True when the code is an assigned NANP
+        geographic area code.
+    """
+    table = np.zeros(1000, dtype=bool)
+    table[[int(area_code) for area_code in NANP_AREA_CODES]] = True
+    return table
+
+
+def _value(record, field):
+    value = record.get(field)
+    if isinstance(value, dict):
+        value = value.get("value")
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value == "" or value.lower() == "null" else value
+
+
+def _column(records, field):
+    """(string array with "" for nulls, boolean presence mask) for one field across all records."""
+    values = [_value(record, field) for record in records]
+    present = np.array([value is not None for value in values], dtype=bool)
+    strings = np.array([value or "" for value in values], dtype=str)
+    return strings, present
+
+
+def _digits_as_int(strings, valid):
+    numbers = np.zeros(len(strings), dtype=np.int64)
+    if valid.any():
+        numbers[valid] = strings[valid].astype(np.int64)
+    return numbers
+
+
+def _fill_statuses(report, check, values, present, invalid, errors):
+    for i, record_report in enumerate(report):
+        if not present[i]:
+            record_report[check] = {"status": "missing", "value": None, "error": None}
+        elif invalid[i]:
+            record_report[check] = {"status": "invalid", "value": str(values[i]),
+                                    "error": str(errors[i])}
+        else:
+            record_report[check] = {"status": "ok", "value": str(values[i]), "error": None}
+
+
+def _check_phone_parts(records, report):
+    for field, length in PHONE_PART_LENGTHS.items():
+        strings, present = _column(records, field)
+        well_formed = (np.char.str_len(strings) == length) & np.char.isdecimal(strings)
+        invalid = present & ~well_formed
+        errors = np.where(invalid, f"Expected {length} digits", "")
+        _fill_statuses(report, field, strings, present, invalid, errors)
+
+
+def _check_area_codes(records, report):
+    table = nanp_area_code_table()
+    for field in AREA_CODE_FIELDS:
+        strings, present = _column(records, field)
+        well_formed = (np.char.str_len(strings) == 3) & np.char.isdecimal(strings)
+        assigned = well_formed & table[_digits_as_int(strings, well_formed)]
+        invalid = present & ~assigned
+        errors = np.where(well_formed, "Not an assigned NANP area code", "Expected 3 digits")
+        _fill_statuses(report, field, strings, present, invalid, errors)
+
+
+def _check_area_code_regions(records, report):
+    address_regions = [ADDRESS_REGION_RE.search(value) if value else None
+                       for value in _column(records, ADDRESS_FIELD)[0]]
+    for field in AREA_CODE_FIELDS:
+        check = field + "_region"
+        for record_report, address_region in zip(report, address_regions):
+            area_code_entry = record_report[field]
+            if area_code_entry["status"] != "ok" or address_region is None:
+                status = "missing" if area_code_entry["status"] == "missing" else "unchecked"
+                record_report[check] = {"status": status, "value": area_code_entry["value"],
+                                        "error": None}
+                continue
+            _, regions, description = NANP_AREA_CODES[area_code_entry["value"]]
+            province = address_region.group(1).upper()
+            if not regions:
+                record_report[check] = {"status": "unchecked", "value": area_code_entry["value"],
+                                        "error": f"{description} area code has no state/province"}
+            elif province not in regions:
+                record_report[check] = {"status": "mismatch", "value": area_code_entry["value"],
+                                        "error": f"Area code is in {'/'.join(regions)}, "
+                                                 f"address is in {province}"}
+            else:
+                record_report[check] = {"status": "ok", "value": area_code_entry["value"],
+                                        "error": None}
+
+
+def _check_date_triples(records, report, today):
+    today_packed = today.year * 10000 + today.month * 100 + today.day
+    for date_set in DATE_FIELDS:
+        check = date_set[0][:-2]
+        columns = [_column(records, field) for field in date_set]
+        present = columns[0][1] & columns[1][1] & columns[2][1]
+        digits, short = present.copy(), present.copy()
+        for (strings, _), max_digits in zip(columns, DATE_PART_MAX_DIGITS):
+            digits &= np.char.isdecimal(strings)
+            short &= np.char.str_len(strings) <= max_digits
+        numeric = digits & short
+        d, m, y = (_digits_as_int(strings, numeric) for strings, _ in columns)
+
+        leap = ((y % 4 == 0) & (y % 100 != 0)) | (y % 400 == 0)
+        month_ok = (m >= 1) & (m <= 12)
+        month_length = DAYS_IN_MONTH[np.where(month_ok, m, 0)] + (month_ok & (m == 2) & leap)
+        real_date = (numeric & month_ok & (d >= 1) & (d <= month_length) &
+                     (y >= MIN_YEAR) & (y <= MAX_YEAR))
+
+        errors = np.where(numeric, "Not a calendar date",
+                          "Day, month and year must be numbers").astype(object)
+        errors[digits & ~short] = "Day and month take at most 2 digits, year at most 4"
+        invalid = present & ~real_date
+        if check == DOB_CHECK:
+            packed = y * 10000 + m * 100 + d
+            future = real_date & (packed > today_packed)
+            age = today.year - y - ((m * 100 + d) > (today.month * 100 + today.day))
+            age_out_of_range = real_date & ~future & ((age < MIN_AGE) | (age > MAX_AGE))
+            invalid |= future | age_out_of_range
+            errors[future] = "Future date"
+            for i in np.flatnonzero(age_out_of_range):
+                errors[i] = f"Age {age[i]} out of range ({MIN_AGE}-{MAX_AGE})"
+
+        values = [f"{columns[0][0][i]}/{columns[1][0][i]}/{columns[2][0][i]}"
+                  for i in range(len(records))]
+        _fill_statuses(report, check, values, present, invalid, errors)
+
+
+def _check_addresses(records, report):
+    strings, present = _column(records, ADDRESS_FIELD)
+    tails = [ADDRESS_REGION_RE.search(value) if value else None for value in strings]
+    postal_index = get_postal_index()
+
+    expected_states = [None] * len(records)
+    if postal_index is not None:
+        for country in ["us", "ca"]:
+            rows = []
+            slots = []
+            for i, tail in enumerate(tails):
+                if tail is None or ("ca" if tail.group(2)[0].isalpha() else "us") != country:
+                    continue
+                slot = SLOT_FUNCTIONS[country](tail.group(2))
+                if slot is not None:
+                    rows.append(i)
+                    slots.append(slot)
+            if rows:
+                states = postal_index.slot_table(country)["state"][np.array(slots)]
+                for i, state in zip(rows, states):
+                    expected_states[i] = state.decode("ascii").strip()  # b"" for an empty slot
+
+    # Set once the pgeocode fallback fails (or is turned off), so it is not retried for every record
+    lookup_error = None
+    if postal_index is None and not pgeocode_fallback_enabled():
+        lookup_error = str(missing_index_error())
+    for i, record_report in enumerate(report):
+        if not present[i]:
+            record_report[ADDRESS_FIELD] = {"status": "missing", "value": None, "error": None}
+            continue
+        entry = {"status": "ok", "value": str(strings[i]), "error": None}
+        record_report[ADDRESS_FIELD] = entry
+        tail = tails[i]
+        if tail is None:
+            entry.update(status="unchecked",
+                         error="No state/province and postal code at the end of the address")
+            continue
+
+        state_province, postal_code = tail.group(1).upper(), tail.group(2)
+        expected_state = expected_states[i]
+        if postal_index is None:
+            if lookup_error is None:
+                try:
+                    result = validate_address(postal_code, state_province)
+                    expected_state = str(result["expected_state"]) if result["outcome"] else ""
+                except Exception as e:
+                    lookup_error = f"Postal code lookup failed: {e}"
+            if lookup_error is not None:
+                entry.update(status="unchecked", error=lookup_error)
+                continue
+
+        if not expected_state:
+            entry.update(status="invalid", error=f"Unknown postal code {postal_code}")
+        elif expected_state != state_province:
+            entry.update(status="invalid",
+                         error=f"Postal code {postal_code} is in {expected_state}, "
+                               f"not {state_province}")
+
+
+def validate_records(records, today=None):
+    """Return one {check name: {"status", "value", "error"}} report per record, in input order."""
+    today = today or date.today()
+    report = [{} for _ in records]
+    if not records:
+        return report
+    with stage("validation"):
+        _check_phone_parts(records, report)
+        _check_area_codes(records, report)
+        _check_area_code_regions(records, report)
+        _check_date_triples(records, report, today)
+        _check_addresses(records, report)
+    return report
+
+
+def record_errors(record_report):
+    """{check name: error} for the checks that failed in one record's report."""
+    return {check: entry["error"] for check, entry in record_report.items()
+            if entry["status"] == "invalid"}
+
+
+def summarize_report(report):
+    """{check name: {status: count}} over all records."""
+    summary = {}
+    for record_report in report:
+        for check, entry in record_report.items():
+            counts = summary.setdefault(check, {})
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return summary
+
+
+def load_records(paths):
+    """
+        (record ids, records) from answers.json files, directories searched for answers.json, or
+        JSONL files.
+    """
+    def load_answers(path):
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        # The single-patient pipeline writes answers.json as a JSON-encoded string
+        return json.loads(record) if isinstance(record, str) else record
+
+    record_ids, records = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                if "answers.json" in files:
+                    record_ids.append(os.path.relpath(root, path))
+                    records.append(load_answers(os.path.join(root, "answers.json")))
+        elif path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if line.strip():
+                        record = json.loads(line)
+                        record_ids.append(str(record.pop("bundle_id", f"{path}:{line_number}")))
+                        records.append(record)
+        else:
+            record_ids.append(path)
+            records.append(load_answers(path))
+    return record_ids, records
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Validate many extracted records at once.")
+    arg_parser.add_argument("paths", nargs="+",
+                            help="answers.json files, directories holding them "
+                                 "(e.g. batch output), or JSONL files")
+    arg_parser.add_argument("--output", default="./output/validation_report.json")
+    args = arg_parser.parse_args()
+
+    record_ids, records = load_records(args.paths)
+    start_time = time.perf_counter()
+    report = validate_records(records)
+    elapsed = time.perf_counter() - start_time
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "record_count": len(records),
+            "records_with_errors": sum(1 for record_report in report
+                                       if record_errors(record_report)),
+            "elapsed_s": round(elapsed, 4),
+            "summary": summarize_report(report),
+            "records": dict(zip(record_ids, report)),
+        }, f, indent=4, ensure_ascii=False)
+    print(f"Validated {len(records)} records in {elapsed:.3f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
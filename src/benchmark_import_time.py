@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Startup cost of each pipeline entry point, measured with `python -X importtime` in a fresh
+# interpreter.
+#
+#   python benchmark_import_time.py                 # report
+#   python benchmark_import_time.py --check         # exit 1 on a regression (for CI)
+#
+# For every entry point the cumulative import time of the module is reported (median over --repeat
+# runs), together with its slowest direct imports. --check fails when an entry point exceeds its
+# budget in IMPORT_BUDGET_MS, or when it imports one of HEAVY_PACKAGES at startup: those (LLM
+# clients, LlamaParse, pandas/pgeocode, phonenumbers, ...) must only be imported by the functions
+# that use them.
+
+ENTRY_POINTS = ["pdf_extraction", "extraction_patient_info", "pdf_populate", "soap_eval",
+                "batch_extraction", "batch_validation", "data_validation"]
+
+IMPORT_BUDGET_MS = {
+    "pdf_extraction": 400,
+    "extraction_patient_info": 500,
+    "pdf_populate": 400,
+    "soap_eval": 600,
+    "batch_extraction": 700,
+    "batch_validation": 400,
+    "data_validation": 100,
+}
+
+HEAVY_PACKAGES = ["llama_index", "llama_parse", "google", "pandas", "pgeocode", "phonenumbers",
+                  "usaddress", "dateutil"]
+
+
+def run_importtime(module):
+    """Return [(depth, self_us, cumulative_us, name)] from one `-X importtime` run."""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def module_subtree(rows, module):
+    """Rows imported while importing `module` (importtime prints children before their parent)."""
+    end = next(i for i, row in enumerate(rows) if row[0] == 0 and row[3] == module)
+    start = end
+    while start > 0 and rows[start - 1][0] > 0:
+        start -= 1
+    return rows[end], rows[start:end]
+
+
+def measure(module, repeat, top):
+    totals_ms = []
+    for _ in range(repeat):
+        module_row, subtree = module_subtree(run_importtime(module), module)
+        totals_ms.append(module_row[2] / 1000)
+
+    loaded = {name.split(".")[0] for _, _, _, name in subtree}
+    direct_imports = sorted((row for row in subtree if row[0] == 1), key=lambda row: -row[2])
+    return {
+        "import_ms": round(statistics.median(totals_ms), 1),
+        "heavy_packages": [package for package in HEAVY_PACKAGES if package in loaded],
+        "slowest_imports": [[name, round(cumulative_us / 1000, 1)] for _, _, cumulative_us, name in
+                            direct_imports[:top]],
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark import time of the pipeline entry points.")
+    arg_parser.add_argument("--modules", nargs="+", default=ENTRY_POINTS)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--top", type=int, default=5,
+                            help="Slowest direct imports to list per module")
+    arg_parser.add_argument("--check", action="store_true", help="Exit 1 if a budget is exceeded")
+    arg_parser.add_argument("--output", default=None, help="Optional JSON report path")
+    args = arg_parser.parse_args()
+
+    results = {}
+    failures = []
+    for module in args.modules:
+        result = measure(module, args.repeat, args.top)
+        results[module] = result
+        print(f"{module}: {json.dumps(result)}")
+
+        budget_ms = IMPORT_BUDGET_MS.get(module)
+        if budget_ms is not None and result["import_ms"] > budget_ms:
+            failures.append(f"{module}: {result['import_ms']} ms > {budget_ms} ms budget")
+        if result["heavy_packages"]:
+            failures.append(f"{module}: imports {', '.join(result['heavy_packages'])} at startup")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import statistics
+import time
+
+from lab_parsers import get_lab_parser, LAB_PARSER_BACKENDS
+from extraction_patient_info import (normalize_lab_text, prompt_llm, extract_json_object,
+                                     get_other_data)
+from utils import get_field_data, compare_with_ground_truth
+
+# Compare lab PDF parser backends on speed and, optionally, downstream extraction accuracy.
+#
+#   python benchmark_lab_parser.py --backends local llamaparse --repeat 5
+#   python benchmark_lab_parser.py --backends local llamaparse --with-extraction
+#
+# Parsing is timed without the parse cache so every run measures the backend itself.
+# --with-extraction runs the full LLM extraction on each backend's text and scores it with
+# compare_with_ground_truth (this calls Gemini once per backend).
+
+
+def time_backend(backend, pdf_path, repeat):
+    parser = get_lab_parser(backend)
+    timings = []
+    page_texts = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        page_texts = parser.parse(pdf_path)
+        timings.append(time.perf_counter() - start_time)
+    return page_texts, timings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark lab PDF parser backends.")
+    arg_parser.add_argument("--pdf", default="./data/lab_result.pdf")
+    arg_parser.add_argument("--backends", nargs="+", default=list(LAB_PARSER_BACKENDS))
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--with-extraction", action="store_true",
+                            help="Also run LLM extraction on each backend's text and score against "
+                                 "ground truth")
+    arg_parser.add_argument("--output", default=None, help="Optional JSON file for the results")
+    args = arg_parser.parse_args()
+
+    results = {}
+    for backend in args.backends:
+        page_texts, timings = time_backend(backend, args.pdf, args.repeat)
+        lab_result_text = normalize_lab_text(page_texts)
+        result = {
+            "pages": len(page_texts),
+            "chars": len(lab_result_text),
+            "parse_s_median": round(statistics.median(timings), 4),
+            "parse_s_min": round(min(timings), 4),
+            "parse_s_max": round(max(timings), 4),
+        }
+
+        if args.with_extraction:
+            patient_demographic_data, soap_content = get_other_data()
+            field_data_str, line_list, field_data_json = get_field_data()
+            output_text, out = prompt_llm(patient_demographic_data, soap_content, lab_result_text,
+                                          field_data_str)
+            scores = compare_with_ground_truth(extract_json_object(output_text))
+            result["extraction_accuracy"] = scores["accuracy"]
+            result["incorrect_fields"] = [f["field"] for f in scores["incorrect_fields"]]
+
+        results[backend] = result
+        print(f"{backend}: {json.dumps(result)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from pypdf import PdfReader, PdfWriter
+
+from pdf_extraction import process_pdf
+from pdf_populate import TemplatePopulator
+
+# Schema extraction and population on a large multi-page form (pdf_extraction.index_fields).
+#
+#   python benchmark_large_form.py --fields 500 --pages 20 --forms 50
+#   python benchmark_large_form.py --template ./data/claims_form.pdf --section-rate 0.5
+#
+# Without --template a synthetic form is generated: --fields fields (one in five a checkbox, the
+# rest text) spread over all but the last --blank-pages of --pages pages, which carry no annotations
+# at all.
+#   extraction  get_fields: reader.get_fields() plus a separate /Annots scan of every page for text
+#                           rectangles (the original process_pdf); index: one pass over the pages
+#                           (process_pdf)
+#   population  all_pages: read and copy the template per form, update every annotated page with the
+#                          whole answer set (pypdf's update_page_form_field_values); template:
+#                          TemplatePopulator, updating only the pages holding fields whose value
+#                          changed; template_flatten: the same, flattened
+#               template_incremental: TemplatePopulator(incremental=True), the template's bytes plus
+#                          an incremental update of the changed fields; template_update: the same
+#                          update written on its own (fill_update), as stored next to a single copy
+#                          of the template
+# Write time (writing the output, after the fields are set) and bytes written are reported per form.
+# Each answer set fills every field on a random --section-rate share of the pages (seeded), as a
+# claim rarely uses every section of a long form.
+
+POPULATION_MODES = ["all_pages", "template", "template_flatten", "template_incremental",
+                    "template_update"]
+RENDER_FORMS = 5
+
+
+def make_large_form(output_path, fields=500, pages=20, blank_pages=2):
+    import pymupdf
+
+    field_pages = max(pages - blank_pages, 1)
+    per_page = -(-fields // field_pages)
+    with pymupdf.open() as doc:
+        for page_index in range(pages):
+            page = doc.new_page(width=612, height=792)
+            page.insert_text((36, 30), f"Claim form - page {page_index + 1}", fontsize=12)
+            if page_index >= field_pages:
+                page.insert_text((36, 60), "Instructions and declarations "
+                                 "(no fields on this page).", fontsize=10)
+                continue
+            for slot in range(per_page):
+                field_number = page_index * per_page + slot
+                if field_number >= fields:
+                    break
+                column, row = divmod(slot, -(-per_page // 2))
+                x, y = 36 + column * 288, 50 + row * 28
+                widget = pymupdf.Widget()
+                widget.field_name = f"field_{field_number:04d}"
+                widget.field_label = f"Question {field_number + 1}"
+                if field_number % 5 == 4:
+                    widget.field_type = pymupdf.PDF_WIDGET_TYPE_CHECKBOX
+                    widget.rect = pymupdf.Rect(x, y, x + 12, y + 12)
+                else:
+                    widget.field_type = pymupdf.PDF_WIDGET_TYPE_TEXT
+                    widget.rect = pymupdf.Rect(x, y, x + 250, y + 18)
+                    widget.text_fontsize = 9
+                page.add_widget(widget)
+        # The form's default font resource, which the widgets' /DA (Helv) refers to
+        doc.xref_set_key(doc.pdf_catalog(), "AcroForm/DA", "(/Helv 0 Tf 0 g)")
+        doc.xref_set_key(doc.pdf_catalog(), "AcroForm/DR",
+                         "<</Font<</Helv<</Type/Font/Subtype/Type1/BaseFont/Helvetica"
+                         "/Encoding/WinAnsiEncoding>>>>>>")
+        doc.save(output_path)
+
+
+def extract_get_fields(reader):
+    """
+        The original two-traversal schema extraction: text rectangles by page scan, then
+        reader.get_fields().
+    """
+    text_rects = {}
+    for page in reader.pages:
+        for annot_ref in page.get("/Annots", []):
+            annotation = annot_ref.get_object()
+            if annotation.get("/FT") == "/Tx":
+                text_rects[annotation.get("/T").strip().lower()] = annotation.get("/Rect")
+    schema = {}
+    for name, field in reader.get_fields().items():
+        normalized_name = field.get("/T").strip().lower()
+        if field.get("/FT") == "/Tx":
+            schema[normalized_name] = {"bbox": text_rects.get(normalized_name),
+                                       "pdf_field_name": name}
+        elif field.get("/FT") == "/Btn":
+            rects = ([kid.get_object()["/Rect"] for kid in field.get("/Kids", [])] or
+                     [field.get("/Rect")])
+            schema[normalized_name] = {"bbox": rects, "pdf_field_name": name}
+    return schema
+
+
+def run_extraction(mode, template_path, repeat):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        reader = PdfReader(template_path)
+        schema = extract_get_fields(reader) if mode == "get_fields" else process_pdf(reader)
+    elapsed = time.perf_counter() - start_time
+    return {"fields": len(schema), "runs": repeat, "ms_per_run": round(elapsed / repeat * 1000, 1)}
+
+
+def make_answer_dicts(template_path, count, section_rate, seed=0):
+    schema = process_pdf(PdfReader(template_path))
+    pages = sorted({spec["page"] for spec in schema.values()})
+    rng = random.Random(seed)
+    answer_dicts = []
+    for i in range(count):
+        sections = {page for page in pages if rng.random() < section_rate} or {rng.choice(pages)}
+        answer_dict = {}
+        for spec in schema.values():
+            if spec["page"] not in sections:
+                continue
+            if spec["type"] == "checkbox":
+                state = spec["checkbox_opts"][0] if spec["checkbox_opts"] else "Yes"
+                answer_dict[spec["pdf_field_name"]] = "/" + state
+            else:
+                answer_dict[spec["pdf_field_name"]] = f"{spec['label']} answer {i}"
+        answer_dicts.append(answer_dict)
+    return answer_dicts
+
+
+def run_population(mode, template_path, answer_dicts, output_dir):
+    output_paths = [os.path.join(output_dir, f"{mode}_{i}.pdf") for i in range(len(answer_dicts))]
+    pages_touched, write_times = [], []
+    start_time = time.perf_counter()
+    if mode == "all_pages":
+        for answer_dict, output_path in zip(answer_dicts, output_paths):
+            writer = PdfWriter(clone_from=PdfReader(template_path))
+            for page in writer.pages:
+                if "/Annots" in page:
+                        writer.update_page_form_field_values(page, fields=answer_dict,
+                                                             auto_regenerate=False)
+            write_start = time.perf_counter()
+            writer.write(output_path)
+            write_times.append(time.perf_counter() - write_start)
+            pages_touched.append(sum("/Annots" in page for page in writer.pages))
+    else:
+        populator = TemplatePopulator(template_path, flatten=mode == "template_flatten",
+                                      incremental=mode in ("template_incremental",
+                                                           "template_update"))
+        for answer_dict, output_path in zip(answer_dicts, output_paths):
+            if mode == "template_update":
+                populator.fill_update(answer_dict, output_path)
+            else:
+                populator.fill(answer_dict, output_path)
+            write_times.append(populator.last_write_s)
+            pages_touched.append(len(populator.last_changed_pages))
+    elapsed = time.perf_counter() - start_time
+
+    if mode == "template_update":
+        # Template bytes + update make each PDF; rendered (and checked) from these
+        with open(template_path, "rb") as f:
+            template_bytes = f.read()
+        for i, output_path in enumerate(output_paths):
+            full_path = os.path.join(output_dir, f"{mode}_{i}_full.pdf")
+            with open(output_path, "rb") as f, open(full_path, "wb") as out:
+                out.write(template_bytes + f.read())
+    render_paths = [os.path.join(output_dir, f"{mode}_{i}_full.pdf") if mode == "template_update"
+                    else path for i, path in enumerate(output_paths)]
+
+    render_start = time.perf_counter()
+    for output_path in render_paths[:RENDER_FORMS]:
+        render_form(output_path)
+    render_elapsed = time.perf_counter() - render_start
+    rendered_forms = min(RENDER_FORMS, len(output_paths))
+    return {
+        "forms": len(answer_dicts),
+        "elapsed_s": round(elapsed, 3),
+        "forms_per_s": round(len(answer_dicts) / elapsed, 2),
+        "mean_pages_updated": round(sum(pages_touched) / len(pages_touched), 1),
+        "mean_bytes_written": int(sum(os.path.getsize(p) for p in output_paths) /
+                                  len(output_paths)),
+        "write_ms_per_form": round(sum(write_times) / len(write_times) * 1000, 2),
+        "render_ms_per_form": round(render_elapsed / rendered_forms * 1000, 1),
+    }
+
+
+def time_field_updates(template_path, answer_dicts):
+    """
+        ms per form spent setting values and appearances, without writing: pypdf's updater vs
+        FormAppearances.
+    """
+    from form_appearance import FormAppearances
+    from pdf_extraction import index_fields
+
+    writer = PdfWriter(clone_from=PdfReader(template_path))
+    start_time = time.perf_counter()
+    for answer_dict in answer_dicts:
+        for page in writer.pages:
+            if "/Annots" in page:
+                writer.update_page_form_field_values(page, fields=answer_dict,
+                                                     auto_regenerate=False)
+    pypdf_ms = (time.perf_counter() - start_time) / len(answer_dicts) * 1000
+
+    writer = PdfWriter(clone_from=PdfReader(template_path))
+    appearances, fields = FormAppearances(writer), index_fields(writer)
+    start_time = time.perf_counter()
+    for answer_dict in answer_dicts:
+        for field_name, value in answer_dict.items():
+            appearances.set_value(fields[field_name], value)
+    appearance_ms = (time.perf_counter() - start_time) / len(answer_dicts) * 1000
+    return {"pypdf_update_page_form_field_values": round(pypdf_ms, 1),
+            "form_appearance": round(appearance_ms, 1)}
+
+
+def render_form(pdf_path, dpi=72):
+    import pymupdf
+
+    from rasterize import pixmap_to_array
+
+    with pymupdf.open(pdf_path) as doc:
+        return [pixmap_to_array(page.get_pixmap(dpi=dpi)).copy() for page in doc]
+
+
+def flatten_pixel_diff(output_dir, count):
+    """
+        Largest mean absolute pixel difference between a flattened form and the same fillable form.
+    """
+    worst = 0.0
+    for i in range(min(count, RENDER_FORMS)):
+        fillable = render_form(os.path.join(output_dir, f"template_{i}.pdf"))
+        flattened = render_form(os.path.join(output_dir, f"template_flatten_{i}.pdf"))
+        for a, b in zip(fillable, flattened):
+            worst = max(worst, float(abs(a.astype("int16") - b.astype("int16")).mean()))
+    return round(worst, 4)
+
+
+def check_outputs(output_dir, answer_dicts):
+    """
+        Every fillable population mode must leave every page with the same field values as all_pages
+        (unset, "" and /Off are blank), and incremental outputs must open without repair.
+    """
+    import pymupdf
+
+    def value(field):
+        v = field.get("/V")
+        return None if v in (None, "", "/Off") else str(v)
+
+    mismatches = 0
+    for i in range(len(answer_dicts)):
+        all_pages = PdfReader(os.path.join(output_dir, f"all_pages_{i}.pdf")).get_fields()
+        for file_name in [f"template_{i}.pdf", f"template_incremental_{i}.pdf",
+                          f"template_update_{i}_full.pdf"]:
+            path = os.path.join(output_dir, file_name)
+            fields = PdfReader(path).get_fields()
+            mismatches += sum(value(all_pages[name]) != value(fields[name]) for name in all_pages)
+            with pymupdf.open(path) as doc:
+                mismatches += doc.is_repaired
+    return mismatches
+
+
+def incremental_pixel_diff(output_dir, count):
+    """
+        Largest mean absolute pixel difference between an incremental output and the rewritten one.
+    """
+    worst = 0.0
+    for i in range(min(count, RENDER_FORMS)):
+        rewritten = render_form(os.path.join(output_dir, f"template_{i}.pdf"))
+        incremental = render_form(os.path.join(output_dir, f"template_incremental_{i}.pdf"))
+        for a, b in zip(rewritten, incremental):
+            worst = max(worst, float(abs(a.astype("int16") - b.astype("int16")).mean()))
+    return round(worst, 4)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark schema extraction and population on a large form.")
+    arg_parser.add_argument("--template", default=None,
+                            help="Fillable form (default: a synthetic one)")
+    arg_parser.add_argument("--fields", type=int, default=500)
+    arg_parser.add_argument("--pages", type=int, default=20)
+    arg_parser.add_argument("--blank-pages", type=int, default=2)
+    arg_parser.add_argument("--forms", type=int, default=30)
+    arg_parser.add_argument("--section-rate", type=float, default=0.3,
+                            help="Share of pages each form fills")
+    arg_parser.add_argument("--extraction-runs", type=int, default=5)
+    arg_parser.add_argument("--output", default="./output/benchmark_large_form.json")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        template_path = args.template
+        if template_path is None:
+            template_path = os.path.join(work_dir, "large_form.pdf")
+            make_large_form(template_path, args.fields, args.pages, args.blank_pages)
+
+        results = {"extraction": {}, "population": {}}
+        for mode in ["get_fields", "index"]:
+            results["extraction"][mode] = run_extraction(mode, template_path, args.extraction_runs)
+            print(f"extraction {mode}: {json.dumps(results['extraction'][mode])}")
+
+        answer_dicts = make_answer_dicts(template_path, args.forms, args.section_rate)
+        population = results["population"]
+        for mode in POPULATION_MODES:
+            population[mode] = run_population(mode, template_path, answer_dicts, work_dir)
+            print(f"population {mode}: {json.dumps(population[mode])}")
+        population["field_update_ms_per_form"] = time_field_updates(template_path, answer_dicts)
+        print(f"field updates, ms per form: {json.dumps(population['field_update_ms_per_form'])}")
+        population["value_mismatches"] = check_outputs(work_dir, answer_dicts)
+        population["flatten_pixel_diff"] = flatten_pixel_diff(work_dir, len(answer_dicts))
+        population["incremental_pixel_diff"] = incremental_pixel_diff(work_dir, len(answer_dicts))
+        print(f"population value mismatches: {population['value_mismatches']}, "
+              f"flattened vs fillable mean pixel difference: {population['flatten_pixel_diff']}, "
+              f"incremental vs rewritten: {population['incremental_pixel_diff']}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": vars(args), "results": results}, f, indent=4)
+    print(f"Report -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+# Throughput comparison of LLM backends (llm_backends.py) on the extraction prompts of the ./data
+# inputs.
+#
+#   LLAMACPP_MODEL_PATH=./models/qwen2.5-3b-instruct-q4_k_m.gguf \
+#       python benchmark_llm_backends.py --backends gemini llamacpp --requests 20 --concurrency 1 4
+#   python benchmark_llm_backends.py --backends gemini llamacpp --groups dates checkboxes
+#
+# Every backend gets the same prompts: the full-form prompt, or with --groups one prompt per listed
+# field group (utils.get_field_groups), i.e. the high-volume, low-complexity candidates for
+# on-premises extraction. --requests prompts are sent per concurrency level, with the LLM response
+# cache disabled. Per backend and level the report has requests/s, p50/p95/p99 request latency,
+# completion tokens/s, the share of responses that parse as a JSON object with every requested
+# field, and the accuracy of the returned values against compare_with_ground_truth. A local backend
+# serialises requests on its one llama.cpp context, so its throughput does not grow with
+# concurrency; the hosted one does, up to its rate limits.
+
+PERCENTILES = [50, 95, 99]
+
+
+def build_prompts(group_names):
+    """{prompt name: (prompt, requested field names)} for the ./data inputs."""
+    from extraction_patient_info import get_lab_result_text, get_other_data
+    from prompt_builder import build_extraction_prompt
+    from utils import generate_combined_string, get_field_data, get_field_groups
+
+    patient_demographic_data, soap_content = get_other_data()
+    lab_result_text = get_lab_result_text()
+    field_data_str, _, field_data_json = get_field_data()
+    if not group_names:
+        return {"form": (build_extraction_prompt(patient_demographic_data, soap_content,
+                                                 lab_result_text, field_data_str),
+                         list(field_data_json))}
+
+    groups = get_field_groups(field_data_json)
+    prompts = {}
+    for group_name in group_names:
+        if group_name not in groups:
+            raise ValueError(f"Unknown field group: {group_name} (available: {', '.join(groups)})")
+        group_str, _ = generate_combined_string(groups[group_name])
+        prompts[group_name] = (build_extraction_prompt(patient_demographic_data, soap_content,
+                                                       lab_result_text, group_str),
+                               list(groups[group_name]))
+    return prompts
+
+
+def score_response(text, field_names):
+    """(has every requested field in a JSON object, correct fields, fields with ground truth)."""
+    from extraction_patient_info import extract_json_object
+    from utils import compare_with_ground_truth
+
+    try:
+        output = extract_json_object(text)
+    except ValueError:
+        return False, 0, 0
+    if not isinstance(output, dict):
+        return False, 0, 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = compare_with_ground_truth(output)
+    # Requested fields with a ground truth value; a requested field missing from the output counts
+    # as wrong
+    ground_truth_fields = (set(scores["correct_fields"]) | set(scores["missing_fields"]) |
+                           {f["field"] for f in scores["incorrect_fields"]})
+    scored_fields = set(field_names) & ground_truth_fields
+    correct = len(scored_fields & set(scores["correct_fields"]))
+    return all(field_name in output for field_name in field_names), correct, len(scored_fields)
+
+
+async def run_level(llm, prompts, request_count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    prompt_list = list(prompts.values())
+    latencies = []
+    completion_tokens = 0
+    valid = correct = scored = failed = 0
+
+    async def one_request(i):
+        nonlocal completion_tokens, valid, correct, scored, failed
+        prompt, field_names = prompt_list[i % len(prompt_list)]
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                out = await llm.acomplete(prompt)
+            except Exception:
+                failed += 1
+                return
+            latencies.append(time.perf_counter() - start_time)
+        usage = out.additional_kwargs or {}
+        completion_tokens += usage.get("completion_tokens") or 0
+        is_valid, n_correct, n_scored = score_response(out.text, field_names)
+        valid += is_valid
+        correct += n_correct
+        scored += n_scored
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(request_count)))
+    elapsed = time.perf_counter() - start_time
+    succeeded = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": request_count,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(succeeded / elapsed, 3) if elapsed else None,
+        "latency_s": {f"p{q}": round(float(np.percentile(latencies, q)), 3) for q in PERCENTILES}
+        if latencies else None,
+        "completion_tokens_per_s": round(completion_tokens / elapsed, 1) if elapsed else None,
+        "json_valid_rate": round(valid / succeeded, 4) if succeeded else None,
+        "accuracy": round(correct / scored, 4) if scored else None,
+    }
+
+
+def main():
+    from llm_backends import LLM_BACKENDS, get_llm
+
+    arg_parser = argparse.ArgumentParser(
+        description="Compare LLM backends on extraction throughput.")
+    arg_parser.add_argument("--backends", nargs="+", default=list(LLM_BACKENDS))
+    arg_parser.add_argument("--requests", type=int, default=10,
+                            help="Requests per backend and concurrency level")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    arg_parser.add_argument("--groups", nargs="*", default=None,
+                            help="Field groups to prompt for separately "
+                                 "(default: the whole form in one prompt)")
+    arg_parser.add_argument("--output", default="./output/benchmark_llm_backends.json")
+    args = arg_parser.parse_args()
+
+    # Every request must reach the backend
+    os.environ["LLM_CACHE_DISABLED"] = "1"
+    prompts = build_prompts(args.groups)
+
+    results = {}
+    for backend in args.backends:
+        llm = get_llm(backend)
+        results[backend] = {"model": getattr(llm, "model", None), "levels": []}
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(llm, prompts, args.requests, concurrency))
+            results[backend]["levels"].append(result)
+            print(f"{backend} concurrency {concurrency}: {json.dumps(result)}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": vars(args), "backends": results}, f, indent=4)
+    print(f"Report -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from fake_services import FakeGeminiServer, FakeLlamaParseServer
+
+# End-to-end load test of the batch pipeline against the local fake Gemini and LlamaParse servers
+# (fake_services.py), so throughput can be measured without network access or API quota.
+#
+#   python benchmark_pipeline.py --bundles 50 --concurrency 1 8 32
+#   python benchmark_pipeline.py --bundles 50 --concurrency 16 --gemini-latency lognormal:4,0.5 \
+#       --error-rate 0.05
+#   python benchmark_pipeline.py --gemini-url http://127.0.0.1:8701 \
+#       --llamaparse-url http://127.0.0.1:8702
+#
+# --bundles copies of the ./data inputs are run through batch_extraction.run_batch once per
+# concurrency level (max in-flight LLM requests and LlamaParse jobs). For each level the report has
+# throughput (bundles/s), p50/p95/p99 per-bundle latency, failures, per-stage seconds, peak resident
+# memory during the run and the request/error counts seen by the fake servers. The LLM and parse
+# caches are disabled unless --with-caches, since identical bundles would otherwise be served from
+# cache after the first one.
+#
+# Gemini completions are templated from --answers (an answers.json; every requested field is null
+# when it is missing) and LlamaParse returns the offline pypdf parse of the uploaded PDF; see
+# fake_services.py.
+
+PERCENTILES = [50, 95, 99]
+
+
+class MemorySampler:
+    """
+        Peak resident set size of this process while the sampler is running, polled every interval
+        seconds.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # No /proc (macOS): fall back to the lifetime peak, which is in bytes there
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self.rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self.rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self.rss_bytes())
+
+
+def load_answers(answers_path):
+    """{field name: value} from an answers.json, for templated Gemini completions."""
+    if not answers_path or not os.path.exists(answers_path):
+        return {}
+    from batch_validation import load_records
+    _, records = load_records([answers_path])
+    return {field_name: entry.get("value") if isinstance(entry, dict) else entry
+            for field_name, entry in records[0].items()}
+
+
+def make_bundles(bundle_count, data_dir, bundles_dir):
+    from batch_extraction import BUNDLE_FILES
+
+    for i in range(bundle_count):
+        bundle_dir = os.path.join(bundles_dir, f"bundle_{i:04d}")
+        os.makedirs(bundle_dir, exist_ok=True)
+        for file_name in BUNDLE_FILES.values():
+            source_path = os.path.join(data_dir, file_name)
+            try:
+                os.link(source_path, os.path.join(bundle_dir, file_name))
+            except OSError:
+                shutil.copy(source_path, os.path.join(bundle_dir, file_name))
+
+
+def diff_stats(before, after):
+    return {key: value - before.get(key, 0) for key, value in after.items()}
+
+
+def run_level(concurrency, bundles_dir, output_dir, args, servers):
+    from batch_extraction import run_batch
+
+    stats_before = {name: server.stats() for name, server in servers.items()}
+    with MemorySampler() as memory:
+        summary = asyncio.run(run_batch(bundles_dir, output_dir, max_concurrency=concurrency,
+                                        max_parse_concurrency=concurrency, default_form=args.form,
+                                        grouped=args.grouped, stream=args.stream))
+
+    latencies = [status["elapsed_s"] for status in summary["bundles"]]
+    errors = {}
+    for status in summary["bundles"]:
+        if status["status"] != "ok":
+            error_type = (status["error"] or "").split(":")[0]
+            errors[error_type] = errors.get(error_type, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "bundles": summary["bundle_count"],
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "failure_types": errors,
+        "elapsed_s": summary["elapsed_s"],
+        "bundles_per_s": summary["bundles_per_s"],
+        "latency_s": {f"p{q}": round(float(np.percentile(latencies, q)), 3) for q in PERCENTILES},
+        "latency_mean_s": round(float(np.mean(latencies)), 3),
+        "peak_rss_mb": round(memory.peak_bytes / 2 ** 20, 1),
+        "stage_seconds": summary["stage_seconds"],
+        "llm_tokens": summary["llm_tokens"],
+        "counters": summary["counters"],
+        "server_requests": {name: diff_stats(stats_before[name], server.stats())
+                            for name, server in servers.items()},
+    }
+
+
+class _ExternalServer:
+    # Stand-in for a fake server started separately with fake_services.py; its stats are
+    # not visible here
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def stats(self):
+        return {}
+
+    def stop(self):
+        pass
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Load-test the batch pipeline against fake Gemini/LlamaParse.")
+    arg_parser.add_argument("--bundles", type=int, default=20,
+                            help="Patient bundles per concurrency level")
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    arg_parser.add_argument("--data", default="./data",
+                            help="Directory with the bundle input files")
+    arg_parser.add_argument("--form", default="./data/form_fillable.pdf")
+    arg_parser.add_argument("--grouped", action="store_true",
+                            help="Fan out one LLM request per field group")
+    arg_parser.add_argument("--stream", action="store_true", help="Stream completions")
+    arg_parser.add_argument("--with-caches", action="store_true",
+                            help="Keep the LLM and parse caches enabled")
+    arg_parser.add_argument("--context-cache", action="store_true",
+                            help="Cache the static prompt prefix on the (fake) provider, "
+                                 "see context_cache.py")
+    arg_parser.add_argument("--gemini-latency", default="lognormal:2.0,0.4",
+                            help="See fake_services.parse_latency")
+    arg_parser.add_argument("--gemini-token-latency", type=float, default=0.0,
+                            help="Extra seconds per output token")
+    arg_parser.add_argument("--gemini-input-token-latency", type=float, default=0.0,
+                            help="Extra seconds per prompt token not served from a context cache")
+    arg_parser.add_argument("--llamaparse-latency", default="lognormal:3.0,0.3")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="Fraction of fake requests to fail")
+    arg_parser.add_argument("--answers", default="./output/answers.json",
+                            help="answers.json whose values fill templated Gemini completions")
+    arg_parser.add_argument("--gemini-url", default=None,
+                            help="Use an already running fake Gemini server")
+    arg_parser.add_argument("--llamaparse-url", default=None,
+                            help="Use an already running fake LlamaParse server")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default="./output/benchmark_pipeline.json")
+    args = arg_parser.parse_args()
+
+    servers = {
+        "gemini": _ExternalServer(args.gemini_url) if args.gemini_url else FakeGeminiServer(
+            answers=load_answers(args.answers), seconds_per_output_token=args.gemini_token_latency,
+            seconds_per_input_token=args.gemini_input_token_latency,
+            latency=args.gemini_latency, error_rate=args.error_rate, seed=args.seed).start(),
+        "llamaparse": (_ExternalServer(args.llamaparse_url) if args.llamaparse_url else
+                       FakeLlamaParseServer(latency=args.llamaparse_latency,
+                                            error_rate=args.error_rate, seed=args.seed).start()),
+    }
+    os.environ.update(GOOGLE_GEMINI_BASE_URL=servers["gemini"].base_url, GOOGLE_API_KEY="fake",
+                      LLAMA_CLOUD_BASE_URL=servers["llamaparse"].base_url,
+                      LLAMA_CLOUD_API_KEY="fake", LAB_PARSER_BACKEND="llamaparse")
+    if not args.with_caches:
+        os.environ.update(LLM_CACHE_DISABLED="1", PARSE_CACHE_DISABLED="1")
+    if args.context_cache:
+        os.environ["PROMPT_CONTEXT_CACHE"] = "1"
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            bundles_dir = os.path.join(work_dir, "bundles")
+            make_bundles(args.bundles, args.data, bundles_dir)
+            for concurrency in args.concurrency:
+                result = run_level(concurrency, bundles_dir,
+                                   os.path.join(work_dir, f"out_c{concurrency}"), args, servers)
+                results.append(result)
+                print(f"concurrency {concurrency}: {result['bundles_per_s']} bundles/s, "
+                      f"latency {json.dumps(result['latency_s'])}, {result['failed']} failed, "
+                      f"peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": vars(args), "levels": results}, f, indent=4)
+    print(f"Report -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
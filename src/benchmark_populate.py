@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from pypdf import PdfReader, PdfWriter
+
+from pdf_populate import build_answer_dict, TemplatePopulator
+
+# Throughput of PDF population, in filled forms per second.
+#
+#   python benchmark_populate.py --forms 200
+#
+# per_job:  the original flow - read the template, copy it into a new writer, fill, write - for
+#           every form
+# template: TemplatePopulator - parse the template once, then fill and write each answer set
+# Answer sets are variations of ./output/answers.json so every form differs from the previous one.
+
+
+def load_answer_dicts(count, answers_path, schema_path):
+    with open(answers_path, "r", encoding="utf-8") as f:
+        llm_out_answer_dict = json.load(f)
+    if isinstance(llm_out_answer_dict, str):
+        llm_out_answer_dict = json.loads(llm_out_answer_dict)
+    with open(schema_path, "r", encoding="utf-8") as f:
+        field_data_dict = json.load(f)
+
+    base = build_answer_dict(llm_out_answer_dict, field_data_dict)
+    answer_dicts = []
+    for i in range(count):
+        answer_dict = dict(base)
+        for field_name, value in base.items():
+            if isinstance(value, str) and not value.startswith("/"):
+                answer_dict[field_name] = f"{value} {i}"
+        answer_dicts.append(answer_dict)
+    return answer_dicts
+
+
+def populate_per_job(answer_dict, output_path, template_path):
+    reader = PdfReader(template_path)
+    writer = PdfWriter()
+    writer.append(reader)
+    writer.update_page_form_field_values(writer.pages[0], fields=answer_dict, auto_regenerate=False)
+    writer.write(output_path)
+
+
+def run(mode, answer_dicts, template_path, output_dir):
+    output_paths = [os.path.join(output_dir, f"{mode}_{i}.pdf") for i in range(len(answer_dicts))]
+    start_time = time.perf_counter()
+    if mode == "per_job":
+        for answer_dict, output_path in zip(answer_dicts, output_paths):
+            populate_per_job(answer_dict, output_path, template_path)
+    else:
+        TemplatePopulator(template_path).fill_many(answer_dicts, output_paths)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "forms": len(answer_dicts),
+        "elapsed_s": round(elapsed, 3),
+        "forms_per_s": round(len(answer_dicts) / elapsed, 2),
+        "mean_output_bytes": int(sum(os.path.getsize(p) for p in output_paths) / len(output_paths)),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark filled forms per second.")
+    arg_parser.add_argument("--forms", type=int, default=100)
+    arg_parser.add_argument("--template", default="./data/form_fillable.pdf")
+    arg_parser.add_argument("--answers", default="./output/answers.json")
+    arg_parser.add_argument("--schema", default="./output/schema.json")
+    arg_parser.add_argument("--modes", nargs="+", default=["per_job", "template"])
+    args = arg_parser.parse_args()
+
+    answer_dicts = load_answer_dicts(args.forms, args.answers, args.schema)
+    with tempfile.TemporaryDirectory() as output_dir:
+        for mode in args.modes:
+            print(f"{mode}: {json.dumps(run(mode, answer_dicts, args.template, output_dir))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# Import and lookup cost of postal code validation: the memory-mapped index vs pgeocode.
+#
+#   python build_postal_index.py
+#   python benchmark_postal_index.py --lookups 10000
+#
+# import: fresh interpreter, time to import data_validation and validate one address
+#         (index: mmap on first lookup; pgeocode: pandas + both Nominatim DataFrames, as the module
+#         used to do)
+# lookup: per-call latency of validate_address over random ZIP codes and FSAs
+# pgeocode numbers are reported as unavailable when its data cannot be loaded (e.g. offline).
+
+IMPORT_SNIPPETS = {
+    "index": "import data_validation; data_validation.validate_address('10001', 'NY')",
+    "pgeocode": ("import pgeocode; pgeocode.Nominatim('us'); pgeocode.Nominatim('ca'); "
+                 "import data_validation"),
+}
+
+
+def time_import(mode):
+    code = ("import time; start_time = time.perf_counter(); " + IMPORT_SNIPPETS[mode] +
+            "; print(time.perf_counter() - start_time)")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                               env=env)
+    if completed.returncode != 0:
+        return {"available": False, "error": completed.stderr.strip().splitlines()[-1]}
+    import_s = float(completed.stdout.strip().splitlines()[-1])
+    return {"available": True, "import_s": round(import_s, 4)}
+
+
+def sample_codes(count, seed=0):
+    rng = random.Random(seed)
+    letters = "ABCEGHJKLMNPRSTVXY"
+    codes = []
+    for i in range(count):
+        if i % 2:
+            codes.append((f"{rng.choice(letters)}{rng.randint(0, 9)}{rng.choice(letters)} "
+                          f"{rng.randint(0, 9)}{rng.choice(letters)}{rng.randint(0, 9)}", "ca"))
+        else:
+            codes.append((f"{rng.randint(0, 99999):05d}", "us"))
+    return codes
+
+
+def time_lookups(mode, codes):
+    import data_validation
+    import postal_index
+
+    if mode == "pgeocode":
+        # Force the fallback path
+        os.environ.pop("POSTAL_LOOKUP_FALLBACK", None)
+        postal_index._postal_index = None
+        postal_index._postal_index_loaded = True
+        try:
+            data_validation.get_nominatim("us")
+            data_validation.get_nominatim("ca")
+        except Exception as e:
+            return {"available": False, "error": repr(e)}
+    else:
+        postal_index._postal_index_loaded = False
+        if postal_index.get_postal_index() is None:
+            return {"available": False, "error": "postal index not built"}
+
+    found = 0
+    start_time = time.perf_counter()
+    for postal_code, country in codes:
+        found += data_validation.validate_address(postal_code, "ON", country)["outcome"]
+    elapsed = time.perf_counter() - start_time
+    return {
+        "available": True,
+        "lookups": len(codes),
+        "found": found,
+        "total_s": round(elapsed, 4),
+        "us_per_lookup": round(elapsed / len(codes) * 1e6, 2),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark postal code index vs pgeocode.")
+    arg_parser.add_argument("--lookups", type=int, default=10000)
+    arg_parser.add_argument("--modes", nargs="+", default=["index", "pgeocode"])
+    args = arg_parser.parse_args()
+
+    codes = sample_codes(args.lookups)
+    for mode in args.modes:
+        result = {"import": time_import(mode), "lookup": time_lookups(mode, codes)}
+        print(f"{mode}: {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Benchmark page rasterization for OCR inputs (rasterize.py) on a multi-page scan.
+#
+#   python benchmark_rasterize.py --pages 40 --dpi 300 --workers 2 4
+#   python benchmark_rasterize.py --pdf ./scans/intake.pdf --methods in_memory pool
+#
+# Methods:
+#   png_roundtrip  the ocr_experiment.py approach: render each page serially, save page-N.png,
+#                  read it back
+#   in_memory      iter_pages in-process: zero-copy pixmap arrays, serial
+#   pool           iter_pages over a process pool (shared memory, a few pages rendered ahead), per
+#                  --workers
+#   pool_all       render_pages over a process pool, every page held at once, per --workers
+# Each method runs in a fresh subprocess, so the peak resident memory of that process and of its
+# largest pool worker belong to that method alone. Every page is consumed by reading all of its
+# pixels, standing in for the layout/OCR model. Without --pdf, a scan of --pages pages is made from
+# copies of ./data/form_scanned.pdf.
+
+METHODS = ["png_roundtrip", "in_memory", "pool", "pool_all"]
+POOL_METHODS = {"pool", "pool_all"}
+
+
+def consume(image):
+    return float(image.mean())
+
+
+def run_method(method, pdf_path, dpi, gray, workers):
+    import pymupdf
+    from PIL import Image
+
+    from rasterize import RasterRequest, iter_pages, render_pages, render_pixmap
+
+    pages = 0
+    start_time = time.perf_counter()
+    if method == "png_roundtrip":
+        with tempfile.TemporaryDirectory() as work_dir, pymupdf.open(pdf_path) as doc:
+            for page in doc:
+                path = os.path.join(work_dir, f"page-{page.number}.png")
+                render_pixmap(page, RasterRequest(page.number, dpi), gray).save(path)
+                with Image.open(path) as image:
+                    consume(np.asarray(image))
+                pages += 1
+    elif method in ("in_memory", "pool"):
+        max_workers = 1 if method == "in_memory" else workers
+        for _, image in iter_pages(pdf_path, dpi=dpi, gray=gray, max_workers=max_workers):
+            consume(image)
+            pages += 1
+    elif method == "pool_all":
+        with render_pages(pdf_path, dpi=dpi, gray=gray, max_workers=workers) as rendered:
+            for image in rendered:
+                consume(image)
+                pages += 1
+    else:
+        raise ValueError(f"Unknown method: {method}")
+    elapsed = time.perf_counter() - start_time
+
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    worker_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "method": method,
+        "workers": workers if method in POOL_METHODS else 1,
+        "pages": pages,
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_worker_rss_mb": round(worker_usage.ru_maxrss / 1024, 1),
+    }
+
+
+def make_scan(pages, source_path, output_path):
+    import pymupdf
+
+    with pymupdf.open(source_path) as source, pymupdf.open() as scan:
+        while scan.page_count < pages:
+            scan.insert_pdf(source, to_page=min(source.page_count, pages - scan.page_count) - 1)
+        scan.save(output_path)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark in-memory, page-parallel rasterization.")
+    arg_parser.add_argument("--pdf", default=None,
+                            help="Multi-page scan (default: built from --source)")
+    arg_parser.add_argument("--pages", type=int, default=40)
+    arg_parser.add_argument("--source", default="./data/form_scanned.pdf")
+    arg_parser.add_argument("--dpi", type=int, default=300)
+    arg_parser.add_argument("--color", action="store_true", help="Render RGB instead of grayscale")
+    arg_parser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1])
+    arg_parser.add_argument("--output", default="./output/benchmark_rasterize.json")
+    # Internal: run one method in this process
+    arg_parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_method(args.run, args.pdf, args.dpi, not args.color, args.workers[0])))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = os.path.join(work_dir, "scan.pdf")
+            make_scan(args.pages, args.source, pdf_path)
+
+        results = []
+        for method in args.methods:
+            for workers in (args.workers if method in POOL_METHODS else [1]):
+                command = [sys.executable, os.path.abspath(__file__), "--run", method,
+                           "--pdf", pdf_path, "--dpi", str(args.dpi), "--workers", str(workers)]
+                if args.color:
+                    command.append("--color")
+                completed = subprocess.run(command, capture_output=True, text=True, check=True)
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                results.append(result)
+                print(json.dumps(result))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": vars(args), "cpu_count": os.cpu_count(), "results": results}, f,
+                  indent=4)
+    print(f"Report -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import copy
+import json
+import random
+import time
+
+from batch_validation import DATE_FIELDS, PHONE_PART_LENGTHS, AREA_CODE_FIELDS, validate_records
+from data_validation import validate_area_code, validate_dob
+
+# Records/s of validation: the per-record, per-field functions from data_validation vs the columnar
+# batch_validation.validate_records.
+#
+#   python benchmark_validation.py --records 10000
+#
+# Records are variations of ./output/answers.json (random area codes, phone parts and dates, some
+# nulls). The per-record path checks the same fields as the batch validator, minus the address, with
+# validate_area_code / validate_dob, and collects errors instead of stopping at the first one.
+
+
+def make_records(count, answers_path, seed=0):
+    with open(answers_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    if isinstance(base, str):
+        base = json.loads(base)
+
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        record = copy.deepcopy(base)
+        for field in AREA_CODE_FIELDS:
+            record[field]["value"] = f"{rng.randint(100, 999)}"
+        for field, length in PHONE_PART_LENGTHS.items():
+            record[field]["value"] = f"{rng.randint(0, 10 ** length - 1):0{length}d}"
+        for date_set in DATE_FIELDS:
+            if rng.random() < 0.3:
+                values = [None, None, None]
+            else:
+                values = [f"{rng.randint(1, 31):02d}", f"{rng.randint(1, 12):02d}",
+                          f"{rng.randint(1900, 2030)}"]
+            for field, value in zip(date_set, values):
+                record[field]["value"] = value
+        records.append(record)
+    return records
+
+
+def validate_per_record(record):
+    errors = {}
+    for field in AREA_CODE_FIELDS:
+        result = validate_area_code("1", record[field]["value"])
+        if result in ("Invalid Area Code", "Invalid Format", "Error"):
+            errors[field] = result
+    for field, length in PHONE_PART_LENGTHS.items():
+        value = record[field]["value"]
+        if not (len(value) == length and value.isdecimal()):
+            errors[field] = f"Expected {length} digits"
+    for date_set in DATE_FIELDS:
+        d, m, y = (record[field]["value"] for field in date_set)
+        if d is not None and m is not None and y is not None:
+            result = validate_dob(d, m, y)
+            if not result["valid"]:
+                errors[date_set[0][:-2]] = result["error"]
+    return errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark per-record vs batch validation.")
+    arg_parser.add_argument("--records", type=int, default=10000)
+    arg_parser.add_argument("--answers", default="./output/answers.json")
+    args = arg_parser.parse_args()
+
+    records = make_records(args.records, args.answers)
+
+    start_time = time.perf_counter()
+    for record in records:
+        validate_per_record(record)
+    per_record_s = time.perf_counter() - start_time
+
+    validate_records(records[:1])  # build the area code table outside the timed run
+    start_time = time.perf_counter()
+    validate_records(records)
+    batch_s = time.perf_counter() - start_time
+
+    for mode, elapsed in [("per_record", per_record_s), ("batch", batch_s)]:
+        result = {"records": len(records), "elapsed_s": round(elapsed, 3),
+                  "records_per_s": round(len(records) / elapsed, 1)}
+        print(f"{mode}: {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+
+import phonenumbers
+from phonenumbers import geocoder
+
+# Generates nanp_area_codes.py: NANP area code -> (country, state/province codes, geocoder
+# description).
+#
+#   python build_area_code_table.py    # re-run after upgrading phonenumbers
+#
+# Each area code is probed once with the same +1<area>5551212 number validate_area_code used to
+# build per call. The geocoder description ("Ontario", "New York, NY", "Nova Scotia/Prince Edward
+# Island", ...) is mapped to two-letter state/province codes so the area code can be cross-checked
+# against the address.
+
+US_STATES = {
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA",
+    "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE", "Florida": "FL", "Georgia": "GA",
+    "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
+    "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD", "Massachusetts": "MA",
+    "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", "Missouri": "MO", "Montana": "MT",
+    "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM",
+    "New York": "NY", "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
+    "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC",
+    "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX", "Utah": "UT", "Vermont": "VT",
+    "Virginia": "VA", "Washington": "WA", "Washington State": "WA", "West Virginia": "WV",
+    "Wisconsin": "WI", "Wyoming": "WY", "Washington D.C.": "DC", "District of Columbia": "DC",
+    "Puerto Rico": "PR", "U.S. Virgin Islands": "VI", "Guam": "GU",
+    "Northern Mariana Islands": "MP", "American Samoa": "AS",
+}
+
+CA_PROVINCES = {
+    "Alberta": "AB", "British Columbia": "BC", "British Colombia": "BC", "Manitoba": "MB",
+    "New Brunswick": "NB", "Newfoundland and Labrador": "NL", "Newfoundland": "NL",
+    "Nova Scotia": "NS", "Ontario": "ON", "Prince Edward Island": "PE", "Quebec": "QC",
+    "Saskatchewan": "SK", "Northwest Territories": "NT", "Nunavut": "NU", "Yukon": "YT",
+}
+
+SUBDIVISIONS = {**US_STATES, **CA_PROVINCES}
+
+
+def description_to_subdivisions(description):
+    """
+        ("ON",) for "Ontario", ("NY",) for "New York, NY", ("NS", "PE") for "Nova Scotia/Prince
+        Edward Island".
+    """
+    codes = []
+    for part in description.split("/"):
+        part = part.strip()
+        if part in SUBDIVISIONS:
+            codes.append(SUBDIVISIONS[part])
+        elif "," in part and len(part.rsplit(",", 1)[1].strip()) == 2:
+            codes.append(part.rsplit(",", 1)[1].strip().upper())
+    return tuple(dict.fromkeys(codes))
+
+
+def build_table():
+    table = {}
+    for area_code in range(200, 1000):
+        parsed_num = phonenumbers.parse(f"+1{area_code}5551212")
+        if not phonenumbers.is_possible_number(parsed_num):
+            continue
+        description = geocoder.description_for_number(parsed_num, "en")
+        if not description:
+            continue
+        country = phonenumbers.region_code_for_number(parsed_num)
+        table[f"{area_code:03d}"] = (country, description_to_subdivisions(description), description)
+    return table
+
+
+def render_module(table):
+    lines = [
+        f"# Generated by build_area_code_table.py from phonenumbers {phonenumbers.__version__} "
+        f"metadata. Do not edit.",
+        "# NANP area code -> (country, state/province codes, geocoder description)",
+        "",
+        "NANP_AREA_CODES = {",
+    ]
+    lines += [f"    {area_code!r}: {entry!r}," for area_code, entry in sorted(table.items())]
+    lines += ["}", ""]
+    return "\n".join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Generate the precomputed NANP area code table.")
+    arg_parser.add_argument("--output", default="./src/nanp_area_codes.py")
+    args = arg_parser.parse_args()
+
+    table = build_table()
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(render_module(table))
+    print(f"Wrote {len(table)} area codes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
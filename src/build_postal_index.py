@@ -0,0 +1,93 @@
+import argparse
+import csv
+import io
+import os
+import zipfile
+
+from postal_index import SLOT_FUNCTIONS, write_postal_index
+
+# Builds ./data/postal_index.bin from the GeoNames postal code dumps for the US and Canada.
+#
+#   python build_postal_index.py                      # files already downloaded by pgeocode
+#                                                     # (~/.cache/pgeocode)
+#   python build_postal_index.py --source ./geonames  # US.zip / CA.zip (or US.txt / CA.txt) from
+#                                                     # https://download.geonames.org/export/zip/
+#
+# Both the raw GeoNames tab-separated dumps and the CSV copies pgeocode caches are accepted. Run
+# this on a machine with network access (or with the dumps copied over) and ship the resulting file
+# to the workers.
+
+GEONAMES_COLUMNS = ["country_code", "postal_code", "place_name", "state_name", "state_code",
+                    "county_name", "county_code", "community_name", "community_code", "latitude",
+                    "longitude", "accuracy"]
+
+
+def default_source_dir():
+    return os.environ.get("PGEOCODE_DATA_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "pgeocode"))
+
+
+def open_dump(source_dir, country):
+    """Return the text of the country's dump: <COUNTRY>.txt or <COUNTRY>.zip in source_dir."""
+    txt_path = os.path.join(source_dir, country.upper() + ".txt")
+    zip_path = os.path.join(source_dir, country.upper() + ".zip")
+    if os.path.exists(txt_path):
+        with open(txt_path, "r", encoding="utf-8") as f:
+            return f.read()
+    if os.path.exists(zip_path):
+        with zipfile.ZipFile(zip_path) as archive:
+            return archive.read(country.upper() + ".txt").decode("utf-8")
+    raise FileNotFoundError(f"No {country.upper()}.txt or {country.upper()}.zip in {source_dir}")
+
+
+def read_rows(dump_text):
+    if dump_text.startswith("country_code,"):
+        # pgeocode's cached copy: CSV with a header row
+        yield from csv.DictReader(io.StringIO(dump_text))
+    else:
+        for line in dump_text.splitlines():
+            if line.strip():
+                yield dict(zip(GEONAMES_COLUMNS, line.split("\t")))
+
+
+def build_country_entries(dump_text, country):
+    """
+        {slot: (state code, place names)}; the first state code wins and place names are joined in
+        file order.
+    """
+    slot_function = SLOT_FUNCTIONS[country]
+    states = {}
+    places = {}
+    for row in read_rows(dump_text):
+        slot = slot_function(row["postal_code"])
+        state_code = (row.get("state_code") or "").strip()
+        if slot is None or not state_code:
+            continue
+        states.setdefault(slot, state_code)
+        place_name = (row.get("place_name") or "").strip()
+        if place_name and place_name not in places.setdefault(slot, []):
+            places[slot].append(place_name)
+    return {slot: (state_code, ", ".join(places.get(slot, [])))
+            for slot, state_code in states.items()}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Build the memory-mapped US/CA postal code index.")
+    arg_parser.add_argument("--source", default=default_source_dir(),
+                            help="Directory holding US/CA GeoNames dumps (.txt or .zip)")
+    arg_parser.add_argument("--output", default="./data/postal_index.bin")
+    args = arg_parser.parse_args()
+
+    entries_by_country = {}
+    for country in ["us", "ca"]:
+        entries_by_country[country] = build_country_entries(open_dump(args.source, country),
+                                                            country)
+        print(f"{country.upper()}: {len(entries_by_country[country])} postal codes")
+
+    write_postal_index(entries_by_country, args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
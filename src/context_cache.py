@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from instrumentation import count
+from prompt_builder import split_prompt
+
+# Provider-side caching of the static extraction prompt prefix.
+#
+# Extraction prompts start with prompt_builder's static prefix (rules, examples and the form's field
+# list), which is byte-identical for every patient filling the same form:
+#   implicit  Gemini 2.5+ caches repeated prompt prefixes on its own; keeping the prefix first and
+#             stable is all that is needed, and the discounted tokens show up as "cached" in the job
+#             metrics
+#   explicit  PROMPT_CONTEXT_CACHE=1 uploads each prefix once per model as a Gemini cachedContents
+#             resource (TTL PROMPT_CONTEXT_CACHE_TTL_SECONDS, default 3600) and sends only the
+#             per-patient payload, with generation_config.cached_content pointing at the cached
+#             prefix; the prefix is then neither re-sent nor re-processed, and its tokens are billed
+#             at the cached rate
+# A prefix the provider will not cache (e.g. shorter than the model's minimum cacheable size) is
+# remembered and sent inline for the next PROMPT_CONTEXT_CACHE_RETRY_SECONDS. The LLM response cache
+# stays keyed on the full prompt, so it is shared by both modes.
+
+logger = logging.getLogger(__name__)
+
+# Re-create a cache this long before it expires rather than race the expiry
+REFRESH_MARGIN_SECONDS = 60
+
+
+def _env_seconds(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def context_cache_enabled():
+    return os.environ.get("PROMPT_CONTEXT_CACHE") == "1"
+
+
+def supports_context_cache(llm):
+    # Only the hosted Gemini backend has cachedContents (see llm_backends.py)
+    return llm.class_name() == "GenAI"
+
+
+class ContextCache:
+    def __init__(self, ttl_seconds=3600, retry_seconds=600):
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        # (model, prefix) -> (cache name or None when caching failed, valid until)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cache_name(self, llm, prefix):
+        """
+            Name of a live cachedContents resource holding prefix for llm's model, created if
+            needed; or None.
+        """
+        key = (llm.model, prefix)
+        with self._lock:
+            name, valid_until = self._entries.get(key, (None, 0.0))
+            if time.time() < valid_until:
+                if name is not None:
+                    count("context_cache_reuses")
+                return name
+
+            from google.genai import types
+
+            try:
+                cached_content = llm._client.caches.create(
+                    model=llm.model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                        ttl=f"{int(self.ttl_seconds)}s",
+                        display_name="extraction-prefix",
+                    ))
+                name = cached_content.name
+                valid_until = time.time() + self.ttl_seconds - REFRESH_MARGIN_SECONDS
+                count("context_cache_creates")
+            except Exception as e:
+                logger.warning("Context caching unavailable for this prompt prefix, sending it "
+                               "inline: %s", e)
+                name, valid_until = None, time.time() + self.retry_seconds
+                count("context_cache_failures")
+            self._entries[key] = (name, valid_until)
+            return name
+
+
+_context_cache = None
+
+
+def get_context_cache():
+    global _context_cache
+    if _context_cache is None:
+        _context_cache = ContextCache(_env_seconds("PROMPT_CONTEXT_CACHE_TTL_SECONDS", 3600),
+                                      _env_seconds("PROMPT_CONTEXT_CACHE_RETRY_SECONDS", 600))
+    return _context_cache
+
+
+def request_for_prompt(llm, prompt):
+    """
+        (text to send, extra completion kwargs) for an extraction prompt. With explicit context
+        caching enabled the text is only the payload and the kwargs point the request at the cached
+        prefix; otherwise the prompt is sent as is.
+    """
+    if not context_cache_enabled() or not supports_context_cache(llm):
+        return prompt, {}
+    prefix, payload = split_prompt(prompt)
+    if prefix is None:
+        return prompt, {}
+    name = get_context_cache().cache_name(llm, prefix)
+    if name is None:
+        return prompt, {}
+    return payload, {"generation_config": {"cached_content": name}}
+
+
+async def arequest_for_prompt(llm, prompt):
+    if not context_cache_enabled() or not supports_context_cache(llm):
+        return prompt, {}
+    # Creating a cache is a blocking request; concurrent callers for the same prefix wait on the
+    # lock and reuse it
+    return await asyncio.to_thread(request_for_prompt, llm, prompt)
@@ -1,15 +1,28 @@
-import pgeocode
-import usaddress
+import re
 from datetime import date
-from dateutil.parser import parse
-from dateutil.relativedelta import relativedelta
 
-import phonenumbers
-from phonenumbers import geocoder
+from postal_index import get_postal_index, missing_index_error, pgeocode_fallback_enabled
+from nanp_area_codes import NANP_AREA_CODES
 
-# Initialize for US and Canada
-us = pgeocode.Nominatim('us')
-ca = pgeocode.Nominatim('ca')
+# d/m/y field triples of the form, validated together
+DATE_FIELDS = [("date_of_birth_d", "date_of_birth_m", "date_of_birth_y"),
+               ("date_last_d", "date_last_m", "date_last_y"),
+               ("date_return_d", "date_return_m", "date_return_y" ),
+               ("date_childbirth_d", "date_childbirth_m", "date_childbirth_y")]
+
+# Heavy dependencies (usaddress, dateutil, phonenumbers, pgeocode) are imported by the functions
+# that need them.
+# pgeocode (pandas + a network download) is only used when ./data/postal_index.bin has not been
+# built; with POSTAL_LOOKUP_FALLBACK=none a missing index raises postal_index.PostalIndexMissing
+# instead
+_nominatim = {}
+
+
+def get_nominatim(country):
+    if country not in _nominatim:
+        import pgeocode
+        _nominatim[country] = pgeocode.Nominatim(country)
+    return _nominatim[country]
 
 
 def validate_address(postal_code, state_province, country='auto'):
@@ -18,8 +31,27 @@ def validate_address(postal_code, state_province, country='auto'):
     # Auto-detect country
     if country == 'auto':
         country = 'ca' if any(c.isalpha() for c in postal_code) else 'us'
-
-    geo = us if country.lower() == 'us' else ca
+    country = 'us' if country.lower() == 'us' else 'ca'
+
+    postal_index = get_postal_index()
+    if postal_index is not None:
+        entry = postal_index.lookup(postal_code, country)
+        if entry is None:
+            return {'valid': False, 'error': 'Invalid postal code', "outcome": False}
+        expected_state, city = entry
+        return {
+            'valid': expected_state == state_province.upper(),
+            'postal_code': postal_code,
+            'expected_state': expected_state,
+            'provided_state': state_province.upper(),
+            'city': city,
+            'country': country.upper(),
+            'outcome': True
+        }
+    if not pgeocode_fallback_enabled():
+        raise missing_index_error()
+
+    geo = get_nominatim(country)
     result = geo.query_postal_code(postal_code)
 
     if result.empty or str(result['state_code']) == 'nan':
@@ -38,12 +70,37 @@ def validate_address(postal_code, state_province, country='auto'):
     }
 
 def parse_address(address_str):
+    import usaddress
+
     parts, type = usaddress.tag(address_str)
     return validate_address(parts["ZipCode"], parts["StateName"], country='auto')
 
 
+# "..., ON, K7L 3V8" / "..., NY 10001" / "..., NY, 10001-1234" at the end of an address
+ADDRESS_REGION_RE = re.compile(
+    r"\b([A-Za-z]{2})[\s,]+([A-Za-z]\d[A-Za-z]\s?\d[A-Za-z]\d|\d{5}(?:-\d{4})?)"
+    r"[\s,.]*(?:canada|usa?|united states)?"
+    r"[\s.]*$",
+    re.IGNORECASE,
+)
+
+
+def parse_address_region(address_str):
+    """
+        Return (state/province code, postal code) from the end of an address, or None if they are
+        not there.
+    """
+    match = ADDRESS_REGION_RE.search(address_str or "")
+    if match is None:
+        return None
+    return match.group(1).upper(), match.group(2).upper()
+
+
 def validate_dob(date_of_birth_d, date_of_birth_m, date_of_birth_y, min_age=0, max_age=150):
     """Validate DOB with flexible input handling."""
+    from dateutil.parser import parse
+    from dateutil.relativedelta import relativedelta
+
     try:
         # Handle string or int inputs
         dob = parse(f"{date_of_birth_y}-{date_of_birth_m}-{date_of_birth_d}").date()
@@ -65,6 +122,17 @@ def validate_dob(date_of_birth_d, date_of_birth_m, date_of_birth_y, min_age=0, m
 
 
 def validate_area_code(country_code, area_code):
+    # NANP area codes come from the precomputed table (see build_area_code_table.py): one dict probe
+    if str(country_code) == "1":
+        area_code = str(area_code).strip()
+        if len(area_code) != 3 or not area_code.isdecimal():
+            return "Invalid Format"
+        entry = NANP_AREA_CODES.get(area_code)
+        return entry[2] if entry else "Invalid Area Code"
+
+    import phonenumbers
+    from phonenumbers import geocoder
+
     # We create a dummy number using the area code
     test_number = f"+{country_code}{area_code}5551212"
     try:
@@ -77,3 +145,36 @@ def validate_area_code(country_code, area_code):
         return "Invalid Format"
     except:
         return "Error"
+
+
+def check_area_code_region(area_code, state_province):
+    """Cross-check a NANP area code against the state/province of the address."""
+    entry = NANP_AREA_CODES.get(str(area_code).strip())
+    if entry is None:
+        return {'valid': False, 'error': 'Invalid Area Code', 'outcome': False}
+
+    country, regions, description = entry
+    provided_region = state_province.strip().upper()
+    if not regions:
+        # Non-geographic or country-wide codes (e.g. Canada 600, Jamaica) cannot be checked against
+        # a region
+        return {'valid': None, 'error': f'{description} area code has no state/province',
+                'outcome': False}
+
+    return {
+        'valid': provided_region in regions,
+        'area_code': str(area_code).strip(),
+        'expected_regions': list(regions),
+        'provided_region': provided_region,
+        'location': description,
+        'country': country,
+        'outcome': True
+    }
+
+
+def check_area_code_address(area_code, address_str):
+    """check_area_code_region with the state/province taken from the end of an address."""
+    region = parse_address_region(address_str)
+    if region is None:
+        return {'valid': None, 'error': 'No state/province found in the address', 'outcome': False}
+    return check_area_code_region(area_code, region[0])
@@ -0,0 +1,161 @@
+from datetime import date
+
+from utils import generate_combined_string
+
+# Rule-based fast path for fields that come straight from the S3 demographics JSON.
+#
+# Identity/contact fields (name, phones, address, health card / contract number, date of birth) are
+# mapped onto the schema directly instead of being sent to the LLM. Each result uses the same
+# {field_spec, value, citations, reasoning, confidence} structure as the LLM output, cited to S3.
+# A field is only pre-filled when the demographics value is present and parses cleanly; anything
+# else is left for the LLM.
+
+# Demographics keys accepted for each kind of value, in order of preference.
+DEMOGRAPHICS_KEYS = {
+    "name": ["patient_name", "name", "full_name"],
+    "dob": ["dob", "date_of_birth", "birth_date"],
+    "phone_home": ["phone_home", "home_phone"],
+    "phone_mobile": ["phone_mobile", "mobile_phone", "cell_phone"],
+    "health_card": ["health_card_number", "policy_number", "contract_number"],
+    "address": ["address"],
+}
+
+PHONE_FIELDS = {
+    "phone_home": ("areacode", "phonea", "phoneb"),
+    "phone_mobile": ("areacode1", "phonea1", "phoneb1"),
+}
+DOB_FIELDS = ("date_of_birth_d", "date_of_birth_m", "date_of_birth_y")
+
+COUNTRY_REGIONS = {"canada": "CA", "ca": "CA", "united states": "US", "usa": "US", "us": "US"}
+
+DIRECT_CONFIDENCE = 0.95
+NORMALIZED_CONFIDENCE = 0.85
+
+
+def _lookup(patient_demographic_data, kind):
+    for key in DEMOGRAPHICS_KEYS[kind]:
+        value = patient_demographic_data.get(key)
+        if value not in (None, "", {}):
+            return key, value
+    return None, None
+
+
+def _field_result(field_spec, value, key, raw_value, reasoning, confidence):
+    return {
+        "field_spec": field_spec,
+        "value": value,
+        "citations": [{"source": "S3", "quote": f'"{key}": "{raw_value}"'}],
+        "reasoning": reasoning,
+        "confidence": confidence,
+    }
+
+
+def _field_spec(field_name, field_data_json):
+    # Same line the LLM is asked to echo from FIELDS TO FILL
+    _, lines = generate_combined_string({field_name: field_data_json[field_name]})
+    return lines[0]
+
+
+def _phone_region(patient_demographic_data):
+    address = patient_demographic_data.get("address")
+    if isinstance(address, dict):
+        return COUNTRY_REGIONS.get(str(address.get("country", "")).strip().lower(), "US")
+    return "US"
+
+
+def split_phone(raw_phone, region="US"):
+    """
+        Return (area code, exchange, line) for a NANP number, or None if it is not a possible
+        number.
+    """
+    import phonenumbers
+
+    try:
+        parsed = phonenumbers.parse(str(raw_phone), region)
+    except phonenumbers.NumberParseException:
+        return None
+    if parsed.country_code != 1 or not phonenumbers.is_possible_number(parsed):
+        return None
+    national = f"{parsed.national_number:010d}"
+    return national[:3], national[3:6], national[6:]
+
+
+def format_address(address):
+    if isinstance(address, str):
+        return address.strip() or None
+    parts = [address.get(key) for key in ["street", "city", "province", "postal_code"]]
+    if address.get("province") is None:
+        parts[2] = address.get("state")
+    if address.get("postal_code") is None:
+        parts[3] = address.get("zip_code") or address.get("zip")
+    parts = [str(part).strip() for part in parts if part]
+    return ", ".join(parts) if parts else None
+
+
+def extract_from_demographics(patient_demographic_data, field_data_json):
+    """
+        Return {field name: field result} for every schema field that can be filled from
+        demographics alone.
+    """
+    results = {}
+
+    def add(field_name, value, key, raw_value, reasoning, confidence):
+        if field_name in field_data_json:
+            results[field_name] = _field_result(_field_spec(field_name, field_data_json), value,
+                                                key, raw_value, reasoning, confidence)
+
+    key, name = _lookup(patient_demographic_data, "name")
+    if name is not None:
+        add("first name", str(name).strip(), key, name,
+            "Patient name taken directly from S3 demographics.", DIRECT_CONFIDENCE)
+
+    region = _phone_region(patient_demographic_data)
+    for kind, phone_fields in PHONE_FIELDS.items():
+        key, raw_phone = _lookup(patient_demographic_data, kind)
+        if raw_phone is None:
+            continue
+        phone_parts = split_phone(raw_phone, region)
+        if phone_parts is None:
+            continue
+        for field_name, part in zip(phone_fields, phone_parts):
+            add(field_name, part, key, raw_phone,
+                "Phone number from S3 demographics split into area code (3), first part (3) and "
+                "second part (4) digits.", NORMALIZED_CONFIDENCE)
+
+    key, address = _lookup(patient_demographic_data, "address")
+    if address is not None:
+        address_str = format_address(address)
+        if address_str is not None:
+            quote = address_str if isinstance(address, dict) else address
+            add("address", address_str, key, quote,
+                "Address assembled from S3 demographics (street, city, province/state, "
+                "postal code).", DIRECT_CONFIDENCE)
+
+    key, health_card = _lookup(patient_demographic_data, "health_card")
+    if health_card is not None:
+        add("contract", str(health_card).strip(), key, health_card,
+            "In Canada the policy number is the health card number; taken directly from S3 "
+            "demographics.", DIRECT_CONFIDENCE)
+
+    key, raw_dob = _lookup(patient_demographic_data, "dob")
+    if raw_dob is not None:
+        try:
+            dob = date.fromisoformat(str(raw_dob).strip())
+        except ValueError:
+            dob = None
+        if dob is not None:
+            dob_parts = [f"{dob.day:02d}", f"{dob.month:02d}", f"{dob.year:04d}"]
+            for field_name, part in zip(DOB_FIELDS, dob_parts):
+                add(field_name, part, key, raw_dob,
+                    "Date of birth from S3 demographics split into dd/mm/yyyy.",
+                    NORMALIZED_CONFIDENCE)
+
+    return results
+
+
+def split_prefilled_fields(patient_demographic_data, field_data_json):
+    """Return (prefilled field results, schema of the fields that still need the LLM)."""
+    prefilled = extract_from_demographics(patient_demographic_data, field_data_json)
+    remaining_field_data = {name: spec for name, spec in field_data_json.items()
+                            if name not in prefilled}
+    return prefilled, remaining_field_data
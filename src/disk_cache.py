@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class DiskCache:
+    """
+        Content-addressed JSON cache persisted on local disk.
+
+        Entries live in <cache_dir>/<key[:2]>/<key>.json and hold {"created": ..., "value": ...}.
+        Keys are SHA-256 digests of the parts passed to make_key, so identical inputs always hit
+        the same entry.
+
+        Eviction:
+          - ttl_seconds: entries older than this are treated as misses and deleted on read.
+          - max_entries / max_bytes: after every write, least recently used entries (by file mtime,
+            refreshed on every hit) are deleted until the cache fits.
+
+        Counters (hits, misses, writes, evictions) are per process and exposed through stats().
+    """
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, ttl_seconds=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._index = None  # path -> (last access time, size); built lazily on first write
+
+    @staticmethod
+    def make_key(*parts):
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.ttl_seconds is not None and time.time() - entry["created"] > self.ttl_seconds:
+            with self._lock:
+                self._remove(path)
+                self.misses += 1
+            return None
+
+        # Refresh the access time so LRU eviction keeps hot entries.
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and path in self._index:
+                self._index[path] = (now, self._index[path][1])
+
+        return entry["value"]
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False)
+        # Write to a temp file and rename so concurrent readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+            self._load_index()
+            self._index[path] = (time.time(), os.path.getsize(path))
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for path in list(self._index):
+                self._remove(path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                self._index[path] = (st.st_mtime, st.st_size)
+
+    def _evict(self):
+        total_bytes = sum(size for _, size in self._index.values())
+        if (self.max_entries is None or len(self._index) <= self.max_entries) and \
+                (self.max_bytes is None or total_bytes <= self.max_bytes):
+            return
+
+        for path, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+            if (self.max_entries is None or len(self._index) <= self.max_entries) and \
+                    (self.max_bytes is None or total_bytes <= self.max_bytes):
+                break
+            self._remove(path)
+            total_bytes -= size
+            self.evictions += 1
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if self._index is not None:
+            self._index.pop(path, None)
@@ -1,12 +1,20 @@
-from llama_parse import LlamaParse
-from llama_index.core import PromptTemplate
-from utils import get_field_data, compare_with_ground_truth, get_llamaindex_gemini
-from data_validation import parse_address, validate_dob, validate_area_code
+from utils import (get_field_data, compare_with_ground_truth, generate_combined_string,
+                   get_field_groups)
+from data_validation import parse_address, validate_dob, validate_area_code, DATE_FIELDS
+import asyncio
 import json
-from pydantic_defs import prompt_llm_structured
+from context_cache import arequest_for_prompt, request_for_prompt
+from llm_backends import aget_llm, get_group_backends, get_llm
+from llm_cache import (complete_with_cache, acomplete_with_cache, get_llm_response_cache,
+                       llm_cache_key)
+from parse_cache import get_parse_cache, lab_parse_cache_keys
+from lab_parsers import get_lab_parser
+from prompt_builder import build_extraction_prompt, build_pruned_prompt
+from demographics_extraction import split_prefilled_fields
+from streaming_json import IncrementalFieldParser
+from instrumentation import count, record_llm_usage, stage, track_job, write_prometheus
 import re
-
-llama_parse_api_key = ""
+import time
 
 #TODO: Add structured extraction: Structured extraction added but we encountered an error:
 # The specified schema produces a constraint that has too many states for serving.  Typical causes of this error are schemas with lots of text (for example, very long property or enum names), schemas with long array length limits (especially when nested), or schemas using complex value matchers (for example, integers or numbers with minimum/maximum bounds or strings with complex formats like date-time)'
@@ -18,107 +26,129 @@ llama_parse_api_key = ""
 
 
 def prompt_llm(patient_demographic_data, soap_content, lab_result_text, field_data):
-    template = (
-        "You are an information extraction system.\n"
-        "Use ONLY the information in the provided sources. Do NOT guess, infer, or fabricate.\n\n"
-        "However, you have a general understanding of how medical bureaucracy and insurance policy works in Canada and the United States.\n\n"
-        "For example, in Canada policy number is represented as a healthcard number.\n\n"
-        
-        
-        "FIELDS TO FILL:\n"
-        "{field_list_str}\n\n"
-
-        "SOURCES (cite these explicitly):\n"
-        "[S1] Lab result form (unstructured text):\n"
-        "{lab_result_text}\n\n"
-        "[S2] SOAP notes (unstructured text):\n"
-        "{soap_text}\n\n"
-        "[S3] Patient personal data (JSON):\n"
-        "{json_data}\n\n"
-
-        "EXTRACTION RULES:\n"
-        "0) Field spec echo (required):\n"
-        "   - For each output key, set field_spec to the EXACT matching line from FIELDS TO FILL that begins with that key.\n"
-        "   - Copy it verbatim (including checkbox options if present).\n"
-        "   - If you cannot find a matching line, set field_spec = null.\n"
-        "1) Coverage: Fill as many fields as possible. If not explicitly stated, set value = null.\n"
-        "2) Conflicts: If sources disagree, prefer S3 > S2 > S1. If still ambiguous, set null.\n"
-        "3) Formatting:\n"
-        "   - Dates: YYYY-MM-DD when available; otherwise keep partial (YYYY-MM or YYYY) as a string.\n"
-        "   - Phone: digits only. If a full phone appears, ignore separators(-), split into areacode (3 digits), first part (3 digits), second part (4 digits) when possible. Always follow the standard phone number format (3 digits - 3 digits - 4 digits)\n"
-        "   - Height/weight: keep numeric + unit if present; otherwise numeric only.\n"
-        "4) Checkbox fields:\n"
-        "   - Return the selected option exactly as listed in the field options.\n"
-        "   - If multiple selections are explicitly indicated, return a list of strings.\n"
-        "   - If selection is not explicit, return null.\n"
-        "5) Evidence requirement:\n"
-        "   - Every non-null value MUST include at least one citation with a short supporting quote/snippet.\n\n"
-
-        "OUTPUT (JSON only; no extra text):\n"
-        "Return a single JSON object keyed by the field keys. Each field maps to an object with:\n"
-        '  - "field_spec": the exact matching line from FIELDS TO FILL for this key (copy verbatim)\n'
-        '  - "value": extracted value (string/number/list) or null, this must only the answer phrase without anything else. For example, diagnosis must only be the name of diagnosis.\n'
-        '  - "citations": [] if value is null; otherwise a list of { "source": "S1|S2|S3", "quote": "..." }\n'
-        '  - "reasoning": brief explanation of how the value was chosen, including conflict resolution if applicable\n'
-        '  - "confidence": a number 0.0-1.0 with a brief justification in reasoning (e.g., direct match vs ambiguous)\n\n'
-
-        "Confidence guidance (explain briefly in reasoning):\n"
-        "- 0.90-1.00: explicit exact match in a single source (e.g., S3 JSON field or clear statement in notes); increase if corroborated across sources, if the document itself mentions any doubt, lower the confidence.\n"
-        "- 0.60-0.89: explicit but requires mild normalization (date/phone split) or clearly implied by nearby context.\n"
-        "- 0.30-0.59: weak/partial evidence, competing candidates, or incomplete value.\n"
-        "- 0.00: value is null\n\n"
-
-        "Required JSON schema example:\n"
-        "{\n"
-        '  "first name": {\n'
-        '    "field_spec": "first name: Patient First Name",\n'
-        '    "value": "John",\n'
-        '    "citations": [\n'
-        '      {"source": "S2", "quote": "Patient: John Doe"}\n'
-        "    ],\n"
-        '    "reasoning": "First name appears explicitly in S2.",\n'
-        '    "confidence": 0.85\n'
-        "  },\n"
-        '  "hand": {\n'
-        '    "field_spec": "hand: Dominant hand (options: Right, Left)",\n'
-        '    "value": "Right",\n'
-        '    "citations": [\n'
-        '      {"source": "S3", "quote": "\\"dominant_hand\\": \\"Right\\""}\n'
-        "    ],\n"
-        '    "reasoning": "Dominant hand explicitly stated in S3; checkbox option matches exactly.",\n'
-        '    "confidence": 0.95\n'
-        "  }\n"
-        "}\n"
-    )
-
-    qa_template = PromptTemplate(template)
-    messages = qa_template.format(lab_result_text=lab_result_text, soap_text=soap_content, field_list_str = field_data,
-                                  json_data = patient_demographic_data)
-
-    llm_gemini = get_llamaindex_gemini()
-
-    out = llm_gemini.complete(messages)
-    print(out)
+    with stage("prompt_build"):
+        messages = build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text,
+                                           field_data)
+
+    llm = get_llm()
+
+    # Timing, token usage and cache hits are recorded by complete_with_cache (see
+    # instrumentation.py)
+    out = complete_with_cache(llm, messages)
     output_text = out.text
     return output_text, out
 
 
+async def acomplete_extraction_prompt(messages, backend=None):
+    llm = await aget_llm(backend)
+
+    out = await acomplete_with_cache(llm, messages)
+    output_text = out.text
+    return output_text, out
+
+
+async def aprompt_llm(patient_demographic_data, soap_content, lab_result_text, field_data):
+    """Async variant of prompt_llm, used by the batch runner to keep many requests in flight."""
+    with stage("prompt_build"):
+        messages = build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text,
+                                           field_data)
+    return await acomplete_extraction_prompt(messages)
+
+
+
+def null_field_result(reason):
+    return {"field_spec": None, "value": None, "citations": [], "reasoning": reason,
+            "confidence": 0.0}
+
+
+async def aprompt_llm_grouped(patient_demographic_data, soap_content, lab_result_text,
+                              field_data_json, semaphore=None, source_cutoff=None):
+    """
+        Fan-out extraction: one concurrent request per field group (see utils.get_field_groups).
+
+        Each group prompt lists only that group's fields, so each completion is short and end-to-end
+        latency approaches that of the slowest group. Results are merged into the usual per-field
+        {field_spec, value, citations, reasoning, confidence} dict. A group whose request or JSON
+        fails only loses its own fields, which are filled with null results; failures are returned
+        in group_errors.
+
+        source_cutoff prunes each group prompt to the top-N priority sources of its fields (see
+        prompt_builder.build_pruned_prompt); prompt_report gives the per-group and total
+        input-token savings.
+        Groups listed in LLM_GROUP_BACKENDS are sent to that backend (see llm_backends.py).
+    """
+    groups = get_field_groups(field_data_json)
+    group_backends = get_group_backends()
+
+    group_prompts = {}
+    prompt_report = {"groups": {}, "prompt_tokens": 0, "full_prompt_tokens": 0, "saved_tokens": 0}
+    with stage("prompt_build"):
+        for group_name, group_fields in groups.items():
+            group_str, _ = generate_combined_string(group_fields)
+            messages, report = build_pruned_prompt(patient_demographic_data, soap_content,
+                                                   lab_result_text, group_str, list(group_fields),
+                                                   source_cutoff)
+            group_prompts[group_name] = messages
+            prompt_report["groups"][group_name] = report
+            for key in ["prompt_tokens", "full_prompt_tokens", "saved_tokens"]:
+                prompt_report[key] += report[key]
+
+    async def run_group(group_name, messages):
+        backend = group_backends.get(group_name)
+        if semaphore is None:
+            output_text, _ = await acomplete_extraction_prompt(messages, backend)
+        else:
+            async with semaphore:
+                output_text, _ = await acomplete_extraction_prompt(messages, backend)
+        return extract_json_object(output_text)
+
+    group_outputs = await asyncio.gather(*[run_group(group_name, messages)
+                                           for group_name, messages in group_prompts.items()],
+                                         return_exceptions=True)
+
+    merged = {}
+    group_errors = {}
+    for (group_name, group_fields), group_output in zip(groups.items(), group_outputs):
+        if isinstance(group_output, Exception):
+            group_errors[group_name] = f"{type(group_output).__name__}: {group_output}"
+            group_output = {}
+        for field_name in group_fields:
+            if isinstance(group_output.get(field_name), dict):
+                merged[field_name] = group_output[field_name]
+            else:
+                reason = f"Field group '{group_name}' failed" if group_name in group_errors \
+                    else "Field missing from group response"
+                merged[field_name] = null_field_result(reason)
+
+    # Keep schema order so outputs are comparable with single-request extraction
+    merged = {field_name: merged[field_name] for field_name in field_data_json}
+    return merged, group_errors, prompt_report
+
+
+def merge_field_results(field_data_json, *field_results):
+    """Merge per-field result dicts (e.g. rule-based prefill + LLM output) in schema order."""
+    merged = {}
+    for results in field_results:
+        merged.update(results)
+    return {field_name: merged[field_name] for field_name in field_data_json
+            if field_name in merged}
 
-def get_lab_result_text():
-    pdf_url = "./data/lab_result.pdf"
 
-    parser = LlamaParse(
-        api_key=llama_parse_api_key,  # can also be set in your env as LLAMA_CLOUD_API_KEY
-        result_type="markdown",  # "markdown" and "text" are available
-        num_workers=4,  # if multiple files passed, split in `num_workers` API calls
-        verbose=True,
-        language="en",
-    )
-    parsed_documents = parser.load_data(pdf_url)
+def prompt_llm_grouped(patient_demographic_data, soap_content, lab_result_text, field_data_json,
+                       source_cutoff=None):
+    return asyncio.run(aprompt_llm_grouped(patient_demographic_data, soap_content, lab_result_text,
+                                           field_data_json, source_cutoff=source_cutoff))
 
+
+# Bump whenever normalize_lab_text changes so cached normalized text is recomputed from the cached
+# raw parse.
+LAB_NORMALIZATION_VERSION = 1
+
+
+def normalize_lab_text(page_texts):
     merged_str = ''
-    for documents in parsed_documents:
-        merged_str = merged_str + "\n" + documents.text
+    for page_text in page_texts:
+        merged_str = merged_str + "\n" + page_text
     merged_str = merged_str.replace("Dr", "Doctor")
     merged_str = merged_str.replace("MD", "Medical Doctor")
     merged_str = merged_str.replace("dr", "Doctor")
@@ -126,95 +156,344 @@ def get_lab_result_text():
 
     return merged_str
 
-def get_other_data():
+
+def _lookup_lab_parse_cache(pdf_url, parser):
+    cache = get_parse_cache()
+    if cache is None:
+        return None, None, None, None
+    raw_key, normalized_key = lab_parse_cache_keys(pdf_url, parser.cache_options(),
+                                                   LAB_NORMALIZATION_VERSION)
+    normalized_text = cache.get(normalized_key)
+    raw_pages = cache.get(raw_key) if normalized_text is None else None
+    hit = normalized_text is not None or raw_pages is not None
+    count("parse_cache_hits" if hit else "parse_cache_misses")
+    return raw_key, normalized_key, raw_pages, normalized_text
+
+
+def _store_lab_parse_cache(raw_key, normalized_key, raw_pages, parsed_now):
+    normalized_text = normalize_lab_text(raw_pages)
+    cache = get_parse_cache()
+    if cache is not None:
+        if parsed_now:
+            cache.set(raw_key, raw_pages)
+        cache.set(normalized_key, normalized_text)
+    return normalized_text
+
+
+def get_lab_result_text(pdf_url="./data/lab_result.pdf", parser=None):
+    with stage("parse"):
+        parser = parser or get_lab_parser()
+        raw_key, normalized_key, raw_pages, normalized_text = _lookup_lab_parse_cache(
+            pdf_url, parser)
+        if normalized_text is not None:
+            return normalized_text
+
+        parsed_now = raw_pages is None
+        if parsed_now:
+            raw_pages = parser.parse(pdf_url)
+
+        return _store_lab_parse_cache(raw_key, normalized_key, raw_pages, parsed_now)
+
+
+async def aget_lab_result_text(pdf_url="./data/lab_result.pdf", parser=None):
+    with stage("parse"):
+        parser = parser or get_lab_parser()
+        raw_key, normalized_key, raw_pages, normalized_text = _lookup_lab_parse_cache(
+            pdf_url, parser)
+        if normalized_text is not None:
+            return normalized_text
+
+        parsed_now = raw_pages is None
+        if parsed_now:
+            raw_pages = await parser.aparse(pdf_url)
+
+        return _store_lab_parse_cache(raw_key, normalized_key, raw_pages, parsed_now)
+
+
+def get_other_data(demographics_path='./data/demographics.json', soap_path='./data/soap_notes.txt'):
     # Open the file and load the content
-    with open('./data/demographics.json', 'r') as file:
+    with open(demographics_path, 'r') as file:
         patient_demographic_data = json.load(file)
 
-    with open('./data/soap_notes.txt', 'r', encoding='utf-8') as file:
+    with open(soap_path, 'r', encoding='utf-8') as file:
         soap_content = file.read()
 
     return patient_demographic_data, soap_content
 
 
-def data_validation_check(llm_data_dict):
-    field_to_validate = ["areacode", "phonea", "phoneb", "areacode1", "phonea1", "phoneb1", "address"]
-    date_fields = [("date_of_birth_d", "date_of_birth_m", "date_of_birth_y"), ("date_last_d", "date_last_m", "date_last_y"),
-                   ("date_return_d", "date_return_m", "date_return_y" ),
-                   ("date_childbirth_d", "date_childbirth_m", "date_childbirth_y")]
-
-    for field in field_to_validate:
-        if field == "areacode":
-            value = llm_data_dict[field]['value']
-            result = validate_area_code("1", value)
-            if result == "Invalid area code" or result == "Error" or result == "Invalid Format":
-                raise ValueError(f"Invalid area code format: {value}")
-        elif field == "phonea" or field == "phonea1":
-            value = llm_data_dict[field]['value']
-            if len(value) == 3 and value.isdecimal():
-                pass
-            else:
-                raise ValueError(f"Invalid phone number format: {value}")
-        elif field == "phoneb" or field == "phoneb1":
-            value = llm_data_dict[field]['value']
-            if len(value) == 4 and value.isdecimal():
-                pass
-            else:
-                raise ValueError(f"Invalid phone number format: {value}")
-        # Address parser here did not work, more advanced address parser is needed. I skipped this part.
-        #elif field == "address":
-        #   value = llm_data_dict[field]['value']
-        #   res = parse_address(value)
-        #   if not res["outcome"]:
-        #      raise ValueError(f"Invalid address format: {value}")
-        else:
-            pass
+FIELDS_TO_VALIDATE = ["areacode", "phonea", "phoneb", "areacode1", "phonea1", "phoneb1", "address"]
+
 
-    for date_set in date_fields:
-        date_1 = llm_data_dict[date_set[0]]['value']
-        date_2 = llm_data_dict[date_set[1]]['value']
-        date_3 = llm_data_dict[date_set[2]]['value']
-        if date_1 != "null" and date_2 != "null" and date_3 != "null":
-            validate_dob(date_set[0], date_set[1], date_set[2])
+def validate_field(field, llm_data_dict):
+    if field == "areacode":
+        value = llm_data_dict[field]['value']
+        result = validate_area_code("1", value)
+        if result == "Invalid area code" or result == "Error" or result == "Invalid Format":
+            raise ValueError(f"Invalid area code format: {value}")
+    elif field == "phonea" or field == "phonea1":
+        value = llm_data_dict[field]['value']
+        if len(value) == 3 and value.isdecimal():
+            pass
         else:
+            raise ValueError(f"Invalid phone number format: {value}")
+    elif field == "phoneb" or field == "phoneb1":
+        value = llm_data_dict[field]['value']
+        if len(value) == 4 and value.isdecimal():
             pass
+        else:
+            raise ValueError(f"Invalid phone number format: {value}")
+    # Address parser here did not work, more advanced address parser is needed. I skipped this part.
+    #elif field == "address":
+    #   value = llm_data_dict[field]['value']
+    #   res = parse_address(value)
+    #   if not res["outcome"]:
+    #      raise ValueError(f"Invalid address format: {value}")
+    else:
+        pass
 
-def extract_json_object(text):
-    m = re.search(r"\{.*\}", text, flags=re.S)
-    if not m:
-        raise ValueError("No JSON object found")
-    return json.loads(m.group(0))
-
-if __name__ == "__main__":
-    structured_extraction = False
-    patient_demographic_data, soap_content = get_other_data()
-    lab_result_text = get_lab_result_text()
-    field_data_str, line_list, field_data_json = get_field_data()
-    print(field_data_str)
-
-    # Extracts and validates data using LLM; persists results
-    if not structured_extraction:
-        output_text, out = prompt_llm(patient_demographic_data, soap_content, lab_result_text, field_data_str)
-        print(output_text)
 
-        json_text = extract_json_object(output_text)
+def validate_date_set(date_set, llm_data_dict):
+    date_1 = llm_data_dict[date_set[0]]['value']
+    date_2 = llm_data_dict[date_set[1]]['value']
+    date_3 = llm_data_dict[date_set[2]]['value']
+    if date_1 != "null" and date_2 != "null" and date_3 != "null":
+        validate_dob(date_set[0], date_set[1], date_set[2])
+    else:
+        pass
 
-        with open("./output/answers.json", "w", encoding="utf-8") as f:
-            json.dump(json_text, f, indent=4, ensure_ascii=False)
 
-        out_json = json.loads(json_text)
-        data_validation_check(out_json)
-        compare_with_ground_truth(out_json)
-        assert len(out_json.keys()) == len(field_data_json.keys())
+def data_validation_check(llm_data_dict):
+    with stage("validation"):
+        for field in FIELDS_TO_VALIDATE:
+            validate_field(field, llm_data_dict)
+
+        for date_set in DATE_FIELDS:
+            validate_date_set(date_set, llm_data_dict)
+
+
+class StreamingExtraction:
+    """
+        Consumes streamed completion text, emits each field as soon as its JSON object closes and
+        validates it right away (date triples once all three parts have arrived). Validation
+        problems are collected per field instead of aborting the stream; a field whose value is not
+        a result object (e.g. null) is reported there and replaced by null_field_result before
+        on_field sees it.
+
+        metrics: time_to_first_token_s, time_to_first_field_s, total_s, fields_completed, complete
+        (complete is False when the response was cut off before the closing brace).
+    """
+
+    def __init__(self, on_field=None):
+        self.parser = IncrementalFieldParser()
+        self.on_field = on_field
+        self.fields = {}
+        self.validation_errors = {}
+        self.text_chunks = []
+        self.start_time = time.perf_counter()
+        self.metrics = {"time_to_first_token_s": None, "time_to_first_field_s": None}
+
+    def feed(self, delta):
+        if not delta:
+            return
+        if self.metrics["time_to_first_token_s"] is None:
+            self.metrics["time_to_first_token_s"] = round(time.perf_counter() - self.start_time, 4)
+        self.text_chunks.append(delta)
+
+        for field_name, field_result in self.parser.feed(delta):
+            if self.metrics["time_to_first_field_s"] is None:
+                elapsed = time.perf_counter() - self.start_time
+                self.metrics["time_to_first_field_s"] = round(elapsed, 4)
+            if not isinstance(field_result, dict):
+                # e.g. "field": null; downstream stages expect a result object for every field
+                self.validation_errors[field_name] = ("Expected a field result object, "
+                                                      f"got {field_result!r}")
+                field_result = null_field_result(
+                    "The model returned no result object for this field")
+            self.fields[field_name] = field_result
+            if field_name not in self.validation_errors:
+                self._validate(field_name)
+            if self.on_field is not None:
+                self.on_field(field_name, field_result)
+
+    def _validate(self, field_name):
+        try:
+            if field_name in FIELDS_TO_VALIDATE:
+                validate_field(field_name, self.fields)
+            for date_set in DATE_FIELDS:
+                if field_name in date_set and all(name in self.fields for name in date_set):
+                    validate_date_set(date_set, self.fields)
+        except (ValueError, TypeError, KeyError) as e:
+            self.validation_errors[field_name] = f"{type(e).__name__}: {e}"
+
+    def finish(self, stream_error=None):
+        self.metrics["total_s"] = round(time.perf_counter() - self.start_time, 4)
+        self.metrics["fields_completed"] = len(self.fields)
+        self.metrics["complete"] = self.parser.done
+        if stream_error is not None:
+            self.metrics["stream_error"] = f"{type(stream_error).__name__}: {stream_error}"
+        return self.fields, self.validation_errors, self.metrics
+
+
+def prompt_llm_streaming(patient_demographic_data, soap_content, lab_result_text, field_data,
+                         on_field=None):
+    """
+        Streaming variant of prompt_llm. Returns (fields, validation_errors, metrics); see
+        StreamingExtraction. A complete response is stored in the LLM cache, and a cached response
+        is replayed through the parser.
+    """
+    with stage("prompt_build"):
+        messages = build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text,
+                                           field_data)
+    llm = get_llm()
+    extraction = StreamingExtraction(on_field)
+
+    cache = get_llm_response_cache()
+    cache_key = llm_cache_key(llm, messages)
+    cached_text = cache.get(cache_key) if cache is not None else None
+    if cached_text is not None:
+        count("llm_cache_hits")
+        extraction.feed(cached_text)
+        return extraction.finish()
+
+    count("llm_cache_misses")
+    stream_error = None
+    chunk = None
+    with stage("llm"):
+        try:
+            text, kwargs = request_for_prompt(llm, messages)
+            for chunk in llm.stream_complete(text, **kwargs):
+                extraction.feed(chunk.delta)
+        except Exception as e:
+            stream_error = e
+    # Usage metadata is cumulative, so the last chunk carries the totals
+    record_llm_usage(chunk)
+
+    if cache is not None and stream_error is None and extraction.parser.done:
+        cache.set(cache_key, "".join(extraction.text_chunks))
+    return extraction.finish(stream_error)
+
+
+async def aprompt_llm_streaming(patient_demographic_data, soap_content, lab_result_text, field_data,
+                                on_field=None):
+    with stage("prompt_build"):
+        messages = build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text,
+                                           field_data)
+    llm = await aget_llm()
+    extraction = StreamingExtraction(on_field)
+
+    cache = get_llm_response_cache()
+    cache_key = llm_cache_key(llm, messages)
+    cached_text = cache.get(cache_key) if cache is not None else None
+    if cached_text is not None:
+        count("llm_cache_hits")
+        extraction.feed(cached_text)
+        return extraction.finish()
+
+    count("llm_cache_misses")
+    stream_error = None
+    chunk = None
+    with stage("llm"):
+        try:
+            text, kwargs = await arequest_for_prompt(llm, messages)
+            async for chunk in await llm.astream_complete(text, **kwargs):
+                extraction.feed(chunk.delta)
+        except Exception as e:
+            stream_error = e
+    record_llm_usage(chunk)
+
+    if cache is not None and stream_error is None and extraction.parser.done:
+        cache.set(cache_key, "".join(extraction.text_chunks))
+    return extraction.finish(stream_error)
 
-    else:
-        output_text = prompt_llm_structured(patient_demographic_data, soap_content, lab_result_text, field_data_str, field_data_json)
-        print(output_text)
-        data_validation_check(output_text)
-        compare_with_ground_truth(output_text)
-        assert len(output_text.keys()) == len(field_data_json.keys())
-        with open("./output/answers.json", "w", encoding="utf-8") as f:
-            json.dump(output_text, f, indent=4, ensure_ascii=False)
 
+def extract_json_object(text):
+    with stage("json"):
+        m = re.search(r"\{.*\}", text, flags=re.S)
+        if not m:
+            raise ValueError("No JSON object found")
+        return json.loads(m.group(0))
 
+if __name__ == "__main__":
+    structured_extraction = False
+    grouped_extraction = False
+    streaming_extraction = False
+    # e.g. 2 keeps each field's top two priority sources (grouped extraction only)
+    source_cutoff = None
+    # Fill S3 identity/contact/DOB fields by rule; only the rest go to the LLM
+    demographics_fast_path = True
+    # Per-stage timings, token usage and cache hits of this run: ./output/metrics.jsonl and
+    # ./output/metrics.prom
+    with track_job("single_run", "./output/metrics.jsonl"):
+        patient_demographic_data, soap_content = get_other_data()
+        lab_result_text = get_lab_result_text()
+        field_data_str, line_list, field_data_json = get_field_data()
+        print(field_data_str)
+
+        if demographics_fast_path:
+            prefilled, llm_field_data = split_prefilled_fields(patient_demographic_data,
+                                                               field_data_json)
+        else:
+            prefilled, llm_field_data = {}, field_data_json
+        llm_field_str, _ = generate_combined_string(llm_field_data)
+
+        # Extracts and validates data using LLM; persists results
+        if grouped_extraction:
+            llm_json, group_errors, prompt_report = prompt_llm_grouped(
+                patient_demographic_data, soap_content, lab_result_text, llm_field_data,
+                source_cutoff)
+            print(group_errors)
+            print(prompt_report)
+            out_json = merge_field_results(field_data_json, prefilled, llm_json)
+            with open("./output/answers.json", "w", encoding="utf-8") as f:
+                json.dump(out_json, f, indent=4, ensure_ascii=False)
+            data_validation_check(out_json)
+            compare_with_ground_truth(out_json)
+            assert len(out_json.keys()) == len(field_data_json.keys())
+
+        elif streaming_extraction:
+            llm_json, validation_errors, stream_metrics = prompt_llm_streaming(
+                patient_demographic_data, soap_content, lab_result_text, llm_field_str,
+                on_field=lambda field_name, field_result: print(field_name,
+                                                                field_result.get("value")))
+            print(validation_errors)
+            print(stream_metrics)
+            # Fields lost to a truncated response are kept as nulls so the output still covers the
+            # whole schema
+            missing = {field_name: null_field_result("Response ended before this field was "
+                                                     "completed")
+                       for field_name in llm_field_data if field_name not in llm_json}
+            out_json = merge_field_results(field_data_json, prefilled, llm_json, missing)
+            with open("./output/answers.json", "w", encoding="utf-8") as f:
+                json.dump(out_json, f, indent=4, ensure_ascii=False)
+            data_validation_check(out_json)
+            compare_with_ground_truth(out_json)
+            assert len(out_json.keys()) == len(field_data_json.keys())
+
+        elif not structured_extraction:
+            output_text, out = prompt_llm(patient_demographic_data, soap_content, lab_result_text,
+                                          llm_field_str)
+            print(output_text)
+
+            out_json = merge_field_results(field_data_json, prefilled,
+                                           extract_json_object(output_text))
+
+            with open("./output/answers.json", "w", encoding="utf-8") as f:
+                json.dump(out_json, f, indent=4, ensure_ascii=False)
+
+            data_validation_check(out_json)
+            compare_with_ground_truth(out_json)
+            assert len(out_json.keys()) == len(field_data_json.keys())
 
+        else:
+            from pydantic_defs import prompt_llm_structured
+
+            output_text = prompt_llm_structured(patient_demographic_data, soap_content,
+                                                lab_result_text, field_data_str, field_data_json)
+            print(output_text)
+            data_validation_check(output_text)
+            compare_with_ground_truth(output_text)
+            assert len(output_text.keys()) == len(field_data_json.keys())
+            with open("./output/answers.json", "w", encoding="utf-8") as f:
+                json.dump(output_text, f, indent=4, ensure_ascii=False)
+
+    write_prometheus("./output/metrics.prom")
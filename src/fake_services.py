@@ -0,0 +1,485 @@
+import argparse
+import email.parser
+import email.policy
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the two remote services the pipeline calls, speaking the same HTTP APIs as the
+# real ones:
+#   FakeGeminiServer      the Gemini API used by GoogleGenAI (get_llamaindex_gemini): models.get,
+#                         :generateContent, :streamGenerateContent (server-sent events) and
+#                         cachedContents creation (context caching, see context_cache.py)
+#   FakeLlamaParseServer  the LlamaParse API used by LlamaParse (LlamaParseBackend): upload, job
+#                         status polling and job results
+#
+# Point the clients at them through the environment variables both SDKs already read:
+#   GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:<port>    (plus GOOGLE_API_KEY=fake)
+#   LLAMA_CLOUD_BASE_URL=http://127.0.0.1:<port>      (plus LLAMA_CLOUD_API_KEY=fake and
+#                                                      LAB_PARSER_BACKEND=llamaparse)
+#
+#   python fake_services.py --gemini-port 8701 --llamaparse-port 8702 \
+#       --gemini-latency lognormal:2.0,0.4
+#
+# Each server has
+#   latency     a distribution spec (see parse_latency): per request for Gemini (spread over the
+#               chunks when streaming, plus seconds_per_output_token), per parse job for LlamaParse
+#               (the job stays PENDING that long, so the client's own polling interval is part of
+#               the measured latency)
+#   error rate  fraction of requests answered with one of error_statuses (429/503 by default), which
+#               the clients retry as they would against the real service
+#   responses   canned (the same text for every request) or templated (derived from the request):
+#                 Gemini      a JSON object with one entry per field listed under FIELDS TO FILL in
+#                             the prompt, valued from an answers dict (null otherwise)
+#                 LlamaParse  the uploaded PDF parsed with the offline pypdf parser
+#                             (lab_parsers.LocalPdfParser)
+# Request, error and token counts are kept in stats().
+
+GEMINI_FIELD_LINE_RE = re.compile(r"^• (.+?) [:,] ")
+GEMINI_MODEL_PATH_RE = re.compile(r"/models/([^/:?]+)(?::(\w+))?")
+LLAMAPARSE_JOB_PATH_RE = re.compile(r"/api/parsing/job/([^/?]+)(?:/result/(\w+))?")
+
+ERROR_STATUS_NAMES = {408: "DEADLINE_EXCEEDED", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL",
+                      503: "UNAVAILABLE"}
+
+
+def parse_latency(spec, rng=None):
+    """
+        Return a sampler (no arguments -> seconds) for a latency spec:
+          "0.5" or "fixed:0.5"      always 0.5 s
+          "uniform:0.2,1.5"         uniform between 0.2 and 1.5 s
+          "normal:1.0,0.3"          mean 1.0 s, standard deviation 0.3 s, clipped at 0
+          "lognormal:1.0,0.5"       median 1.0 s, sigma 0.5 (long right tail, like LLM latencies)
+    """
+    rng = rng or random.Random()
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(value) for value in params.split(",")]
+
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def count_tokens(text):
+    # Rough Gemini-like count (about 4 characters per token); enough for throughput and cost figures
+    return max(1, len(text) // 4)
+
+
+class _FakeServer:
+    """ThreadingHTTPServer on a daemon thread with latency sampling, error injection and stats."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="0", error_rate=0.0,
+                 error_statuses=(429, 503), seed=None):
+        self.host = host
+        self.port = port
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._sample_latency = parse_latency(latency, self._rng)
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "errors_injected": 0}
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def sample_latency(self):
+        with self._rng_lock:
+            return self._sample_latency()
+
+    def pick_error(self):
+        """An HTTP status to fail this request with, or None."""
+        with self._rng_lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    def count(self, counter, n=1):
+        with self._stats_lock:
+            self._stats[counter] = self._stats.get(counter, 0) + n
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def handler_class(self):
+        raise NotImplementedError
+
+    def start(self):
+        handler = self.handler_class()
+        handler.fake = self
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None  # set on the subclass built by handler_class()
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.fake.count("errors_injected")
+        self.send_json(status, {"error": {"code": status, "message": message,
+                                          "status": ERROR_STATUS_NAMES.get(status, "UNKNOWN")}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeminiServer(_FakeServer):
+    """
+        Fake Gemini API.
+
+        response_text: canned completion text returned for every request; when None the response is
+        templated from the prompt's FIELDS TO FILL list, with values taken from answers
+        ({field name: value}).
+        seconds_per_output_token is added to the sampled latency for every output token, and
+        seconds_per_input_token for every prompt token not served from a cachedContents resource
+        (context caches of at least min_cache_tokens tokens can be created, as with the real API).
+        models.get requests (the metadata GoogleGenAI fetches when it is built) take
+        metadata_latency, a parse_latency spec, or the same latency distribution as completions when
+        it is None.
+    """
+
+    def __init__(self, response_text=None, answers=None, seconds_per_output_token=0.0,
+                 seconds_per_input_token=0.0, min_cache_tokens=1024, stream_chunks=8,
+                 metadata_latency=None, **kwargs):
+        super().__init__(**kwargs)
+        self._stats["model_metadata_requests"] = 0
+        self._sample_metadata_latency = (parse_latency(metadata_latency, self._rng)
+                                         if metadata_latency is not None else self._sample_latency)
+        self.response_text = response_text
+        self.answers = answers or {}
+        self.seconds_per_output_token = seconds_per_output_token
+        self.seconds_per_input_token = seconds_per_input_token
+        self.min_cache_tokens = min_cache_tokens
+        self.stream_chunks = stream_chunks
+        self._cached_contents = {}  # cachedContents name -> cached prompt text
+
+    def sample_metadata_latency(self):
+        with self._rng_lock:
+            return self._sample_metadata_latency()
+
+    def render_response(self, prompt):
+        if self.response_text is not None:
+            return self.response_text
+        fields = {}
+        for line in prompt.splitlines():
+            match = GEMINI_FIELD_LINE_RE.match(line)
+            if not match:
+                continue
+            field_name = match.group(1)
+            value = self.answers.get(field_name)
+            fields[field_name] = {
+                "field_spec": line[2:],
+                "value": value,
+                "citations": [] if value is None else [{"source": "S3", "quote": str(value)}],
+                "reasoning": ("Fake Gemini server answer" if value is not None
+                              else "Not stated in the sources"),
+                "confidence": 0.95 if value is not None else 0.0,
+            }
+        return json.dumps(fields, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def contents_text(contents):
+        return "\n".join(part.get("text", "") for content in contents
+                         for part in content.get("parts", []))
+
+    def create_cached_content(self, request_json):
+        """(HTTP status, response) for a cachedContents create request."""
+        text = self.contents_text(request_json.get("contents", []))
+        token_count = count_tokens(text)
+        if token_count < self.min_cache_tokens:
+            return 400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                   "message": "Cached content is too small. "
+                                              f"total_token_count={token_count}, "
+                                              f"min_total_token_count={self.min_cache_tokens}"}}
+        name = f"cachedContents/{uuid.uuid4().hex}"
+        with self._stats_lock:
+            self._cached_contents[name] = text
+        self.count("cache_creates")
+        return 200, {"name": name, "model": request_json.get("model"),
+                     "displayName": request_json.get("displayName", ""),
+                     "usageMetadata": {"totalTokenCount": token_count}}
+
+    def generate(self, request_json):
+        prompt = self.contents_text(request_json.get("contents", []))
+        cached_text = self._cached_contents.get(request_json.get("cachedContent"), "")
+        if cached_text:
+            prompt = cached_text + "\n" + prompt
+        text = self.render_response(prompt)
+        usage = {"promptTokenCount": count_tokens(prompt),
+                 "candidatesTokenCount": count_tokens(text)}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        if cached_text:
+            usage["cachedContentTokenCount"] = count_tokens(cached_text)
+            self.count("cached_prompt_tokens", usage["cachedContentTokenCount"])
+        self.count("prompt_tokens", usage["promptTokenCount"])
+        self.count("completion_tokens", usage["candidatesTokenCount"])
+        uncached_tokens = usage["promptTokenCount"] - usage.get("cachedContentTokenCount", 0)
+        latency = (self.sample_latency() + self.seconds_per_input_token * uncached_tokens +
+                   self.seconds_per_output_token * usage["candidatesTokenCount"])
+        return text, usage, latency
+
+    def handler_class(self):
+        fake = self
+
+        class GeminiHandler(_JsonHandler):
+            def do_GET(self):
+                match = GEMINI_MODEL_PATH_RE.search(self.path)
+                if not match:
+                    self.send_json(404, {"error": {"code": 404, "status": "NOT_FOUND",
+                                                   "message": f"Not found: {self.path}"}})
+                    return
+                fake.count("model_metadata_requests")
+                time.sleep(fake.sample_metadata_latency())
+                self.send_json(200, {"name": f"models/{match.group(1)}",
+                                     "displayName": match.group(1),
+                                     "inputTokenLimit": 1048576, "outputTokenLimit": 65536,
+                                     "supportedGenerationMethods": ["generateContent",
+                                                                    "countTokens"]})
+
+            def do_POST(self):
+                match = GEMINI_MODEL_PATH_RE.search(self.path)
+                body = self.read_body()
+                if self.path.split("?")[0].endswith("/cachedContents"):
+                    self.send_json(*fake.create_cached_content(json.loads(body or b"{}")))
+                    return
+                if not match or match.group(2) not in ("generateContent", "streamGenerateContent"):
+                    self.send_json(404, {"error": {"code": 404, "status": "NOT_FOUND",
+                                                   "message": f"Not found: {self.path}"}})
+                    return
+                fake.count("requests")
+                error_status = fake.pick_error()
+                if error_status is not None:
+                    time.sleep(fake.sample_latency() / 10)
+                    self.send_error_json(error_status, "Injected error from the fake Gemini server")
+                    return
+
+                text, usage, latency = fake.generate(json.loads(body or b"{}"))
+                if match.group(2) == "generateContent":
+                    time.sleep(latency)
+                    self.send_json(200, self.candidate(text, usage, "STOP", match.group(1)))
+                else:
+                    self.stream(text, usage, latency, match.group(1))
+
+            def candidate(self, text, usage, finish_reason, model):
+                response = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                                            "index": 0}],
+                            "modelVersion": model}
+                if finish_reason:
+                    response["candidates"][0]["finishReason"] = finish_reason
+                    response["usageMetadata"] = usage
+                return response
+
+            def stream(self, text, usage, latency, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                chunk_size = max(1, -(-len(text) // fake.stream_chunks))
+                chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [""]
+                for i, chunk in enumerate(chunks):
+                    time.sleep(latency / len(chunks))
+                    last = i == len(chunks) - 1
+                    event = self.candidate(chunk, usage, "STOP" if last else None, model)
+                    self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\r\n\r\n")
+                    self.wfile.flush()
+
+        return GeminiHandler
+
+
+class FakeLlamaParseServer(_FakeServer):
+    """
+        Fake LlamaParse API.
+
+        response_text: canned markdown/text returned for every job; when None each uploaded PDF is
+        parsed with lab_parsers.LocalPdfParser and its pages are returned. Jobs finish latency
+        seconds after the upload.
+    """
+
+    def __init__(self, response_text=None, **kwargs):
+        super().__init__(**kwargs)
+        self.response_text = response_text
+        self._jobs = {}  # job id -> {"ready_at", "pages", "status"}
+        self._jobs_lock = threading.Lock()
+
+    def parse_upload(self, content_type, body):
+        if self.response_text is not None:
+            return [self.response_text]
+
+        import io
+        from pypdf import PdfReader
+        from lab_parsers import layout_text_to_markdown
+
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                reader = PdfReader(io.BytesIO(part.get_payload(decode=True)))
+                return [layout_text_to_markdown(page.extract_text(extraction_mode="layout"))
+                        for page in reader.pages]
+        raise ValueError("No file part in the upload")
+
+    def handler_class(self):
+        fake = self
+
+        class LlamaParseHandler(_JsonHandler):
+            def do_POST(self):
+                body = self.read_body()
+                if not self.path.startswith("/api/parsing/upload"):
+                    self.send_json(404, {"detail": "Not Found"})
+                    return
+                fake.count("requests")
+                error_status = fake.pick_error()
+                if error_status is not None:
+                    self.send_error_json(error_status,
+                                         "Injected error from the fake LlamaParse server")
+                    return
+                try:
+                    pages = fake.parse_upload(self.headers.get("Content-Type", ""), body)
+                except Exception as e:
+                    self.send_json(400, {"detail": f"Could not parse upload: {e}"})
+                    return
+
+                job_id = str(uuid.uuid4())
+                with fake._jobs_lock:
+                    fake._jobs[job_id] = {"ready_at": time.monotonic() + fake.sample_latency(),
+                                          "pages": pages}
+                fake.count("pages", len(pages))
+                self.send_json(200, {"id": job_id, "status": "PENDING"})
+
+            def do_GET(self):
+                match = LLAMAPARSE_JOB_PATH_RE.search(self.path)
+                with fake._jobs_lock:
+                    job = fake._jobs.get(match.group(1)) if match else None
+                if job is None:
+                    self.send_json(404, {"detail": "Job not found"})
+                    return
+                fake.count("polls")
+                ready = time.monotonic() >= job["ready_at"]
+                result_type = match.group(2)
+                if result_type is None:
+                    self.send_json(200, {"id": match.group(1),
+                                         "status": "SUCCESS" if ready else "PENDING"})
+                    return
+                if not ready:
+                    self.send_json(400, {"detail": "Job not finished"})
+                    return
+
+                separator = "\n---\n"
+                self.send_json(200, {
+                    result_type: separator.join(job["pages"]),
+                    "pages": [{"page": i + 1, "md": page, "text": page}
+                              for i, page in enumerate(job["pages"])],
+                    "job_metadata": {"job_pages": len(job["pages"])},
+                })
+
+        return LlamaParseHandler
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Run local stand-ins for the Gemini and LlamaParse APIs.")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--gemini-port", type=int, default=8701)
+    arg_parser.add_argument("--llamaparse-port", type=int, default=8702)
+    arg_parser.add_argument("--gemini-latency", default="lognormal:2.0,0.4",
+                            help="See parse_latency")
+    arg_parser.add_argument("--gemini-token-latency", type=float, default=0.0,
+                            help="Extra seconds per output token")
+    arg_parser.add_argument("--gemini-input-token-latency", type=float, default=0.0,
+                            help="Extra seconds per prompt token not served from a context cache")
+    arg_parser.add_argument("--gemini-metadata-latency", default=None,
+                            help="Latency of models.get requests (see parse_latency); "
+                                 "--gemini-latency if unset")
+    arg_parser.add_argument("--llamaparse-latency", default="lognormal:3.0,0.3",
+                            help="See parse_latency")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="Fraction of requests to fail")
+    arg_parser.add_argument("--error-statuses", type=int, nargs="+", default=[429, 503])
+    arg_parser.add_argument("--gemini-response", default=None,
+                            help="File with a canned completion text")
+    arg_parser.add_argument("--gemini-answers", default=None,
+                            help="JSON file {field name: value} for templated completions")
+    arg_parser.add_argument("--llamaparse-response", default=None,
+                            help="File with canned parse output")
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    def read_file(path):
+        if path is None:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    common = {"host": args.host, "error_rate": args.error_rate,
+              "error_statuses": args.error_statuses, "seed": args.seed}
+    gemini = FakeGeminiServer(response_text=read_file(args.gemini_response),
+                              answers=json.loads(read_file(args.gemini_answers) or "{}"),
+                              seconds_per_output_token=args.gemini_token_latency,
+                              seconds_per_input_token=args.gemini_input_token_latency,
+                              metadata_latency=args.gemini_metadata_latency, port=args.gemini_port,
+                              latency=args.gemini_latency, **common).start()
+    llamaparse = FakeLlamaParseServer(response_text=read_file(args.llamaparse_response),
+                                      port=args.llamaparse_port, latency=args.llamaparse_latency,
+                                      **common).start()
+
+    print(f"export GOOGLE_GEMINI_BASE_URL={gemini.base_url} GOOGLE_API_KEY=fake")
+    print(f"export LLAMA_CLOUD_BASE_URL={llamaparse.base_url} LLAMA_CLOUD_API_KEY=fake "
+          "LAB_PARSER_BACKEND=llamaparse")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps({"gemini": gemini.stats(), "llamaparse": llamaparse.stats()}))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gemini.stop()
+        llamaparse.stop()
+
+
+if __name__ == "__main__":
+    main()
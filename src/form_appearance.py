@@ -0,0 +1,485 @@
+import re
+from contextlib import contextmanager
+
+from pypdf.generic import (ArrayObject, BooleanObject, DecodedStreamObject, DictionaryObject,
+                           FloatObject, IndirectObject, NameObject, TextStringObject)
+
+from pdf_extraction import inherited_attribute
+
+# Appearance streams for filled form fields.
+#
+# Population writes the normal appearance (/AP /N) of every widget it fills, so a filled form
+# renders and prints as it is: viewers, flattening and print services have no appearances to
+# regenerate, and /NeedAppearances is cleared. A FormAppearances is built once per template
+# (pdf_populate.TemplatePopulator) and caches:
+#   fonts      the /DR fonts named in the widgets' /DA with their metrics (/Widths and the font
+#              descriptor; the standard Helvetica widths for base-14 fonts without /Widths), and one
+#              shared /Resources per font
+#   text       a single line aligned per /Q, comb fields one character per cell, multiline fields
+#              word-wrapped, and /DA size 0 shrunk to fit. The /MK background and border are drawn.
+#              A widget's appearance stream keeps its object number from fill to fill, so a reused
+#              template does not grow
+#   checkbox   the on/off appearances already in /AP /N are reused and only /V and /AS change. A
+#              checkbox with no appearance at all for its "on" state gets one drawn from its /MK /CA
+#              ZapfDingbats character
+# flattened() draws every visible widget's appearance into the page content and drops the widgets
+# and /AcroForm for the duration of a write, for print-only output; the template itself stays
+# fillable. set_value() and flattened() report the indirect objects they change, and shared_objects
+# lists those every filled form changes (the object holding /AcroForm, the font resources), so an
+# incremental update (pdf_incremental.py) can carry just those objects.
+
+MULTILINE_FLAG = 1 << 12
+PASSWORD_FLAG = 1 << 13
+COMB_FLAG = 1 << 24
+HIDDEN_FLAGS = (1 << 1) | (1 << 5)  # annotation /F: Hidden, NoView
+
+DEFAULT_DA = "/Helv 0 Tf 0 g"
+AUTO_FONT_SIZE_MAX = 12.0
+AUTO_FONT_SIZE_MIN = 4.0
+LEADING = 1.15
+
+# Helvetica advance widths (AFM, 1/1000 em) for codes 32-126; other codes use the average width
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+_DA_FONT = re.compile(r"/([^\s/]+)\s+([\d.]+)\s+Tf")
+
+
+class FontMetrics:
+    def __init__(self, widths, default_width=556, ascent=718, descent=-207):
+        self.widths = widths  # character code -> width in 1/1000 em
+        self.default_width = default_width
+        self.ascent = ascent
+        self.descent = descent
+
+    @classmethod
+    def from_font(cls, font):
+        base_font = str(font.get("/BaseFont", ""))
+        descriptor = font.get("/FontDescriptor")
+        descriptor = descriptor.get_object() if descriptor is not None else {}
+        ascent = float(descriptor.get("/Ascent", 718)) or 718
+        descent = float(descriptor.get("/Descent", -207))
+        if "/Widths" in font:
+            first_char = int(font.get("/FirstChar", 0))
+            widths = {first_char + i: float(w) for i, w in enumerate(font["/Widths"])}
+            return cls(widths, float(descriptor.get("/MissingWidth", 0)) or 556, ascent, descent)
+        if base_font.startswith("/Courier"):
+            return cls({}, 600, 629, -157)
+        # Base-14 font without /Widths: Helvetica's metrics (exact for Helvetica, close otherwise)
+        return cls({32 + i: w for i, w in enumerate(HELVETICA_WIDTHS)}, 556, ascent, descent)
+
+    def text_width(self, data, size):
+        widths = self.widths
+        return sum(widths.get(code, self.default_width) for code in data) * size / 1000
+
+    @property
+    def height(self):
+        return (self.ascent - self.descent) / 1000
+
+
+def encode_text(text):
+    return text.encode("cp1252", errors="replace")
+
+
+def _escape(data):
+    return (data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+            .replace(b"\r", b"\\r"))
+
+
+def _number(value):
+    return f"{value:.3f}".rstrip("0").rstrip(".") or "0"
+
+
+def _color_operator(color, stroke):
+    components = [float(c) for c in color]
+    operator = {1: "g", 3: "rg", 4: "k"}.get(len(components))
+    if operator is None:
+        return None
+    operator = operator.upper() if stroke else operator
+    return " ".join(_number(c) for c in components) + " " + operator
+
+
+def _rect_size(widget):
+    x0, y0, x1, y1 = [float(v) for v in widget["/Rect"]]
+    return abs(x1 - x0), abs(y1 - y0)
+
+
+def _wrap(metrics, text, size, width):
+    lines = []
+    for paragraph in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        line = b""
+        for word in encode_text(paragraph).split(b" "):
+            candidate = line + b" " + word if line else word
+            if line and metrics.text_width(candidate, size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+class FormAppearances:
+    def __init__(self, writer):
+        self.writer = writer
+        self.acro_form = writer.root_object["/AcroForm"].get_object()
+        self.default_da = str(self.acro_form.get("/DA", DEFAULT_DA))
+        resources = self.acro_form.get("/DR")
+        resources = resources.get_object() if resources is not None else DictionaryObject()
+        fonts = resources.get("/Font")
+        self._fonts = fonts.get_object() if fonts is not None else DictionaryObject()
+        self._metrics = {}  # font resource name -> FontMetrics
+        self._resources = {}  # font resource name -> shared /Resources reference
+        self._flatten_streams = {}  # page index -> reference of its flattened overlay stream
+        self._page_wrapper = None
+        # Every widget that is filled gets an appearance, so viewers must not regenerate them
+        self.acro_form[NameObject("/NeedAppearances")] = BooleanObject(False)
+        acro_form_ref = writer.root_object.raw_get("/AcroForm")
+        self.shared_objects = [acro_form_ref if isinstance(acro_form_ref, IndirectObject)
+                               else writer.root_object.indirect_reference]
+
+    def font(self, font_name):
+        """(FontMetrics, /Resources reference) for a /DR font resource name."""
+        if font_name not in self._metrics:
+            resource_name = f"/{font_name}"
+            font_ref = self._fonts.raw_get(resource_name) if resource_name in self._fonts else None
+            if font_ref is None:
+                # Not in /DR: fall back to the base-14 font of the same role
+                base_font = "/ZapfDingbats" if font_name == "ZaDb" else "/Helvetica"
+                font_ref = self.writer._add_object(DictionaryObject({
+                    NameObject("/Type"): NameObject("/Font"),
+                    NameObject("/Subtype"): NameObject("/Type1"),
+                    NameObject("/BaseFont"): NameObject(base_font),
+                }))
+                self.shared_objects.append(font_ref)
+            self._metrics[font_name] = FontMetrics.from_font(font_ref.get_object())
+            self._resources[font_name] = self.writer._add_object(DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject(f"/{font_name}"): font_ref}),
+            }))
+            self.shared_objects.append(self._resources[font_name])
+        return self._metrics[font_name], self._resources[font_name]
+
+    def _stream(self, content, width, height, resources):
+        stream = DecodedStreamObject()
+        stream.set_data(content.encode("latin-1") if isinstance(content, str) else content)
+        stream.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width),
+                                              FloatObject(height)]),
+        })
+        if resources is not None:
+            stream[NameObject("/Resources")] = resources
+        return stream
+
+    def _set_normal_appearance(self, widget, stream):
+        """Make stream the widget's normal appearance; returns its reference."""
+        appearance = widget.get("/AP")
+        normal_ref = None
+        if appearance is not None and "/N" in appearance:
+            normal_ref = appearance.get_object().raw_get("/N")
+        if (normal_ref is not None and hasattr(normal_ref, "idnum")
+                and normal_ref.pdf is self.writer):
+            self.writer._replace_object(normal_ref, stream)
+            return normal_ref
+        normal_ref = self.writer._add_object(stream)
+        widget[NameObject("/AP")] = DictionaryObject({NameObject("/N"): normal_ref})
+        return normal_ref
+
+    def _frame(self, widget, width, height):
+        """Background and border operators from /MK, and the border width."""
+        operators = []
+        characteristics = widget.get("/MK")
+        characteristics = characteristics.get_object() if characteristics is not None else {}
+        background = characteristics.get("/BG")
+        if background:
+            fill = _color_operator(background, stroke=False)
+            if fill:
+                operators.append(f"{fill} 0 0 {_number(width)} {_number(height)} re f")
+        border_width = 0.0
+        border = characteristics.get("/BC")
+        if border:
+            border_style = widget.get("/BS")
+            border_width = 1.0
+            if border_style is not None:
+                border_width = float(border_style.get_object().get("/W", 1))
+            stroke = _color_operator(border, stroke=True)
+            if stroke and border_width:
+                half = _number(border_width / 2)
+                inner = f"{_number(width - border_width)} {_number(height - border_width)}"
+                operators.append(f"{stroke} {_number(border_width)} w {half} {half} {inner} re S")
+        return operators, border_width
+
+    def text_appearance(self, widget, value):
+        width, height = _rect_size(widget)
+        da = str(inherited_attribute(widget, "/DA") or self.default_da)
+        match = _DA_FONT.search(da)
+        font_name, size = (match.group(1), float(match.group(2))) if match else ("Helv", 0.0)
+        color = _DA_FONT.sub("", da).strip()
+        metrics, resources = self.font(font_name)
+        flags = int(inherited_attribute(widget, "/Ff", 0))
+        quadding = int(inherited_attribute(widget, "/Q", self.acro_form.get("/Q", 0)))
+        max_length = inherited_attribute(widget, "/MaxLen")
+
+        text = "" if value is None else str(value)
+        if flags & PASSWORD_FLAG:
+            text = "*" * len(text)
+
+        operators, border_width = self._frame(widget, width, height)
+        padding = border_width + 1
+        inner_width, inner_height = max(width - 2 * padding, 0), max(height - 2 * padding, 0)
+        operators += ["/Tx BMC", "q", f"{_number(padding)} {_number(padding)} "
+                      f"{_number(inner_width)} {_number(inner_height)} re W n"]
+
+        placements = []  # (x, baseline, encoded text)
+        if text and flags & COMB_FLAG and max_length and not flags & MULTILINE_FLAG:
+            data = encode_text(text)[:int(max_length)]
+            cell = width / int(max_length)
+            if not size:
+                size = min(AUTO_FONT_SIZE_MAX, inner_height / metrics.height)
+            baseline = (height - metrics.height * size) / 2 - metrics.descent * size / 1000
+            for i in range(len(data)):
+                char = data[i:i + 1]
+                x = i * cell + (cell - metrics.text_width(char, size)) / 2
+                placements.append((x, baseline, char))
+        elif text and flags & MULTILINE_FLAG:
+            if size:
+                lines = _wrap(metrics, text, size, inner_width)
+            else:
+                size = AUTO_FONT_SIZE_MAX
+                lines = _wrap(metrics, text, size, inner_width)
+                while size > AUTO_FONT_SIZE_MIN and len(lines) * size * LEADING > inner_height:
+                    size -= 0.5
+                    lines = _wrap(metrics, text, size, inner_width)
+            baseline = height - padding - metrics.ascent * size / 1000
+            for line in lines:
+                x = self._align(metrics, line, size, quadding, width, padding)
+                placements.append((x, baseline, line))
+                baseline -= size * LEADING
+        elif text:
+            data = encode_text(text.replace("\r", " ").replace("\n", " "))
+            if not size:
+                size = min(AUTO_FONT_SIZE_MAX, inner_height / metrics.height)
+                text_width = metrics.text_width(data, size)
+                if text_width > inner_width > 0:
+                    size = max(AUTO_FONT_SIZE_MIN, size * inner_width / text_width)
+            baseline = (height - metrics.height * size) / 2 - metrics.descent * size / 1000
+            x = self._align(metrics, data, size, quadding, width, padding)
+            placements.append((x, baseline, data))
+
+        content = ("\n".join(operators) + "\n").encode("latin-1")
+        if placements:
+            content += f"BT\n/{font_name} {_number(size)} Tf {color}\n".encode("latin-1")
+            for x, baseline, data in placements:
+                position = f"1 0 0 1 {_number(x)} {_number(baseline)} Tm (".encode("latin-1")
+                content += position + _escape(data) + b") Tj\n"
+            content += b"ET\n"
+        content += b"Q\nEMC\n"
+        return self._stream(content, width, height, resources)
+
+    @staticmethod
+    def _align(metrics, data, size, quadding, width, padding):
+        if quadding == 1:
+            return (width - metrics.text_width(data, size)) / 2
+        if quadding == 2:
+            return width - padding - metrics.text_width(data, size)
+        return padding
+
+    def checkbox_on_appearance(self, widget):
+        width, height = _rect_size(widget)
+        characteristics = widget.get("/MK")
+        characteristics = characteristics.get_object() if characteristics is not None else {}
+        char = str(characteristics.get("/CA", "4"))[:1] or "4"
+        _, resources = self.font("ZaDb")
+        size = min(width, height) * 0.8
+        x, y = _number((width - size * 0.75) / 2), _number((height - size * 0.7) / 2)
+        content = f"q BT /ZaDb {_number(size)} Tf 0 g 1 0 0 1 {x} {y} Tm ({char}) Tj ET Q\n"
+        return self._stream(content, width, height, resources)
+
+    def set_text(self, entry, value):
+        entry.field[NameObject("/V")] = TextStringObject("" if value is None else str(value))
+        changed = [entry.field.indirect_reference]
+        for _, widget in entry.widgets:
+            changed += [widget.indirect_reference,
+                        self._set_normal_appearance(widget, self.text_appearance(widget, value))]
+        return changed
+
+    def set_checkbox(self, entry, value):
+        state = str(value) if value else "/Off"
+        state = state if state.startswith("/") else "/" + state
+
+        def states(widget):
+            appearance = widget.get("/AP")
+            normal = appearance.get_object().get("/N") if appearance is not None else None
+            normal = normal.get_object() if normal is not None else None
+            if isinstance(normal, DictionaryObject) and "/Subtype" not in normal:
+                return normal
+            return None
+
+        changed = [entry.field.indirect_reference]
+        changed += [widget.indirect_reference for _, widget in entry.widgets]
+        if state != "/Off" and not any(state in (states(widget) or {})
+                                       for _, widget in entry.widgets):
+            if len(entry.widgets) == 1:
+                # A lone checkbox has a single "on" state: use it whatever the value calls it
+                on_states = [name for name in (states(entry.widgets[0][1]) or {}) if name != "/Off"]
+                if on_states:
+                    state = on_states[0]
+                else:
+                    widget = entry.widgets[0][1]
+                    if states(widget) is None:
+                        widget[NameObject("/AP")] = DictionaryObject(
+                            {NameObject("/N"): DictionaryObject()})
+                    on_ref = self.writer._add_object(self.checkbox_on_appearance(widget))
+                    states(widget)[NameObject(state)] = on_ref
+                    # The state dictionary may be an object of its own, or sit in one under /AP
+                    changed += [on_ref] + [ref for ref in (widget.raw_get("/AP"),
+                                                           widget["/AP"].get_object().raw_get("/N"))
+                                           if isinstance(ref, IndirectObject)]
+
+        entry.field[NameObject("/V")] = NameObject(state)
+        for _, widget in entry.widgets:
+            widget_state = state if state in (states(widget) or {}) else "/Off"
+            widget[NameObject("/AS")] = NameObject(widget_state)
+        return changed
+
+    def set_value(self, entry, value):
+        """
+            Set a field's value and the appearance of each of its widgets; returns the indirect
+            objects changed.
+        """
+        field_type = entry.field_type
+        if field_type == "/Btn":
+            changed = self.set_checkbox(entry, value)
+        elif field_type == "/Tx":
+            changed = self.set_text(entry, value)
+        else:
+            entry.field[NameObject("/V")] = TextStringObject("" if value is None else str(value))
+            changed = [entry.field.indirect_reference]
+        return [ref for ref in changed if ref is not None]
+
+    def _widget_appearance(self, widget):
+        appearance = widget.get("/AP")
+        if appearance is None or "/N" not in appearance:
+            return None
+        normal_ref = appearance.get_object().raw_get("/N")
+        normal = normal_ref.get_object()
+        if isinstance(normal, DictionaryObject) and "/Subtype" not in normal:
+            state = str(widget.get("/AS", "/Off"))
+            normal_ref = normal.raw_get(state) if state in normal else None
+        return normal_ref
+
+    def _flatten_overlay(self, widgets):
+        """Content stream drawing the widgets' appearances, and the /XObject entries it names."""
+        commands, xobjects = [], DictionaryObject()
+        for widget in widgets:
+            if int(widget.get("/F", 0)) & HIDDEN_FLAGS or "/Rect" not in widget:
+                continue
+            appearance_ref = self._widget_appearance(widget)
+            if appearance_ref is None:
+                continue
+            appearance = appearance_ref.get_object()
+            bbox = [float(v) for v in appearance.get("/BBox", [0, 0, 1, 1])]
+            matrix = [float(v) for v in appearance.get("/Matrix", [1, 0, 0, 1, 0, 0])]
+            corners = [(bbox[0], bbox[1]), (bbox[2], bbox[1]), (bbox[0], bbox[3]),
+                       (bbox[2], bbox[3])]
+            xs = [matrix[0] * x + matrix[2] * y + matrix[4] for x, y in corners]
+            ys = [matrix[1] * x + matrix[3] * y + matrix[5] for x, y in corners]
+            x0, y0, x1, y1 = [float(v) for v in widget["/Rect"]]
+            x0, x1, y0, y1 = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+            scale_x = (x1 - x0) / (max(xs) - min(xs)) if max(xs) > min(xs) else 1.0
+            scale_y = (y1 - y0) / (max(ys) - min(ys)) if max(ys) > min(ys) else 1.0
+            name = f"/FlatAP{len(xobjects)}"
+            xobjects[NameObject(name)] = appearance_ref
+            offset_x, offset_y = x0 - min(xs) * scale_x, y0 - min(ys) * scale_y
+            commands.append(f"q {_number(scale_x)} 0 0 {_number(scale_y)} "
+                            f"{_number(offset_x)} {_number(offset_y)} cm {name} Do Q")
+        return "\n".join(commands) + "\n", xobjects
+
+    @contextmanager
+    def flattened(self):
+        """
+            Within the block, pages show their widgets' appearances as page content, with no widgets
+            or form. The block is given the indirect objects this changes (the catalog, the pages
+            and their overlay streams).
+        """
+        writer = self.writer
+        root = writer.root_object
+        if self._page_wrapper is None:
+            wrapper = DecodedStreamObject()
+            wrapper.set_data(b"q\n")
+            self._page_wrapper = writer._add_object(wrapper)
+
+        changed = [root.indirect_reference, self._page_wrapper]
+        saved = []  # (page, original /Annots, /Contents, /Resources) raw values
+        for page_index, page in enumerate(writer.pages):
+            if "/Annots" not in page:
+                continue
+            widgets, others = [], ArrayObject()
+            for annot_ref in page["/Annots"]:
+                annotation = annot_ref.get_object()
+                if annotation.get("/Subtype") == "/Widget":
+                    widgets.append(annotation)
+                else:
+                    others.append(annot_ref)
+            if not widgets:
+                continue
+            saved.append((page, page.raw_get("/Annots"),
+                          page.raw_get("/Contents") if "/Contents" in page else None,
+                          page.raw_get("/Resources") if "/Resources" in page else None))
+
+            content, xobjects = self._flatten_overlay(widgets)
+            overlay = DecodedStreamObject()
+            overlay.set_data(b"Q\n" + content.encode("latin-1"))
+            if page_index in self._flatten_streams:
+                overlay_ref = writer._replace_object(self._flatten_streams[page_index],
+                                                     overlay).indirect_reference
+            else:
+                overlay_ref = self._flatten_streams[page_index] = writer._add_object(overlay)
+            changed += [page.indirect_reference, overlay_ref]
+
+            original_contents = saved[-1][2]
+            contents = ArrayObject([self._page_wrapper])
+            if original_contents is not None:
+                if isinstance(original_contents.get_object(), ArrayObject):
+                    contents.extend(original_contents.get_object())
+                else:
+                    contents.append(original_contents)
+            contents.append(overlay_ref)
+
+            resources = DictionaryObject()
+            if saved[-1][3] is not None:
+                for key, value in saved[-1][3].get_object().items():
+                    resources[NameObject(key)] = value
+            page_xobjects = DictionaryObject()
+            if "/XObject" in resources:
+                page_xobjects.update(resources["/XObject"].get_object())
+            page_xobjects.update(xobjects)
+            resources[NameObject("/XObject")] = page_xobjects
+
+            page[NameObject("/Contents")] = contents
+            page[NameObject("/Resources")] = resources
+            if others:
+                page[NameObject("/Annots")] = others
+            else:
+                del page["/Annots"]
+
+        acro_form = root.raw_get("/AcroForm")
+        del root["/AcroForm"]
+        try:
+            yield changed
+        finally:
+            root[NameObject("/AcroForm")] = acro_form
+            for page, annots, contents, resources in saved:
+                for key, value in (("/Annots", annots), ("/Contents", contents),
+                                   ("/Resources", resources)):
+                    if value is None:
+                        page.pop(key, None)
+                    else:
+                        page[NameObject(key)] = value
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from pypdf import PdfReader
+
+from pdf_extraction import process_pdf
+from parse_cache import file_sha256
+from utils import generate_combined_string
+
+# Registry of fillable form templates.
+#
+# Each form is fingerprinted by its AcroForm field tree (qualified names, types, flags, labels,
+# widget rectangles and checkbox states), compiled once with pdf_extraction.process_pdf, and
+# stored as
+#   <registry_dir>/<fingerprint>.json
+# holding the field specs, the prompt lines from generate_combined_string, checkbox options and the
+# normalized name -> pdf_field_name mapping.
+#
+# <registry_dir>/index.json maps the SHA-256 of a form file's bytes to its fingerprint, so a known
+# file is resolved without opening it as a PDF; a re-saved copy with the same field tree resolves to
+# the same fingerprint after one field-tree walk. Loaded templates are kept in memory for the life
+# of the process. Templates written with an older TEMPLATE_FORMAT (e.g. before field specs carried
+# their page) are recompiled.
+
+TEMPLATE_FORMAT = 2
+
+
+class CompiledTemplate:
+    def __init__(self, fingerprint, field_data, prompt_lines, source=None):
+        self.fingerprint = fingerprint
+        self.field_data = field_data
+        self.prompt_lines = prompt_lines
+        self.prompt_str = '\n'.join(prompt_lines)
+        self.source = source
+        self.checkbox_options = {name: spec['checkbox_opts'] for name, spec in field_data.items()
+                                 if spec['type'] == 'checkbox'}
+        self.pdf_field_names = {name: spec['pdf_field_name'] for name, spec in field_data.items()}
+
+    def to_json(self):
+        return {
+            "format": TEMPLATE_FORMAT,
+            "fingerprint": self.fingerprint,
+            "source": self.source,
+            "field_data": self.field_data,
+            "prompt_lines": self.prompt_lines,
+            "checkbox_options": self.checkbox_options,
+            "pdf_field_names": self.pdf_field_names,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["fingerprint"], data["field_data"], data["prompt_lines"],
+                   data.get("source"))
+
+
+def _walk_field_tree(field, parent_name, inherited_type, entries):
+    field = field.get_object()
+    partial_name = field.get("/T")
+    name = parent_name if partial_name is None else (f"{parent_name}.{partial_name}" if parent_name
+                                                      else str(partial_name))
+    field_type = field.get("/FT", inherited_type)
+
+    rect = field.get("/Rect")
+    appearance_states = []
+    if "/AP" in field and "/N" in field["/AP"]:
+        normal_appearance = field["/AP"]["/N"].get_object()
+        if hasattr(normal_appearance, "keys"):
+            appearance_states = sorted(str(k) for k in normal_appearance.keys())
+
+    entries.append([
+        name,
+        str(field_type) if field_type is not None else None,
+        int(field.get("/Ff", 0)),
+        str(field.get("/TU")) if field.get("/TU") is not None else None,
+        [round(float(v), 2) for v in rect] if rect is not None else None,
+        appearance_states,
+    ])
+
+    for kid in field.get("/Kids", []):
+        _walk_field_tree(kid, name, field_type, entries)
+
+
+def fingerprint_form(reader):
+    """
+        SHA-256 over the form's AcroForm field tree; stable across re-saves that keep the same
+        fields.
+    """
+    entries = []
+    acro_form = reader.trailer["/Root"].get("/AcroForm")
+    if acro_form is not None:
+        for field in acro_form.get_object().get("/Fields", []):
+            _walk_field_tree(field, "", None, entries)
+    payload = json.dumps(sorted(entries, key=lambda e: (e[0], json.dumps(e))), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TemplateRegistry:
+    def __init__(self, registry_dir="./output/templates"):
+        self.registry_dir = registry_dir
+        self._templates = {}  # fingerprint -> CompiledTemplate
+        self._file_index = None  # file sha256 -> fingerprint
+        self._lock = threading.Lock()
+
+    def _template_path(self, fingerprint):
+        return os.path.join(self.registry_dir, fingerprint + ".json")
+
+    def _index_path(self):
+        return os.path.join(self.registry_dir, "index.json")
+
+    def _write_json(self, path, data):
+        os.makedirs(self.registry_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.registry_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load_file_index(self):
+        if self._file_index is None:
+            try:
+                with open(self._index_path(), "r", encoding="utf-8") as f:
+                    self._file_index = json.load(f)
+            except (OSError, ValueError):
+                self._file_index = {}
+        return self._file_index
+
+    def get_by_fingerprint(self, fingerprint):
+        template = self._templates.get(fingerprint)
+        if template is not None:
+            return template
+        try:
+            with open(self._template_path(fingerprint), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != TEMPLATE_FORMAT:
+            return None
+        template = CompiledTemplate.from_json(data)
+        self._templates[fingerprint] = template
+        return template
+
+    def compile(self, pdf_path, reader=None, fingerprint=None):
+        reader = reader or PdfReader(pdf_path)
+        fingerprint = fingerprint or fingerprint_form(reader)
+        field_data = process_pdf(reader)
+        # Round-trip through JSON so in-memory templates match those loaded from disk
+        # (pypdf objects -> lists)
+        field_data = json.loads(json.dumps(field_data, ensure_ascii=False))
+        _, prompt_lines = generate_combined_string(field_data)
+        template = CompiledTemplate(fingerprint, field_data, prompt_lines,
+                                    source=os.path.basename(pdf_path))
+        self._write_json(self._template_path(fingerprint), template.to_json())
+        self._templates[fingerprint] = template
+        return template
+
+    def get(self, pdf_path):
+        """
+            Return the CompiledTemplate for a fillable PDF, compiling and registering it on first
+            sight.
+        """
+        with self._lock:
+            file_hash = file_sha256(pdf_path)
+            file_index = self._load_file_index()
+
+            fingerprint = file_index.get(file_hash)
+            if fingerprint is not None:
+                template = self.get_by_fingerprint(fingerprint)
+                if template is not None:
+                    return template
+
+            reader = PdfReader(pdf_path)
+            fingerprint = fingerprint_form(reader)
+            template = self.get_by_fingerprint(fingerprint)
+            if template is None:
+                template = self.compile(pdf_path, reader=reader, fingerprint=fingerprint)
+
+            file_index[file_hash] = fingerprint
+            self._write_json(self._index_path(), file_index)
+            return template
+
+
+_template_registry = None
+
+
+def get_template_registry():
+    global _template_registry
+    if _template_registry is None:
+        _template_registry = TemplateRegistry(os.environ.get("FORM_REGISTRY_DIR",
+                                                             "./output/templates"))
+    return _template_registry
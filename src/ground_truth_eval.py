@@ -0,0 +1,348 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+# Extraction quality over a labelled corpus: ground truth keyed by bundle id, scored against the
+# batch outputs.
+#
+#   python ground_truth_eval.py ./output/batch --ground-truth ./data/ground_truth.jsonl
+#
+# Ground truth (load_ground_truth):
+#   .jsonl  one object per bundle: {"bundle_id": "...", "<field>": value, ...}
+#           (or {"bundle_id": "...", "ground_truth": {"<field>": value, ...}})
+#   .json   columnar: {"bundle_id": [...], "<field>": [...], ...}, one entry per bundle per column
+#   .csv    a bundle_id column plus one column per field; an empty cell is null
+# A field that is absent from a bundle's row is unlabelled for that bundle and not scored.
+#
+# Outputs are answers.json files (a batch output directory holds one per bundle) or JSONL files with
+# a bundle_id per line, as for batch_validation.load_records. Values are compared the way
+# utils.compare_with_ground_truth does (str, stripped, lower-cased; null only equals null), one
+# column per field across all bundles at once. A field the output does not contain counts as wrong.
+#
+# Report:
+#   fields / overall       accuracy, null hallucination rate (value given where the truth is null)
+#                          and omission rate (null given where the truth has a value)
+#   calibration            the outputs' "confidence" against correctness in CALIBRATION_BINS bins,
+#                          with the expected calibration error and Brier score
+#   worst_bundles          lowest-accuracy bundles
+#
+# Per-bundle scores are kept in a state file next to the report, keyed by a hash of the output and
+# its ground truth row, so a re-run only re-scores bundles whose output or labels changed (--full
+# ignores the saved scores).
+
+SCORING_VERSION = 1  # bump when scoring changes so saved per-bundle scores are discarded
+CALIBRATION_BINS = 10
+BUNDLE_ID_FIELD = "bundle_id"
+SCORE_COLUMNS = ["labelled", "correct", "truth_null", "pred_null"]
+
+
+def normalize_value(value):
+    """Normalize value for comparison (handles None, case, whitespace)"""
+    if value is None:
+        return None
+    return str(value).strip().lower()
+
+
+def load_ground_truth(path):
+    """{bundle id: {field: value}}"""
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return {row.pop(BUNDLE_ID_FIELD): {field: value if value != "" else None
+                                               for field, value in row.items()}
+                    for row in csv.DictReader(f)}
+
+    if path.endswith(".jsonl"):
+        ground_truth = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    bundle_id = str(row.pop(BUNDLE_ID_FIELD))
+                    ground_truth[bundle_id] = row.get("ground_truth", row)
+        return ground_truth
+
+    with open(path, "r", encoding="utf-8") as f:
+        columns = json.load(f)
+    bundle_ids = [str(bundle_id) for bundle_id in columns.pop(BUNDLE_ID_FIELD)]
+    return {bundle_id: {field: values[i] for field, values in columns.items()}
+            for i, bundle_id in enumerate(bundle_ids)}
+
+
+def _parse_answers(raw):
+    record = json.loads(raw)
+    # The single-patient pipeline writes answers.json as a JSON-encoded string
+    return json.loads(record) if isinstance(record, str) else record
+
+
+def scan_outputs(paths):
+    """{bundle id: (sha256 of the raw output, zero-argument function returning the record)}"""
+    outputs = {}
+
+    def add_file(bundle_id, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        outputs[bundle_id] = (hashlib.sha256(raw).hexdigest(), lambda: _parse_answers(raw))
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                if "answers.json" in files:
+                    add_file(os.path.relpath(root, path), os.path.join(root, "answers.json"))
+        elif path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        bundle_id = str(record.pop(BUNDLE_ID_FIELD))
+                        line_sha256 = hashlib.sha256(line.strip().encode("utf-8")).hexdigest()
+                        outputs[bundle_id] = (line_sha256, lambda record=record: record)
+        else:
+            add_file(os.path.basename(os.path.dirname(os.path.abspath(path))), path)
+    return outputs
+
+
+def bundle_digest(output_sha256, truth_row):
+    truth_json = json.dumps(truth_row, sort_keys=True, ensure_ascii=False)
+    key = f"{SCORING_VERSION}\0{output_sha256}\0{truth_json}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _prediction(record, field):
+    """(has the field, value, confidence or nan)"""
+    if field not in record:
+        return False, None, np.nan
+    entry = record[field]
+    if not isinstance(entry, dict):
+        return True, entry, np.nan
+    confidence = entry.get("confidence")
+    try:
+        confidence = float(confidence) if confidence is not None else np.nan
+    except (TypeError, ValueError):
+        confidence = np.nan
+    return True, entry.get("value"), confidence
+
+
+def score_records(truth_rows, records, fields):
+    """
+        Score len(records) outputs against their truth rows in one columnar pass.
+        Returns {"labelled", "correct", "truth_null", "pred_null": bool (records, fields) arrays,
+                 "confidence": float (records, fields) array, nan where the output has none}.
+    """
+    shape = (len(records), len(fields))
+    scores = {column: np.zeros(shape, dtype=bool) for column in SCORE_COLUMNS}
+    scores["confidence"] = np.full(shape, np.nan)
+
+    for j, field in enumerate(fields):
+        labelled = np.array([field in truth_row for truth_row in truth_rows], dtype=bool)
+        truth_values = [normalize_value(truth_row.get(field)) for truth_row in truth_rows]
+        predictions = [_prediction(record, field) for record in records]
+        pred_values = [normalize_value(value) for _, value, _ in predictions]
+        has_key = np.array([has for has, _, _ in predictions], dtype=bool)
+
+        truth_null = np.array([value is None for value in truth_values], dtype=bool)
+        pred_null = np.array([value is None for value in pred_values], dtype=bool)
+        truth_strings = np.array([value or "" for value in truth_values], dtype=str)
+        pred_strings = np.array([value or "" for value in pred_values], dtype=str)
+
+        scores["labelled"][:, j] = labelled
+        scores["correct"][:, j] = labelled & has_key & (truth_null == pred_null) & (
+                truth_null | (truth_strings == pred_strings))
+        scores["truth_null"][:, j] = labelled & truth_null
+        scores["pred_null"][:, j] = pred_null
+        scores["confidence"][:, j] = [confidence for _, _, confidence in predictions]
+    return scores
+
+
+def _rate(numerator, denominator):
+    return round(float(numerator) / float(denominator), 4) if denominator else None
+
+
+def calibration(confidence, correct, bins=CALIBRATION_BINS):
+    """Reliability table, expected calibration error and Brier score over the labelled fields."""
+    has_confidence = ~np.isnan(confidence)
+    confidence = np.clip(confidence[has_confidence], 0.0, 1.0)
+    correct = correct[has_confidence].astype(float)
+    if not len(confidence):
+        return {"fields_with_confidence": 0, "bins": [], "expected_calibration_error": None,
+                "brier_score": None}
+
+    bin_index = np.minimum((confidence * bins).astype(int), bins - 1)
+    counts = np.bincount(bin_index, minlength=bins)
+    confidence_sums = np.bincount(bin_index, weights=confidence, minlength=bins)
+    correct_sums = np.bincount(bin_index, weights=correct, minlength=bins)
+
+    table = []
+    ece = 0.0
+    for b in np.flatnonzero(counts):
+        mean_confidence = confidence_sums[b] / counts[b]
+        accuracy = correct_sums[b] / counts[b]
+        ece += counts[b] / len(confidence) * abs(accuracy - mean_confidence)
+        table.append({"range": [b / bins, (b + 1) / bins], "count": int(counts[b]),
+                      "mean_confidence": round(float(mean_confidence), 4),
+                      "accuracy": round(float(accuracy), 4)})
+    return {
+        "fields_with_confidence": int(len(confidence)),
+        "bins": table,
+        "expected_calibration_error": round(float(ece), 4),
+        "brier_score": round(float(np.mean((confidence - correct) ** 2)), 4),
+    }
+
+
+def summarize(bundle_ids, fields, scores, worst=10):
+    labelled, correct = scores["labelled"], scores["correct"]
+    truth_null, pred_null = scores["truth_null"], scores["pred_null"]
+    truth_value = labelled & ~truth_null
+    hallucinated = truth_null & ~pred_null
+    omitted = truth_value & pred_null
+
+    metrics = {
+        "accuracy": (correct, labelled),
+        "null_hallucination_rate": (hallucinated, truth_null),
+        "omission_rate": (omitted, truth_value),
+    }
+    field_sums = {metric: (numerator.sum(axis=0), denominator.sum(axis=0))
+                  for metric, (numerator, denominator) in metrics.items()}
+    labelled_per_field = labelled.sum(axis=0)
+    field_report = {}
+    for j, field in enumerate(fields):
+        field_report[field] = {"labelled": int(labelled_per_field[j])}
+        for metric, (numerators, denominators) in field_sums.items():
+            field_report[field][metric] = _rate(numerators[j], denominators[j])
+
+    overall = {"labelled_fields": int(labelled.sum())}
+    for metric, (numerator, denominator) in metrics.items():
+        overall[metric] = _rate(numerator.sum(), denominator.sum())
+
+    bundle_correct, bundle_labelled = correct.sum(axis=1), labelled.sum(axis=1)
+    bundle_accuracy = np.where(bundle_labelled > 0,
+                               bundle_correct / np.maximum(bundle_labelled, 1), np.nan)
+    order = np.argsort(np.where(np.isnan(bundle_accuracy), np.inf, bundle_accuracy),
+                       kind="stable")[:worst]
+    worst_bundles = [{"bundle_id": bundle_ids[i], "accuracy": round(float(bundle_accuracy[i]), 4),
+                      "wrong_fields": [fields[j]
+                                       for j in np.flatnonzero(labelled[i] & ~correct[i])]}
+                     for i in order if not np.isnan(bundle_accuracy[i])]
+
+    return {
+        "overall": overall,
+        "fields": field_report,
+        "calibration": calibration(scores["confidence"][labelled], correct[labelled]),
+        "worst_bundles": worst_bundles,
+    }
+
+
+def load_state(state_path, fields):
+    if not state_path or not os.path.exists(state_path):
+        return {}
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    # Scores are stored per field position, so a different field list makes them unusable
+    if state.get("scoring_version") != SCORING_VERSION or state.get("fields") != fields:
+        return {}
+    return state["bundles"]
+
+
+def save_state(state_path, fields, bundle_states):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        # json.dumps rather than json.dump: the C encoder only runs on whole-string encoding
+        f.write(json.dumps({"scoring_version": SCORING_VERSION, "fields": fields,
+                            "bundles": bundle_states}))
+    os.replace(tmp_path, state_path)
+
+
+def _bundle_state(digest, scores, i):
+    state = {"digest": digest}
+    for column in SCORE_COLUMNS:
+        state[column] = scores[column][i].astype(int).tolist()
+    state["confidence"] = [None if np.isnan(c) else float(c) for c in scores["confidence"][i]]
+    return state
+
+
+def evaluate_corpus(ground_truth, outputs, state_path=None, worst=10):
+    """
+        ground_truth: {bundle id: {field: value}} (load_ground_truth); outputs: scan_outputs()
+        result. Scores every labelled bundle with an output, re-using saved scores for unchanged
+        bundles, and returns the report.
+    """
+    fields = sorted({field for truth_row in ground_truth.values() for field in truth_row})
+    bundle_ids = sorted(bundle_id for bundle_id in ground_truth if bundle_id in outputs)
+    saved = load_state(state_path, fields)
+
+    digests = {bundle_id: bundle_digest(outputs[bundle_id][0], ground_truth[bundle_id])
+               for bundle_id in bundle_ids}
+    changed = [bundle_id for bundle_id in bundle_ids
+               if saved.get(bundle_id, {}).get("digest") != digests[bundle_id]]
+    changed_scores = score_records([ground_truth[bundle_id] for bundle_id in changed],
+                                   [outputs[bundle_id][1]() for bundle_id in changed], fields)
+
+    changed_set = set(changed)
+    bundle_states = {bundle_id: saved[bundle_id] for bundle_id in bundle_ids
+                     if bundle_id not in changed_set}
+    for i, bundle_id in enumerate(changed):
+        bundle_states[bundle_id] = _bundle_state(digests[bundle_id], changed_scores, i)
+    if state_path and (changed or len(bundle_states) != len(saved)):
+        save_state(state_path, fields, bundle_states)
+
+    scores = {column: np.array([bundle_states[bundle_id][column] for bundle_id in bundle_ids],
+                               dtype=bool).reshape(len(bundle_ids), len(fields))
+              for column in SCORE_COLUMNS}
+    scores["confidence"] = np.array([[np.nan if c is None else c
+                                      for c in bundle_states[bundle_id]["confidence"]]
+                                     for bundle_id in bundle_ids],
+                                    dtype=float).reshape(len(bundle_ids), len(fields))
+
+    report = {
+        "bundles_scored": len(bundle_ids),
+        "bundles_rescored": len(changed),
+        "bundles_reused": len(bundle_ids) - len(changed),
+        "labelled_without_output": sorted(bundle_id for bundle_id in ground_truth
+                                          if bundle_id not in outputs),
+        "outputs_without_labels": sorted(bundle_id for bundle_id in outputs
+                                         if bundle_id not in ground_truth),
+    }
+    report.update(summarize(bundle_ids, fields, scores, worst))
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Score extraction outputs against a labelled corpus.")
+    arg_parser.add_argument("outputs", nargs="+",
+                            help="answers.json files, directories holding them (e.g. batch "
+                                 "output), or JSONL files")
+    arg_parser.add_argument("--ground-truth", required=True,
+                            help="JSONL, columnar JSON or CSV keyed by bundle_id")
+    arg_parser.add_argument("--output", default="./output/ground_truth_report.json")
+    arg_parser.add_argument("--state", default=None,
+                            help="Per-bundle score state (default: <output without "
+                                 ".json>_state.json)")
+    arg_parser.add_argument("--full", action="store_true",
+                            help="Ignore saved scores and re-score every bundle")
+    arg_parser.add_argument("--worst", type=int, default=10, help="Lowest-accuracy bundles to list")
+    args = arg_parser.parse_args()
+
+    state_path = args.state or os.path.splitext(args.output)[0] + "_state.json"
+    if args.full and os.path.exists(state_path):
+        os.remove(state_path)
+
+    start_time = time.perf_counter()
+    report = evaluate_corpus(load_ground_truth(args.ground_truth), scan_outputs(args.outputs),
+                             state_path, args.worst)
+    report["elapsed_s"] = round(time.perf_counter() - start_time, 4)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"Scored {report['bundles_scored']} bundles ({report['bundles_rescored']} re-scored) in "
+          f"{report['elapsed_s']}s: {json.dumps(report['overall'])} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
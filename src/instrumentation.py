@@ -0,0 +1,338 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Lightweight per-job instrumentation.
+#
+#   with track_job("bundle_7", jsonl_path="./output/metrics.jsonl") as job:
+#       ...  # pipeline code
+#
+# While a job is open, the pipeline functions record into it through stage(), count() and
+# record_llm_usage():
+#   stages    wall time per stage (schema, parse, prompt_build, llm, json, validation, population),
+#             summed over calls, with call counts; concurrent calls (grouped extraction) each add
+#             their own time
+#   tokens    prompt / completion / total tokens from the Gemini response usage metadata; cached is
+#             the part of the prompt served from the provider's context cache (see context_cache.py)
+#   counters  llm_calls, llm_retries, llm_cache_hits/misses, parse_cache_hits/misses, and
+#             local_prompt_tokens / local_completion_tokens for local LLM backends (kept out of
+#             tokens and cost_usd)
+#   cost_usd  when LLM_PRICE_INPUT_PER_MTOK / LLM_PRICE_OUTPUT_PER_MTOK are set (USD per million
+#             tokens); cached prompt tokens use LLM_PRICE_CACHED_INPUT_PER_MTOK when it is set
+# Outside a job every call is a no-op. The current job lives in a contextvar, so concurrent asyncio
+# tasks and asyncio.to_thread workers each record into their own job.
+#
+# Finished jobs are appended to a JSONL file and aggregated in a process-wide registry, which
+# renders the Prometheus text format (render_prometheus / write_prometheus, or an HTTP endpoint via
+# serve_prometheus).
+#
+# Profiling is opt-in: PIPELINE_PROFILE=llm,population (or track_job(profile_stages=...)) wraps
+# those stages in cProfile (stats written to PIPELINE_PROFILE_DIR, default ./output/profiles) and
+# tracemalloc (peak memory recorded in the job). cProfile sees everything the thread runs while the
+# stage is open, including other asyncio tasks, and only one stage is profiled at a time.
+
+STAGES = ["schema", "parse", "prompt_build", "llm", "json", "validation", "population"]
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+_profile_lock = threading.Lock()
+_jsonl_lock = threading.Lock()
+
+
+def _env_price(name):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else None
+
+
+class JobMetrics:
+    def __init__(self, job_id, profile_stages=None, profile_dir=None):
+        self.job_id = job_id
+        self.status = "ok"
+        self.error = None
+        self.started_at = time.time()
+        self.elapsed_s = None
+        self.stages = {}  # stage -> {"seconds": float, "calls": int}
+        self.tokens = {"prompt": 0, "completion": 0, "total": 0, "cached": 0}
+        self.counters = {}
+        self.profiles = {}  # stage -> {"cprofile": path, "peak_memory_kb": int}
+        self._lock = threading.Lock()
+
+        if profile_stages is None:
+            profile_stages = [s for s in os.environ.get("PIPELINE_PROFILE", "").split(",")
+                              if s.strip()]
+        self.profile_stages = {s.strip() for s in profile_stages}
+        self.profile_dir = profile_dir or os.environ.get("PIPELINE_PROFILE_DIR",
+                                                         "./output/profiles")
+
+    def add_stage_time(self, stage_name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage_name, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def add_tokens(self, prompt_tokens, completion_tokens, total_tokens=None, cached_tokens=None):
+        with self._lock:
+            self.tokens["prompt"] += prompt_tokens or 0
+            self.tokens["completion"] += completion_tokens or 0
+            self.tokens["total"] += total_tokens or ((prompt_tokens or 0) +
+                                                     (completion_tokens or 0))
+            self.tokens["cached"] += cached_tokens or 0
+
+    def cost_usd(self):
+        input_price = _env_price("LLM_PRICE_INPUT_PER_MTOK")
+        output_price = _env_price("LLM_PRICE_OUTPUT_PER_MTOK")
+        cached_input_price = _env_price("LLM_PRICE_CACHED_INPUT_PER_MTOK")
+        if input_price is None and output_price is None:
+            return None
+        if cached_input_price is None:
+            cached_input_price = input_price
+        return round(((self.tokens["prompt"] - self.tokens["cached"]) * (input_price or 0) +
+                      self.tokens["cached"] * (cached_input_price or 0) +
+                      self.tokens["completion"] * (output_price or 0)) / 1e6, 6)
+
+    def to_json(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at,
+            "elapsed_s": self.elapsed_s,
+            "stages": {name: {"seconds": round(entry["seconds"], 4), "calls": entry["calls"]}
+                       for name, entry in self.stages.items()},
+            "tokens": dict(self.tokens),
+            "counters": dict(self.counters),
+            "cost_usd": self.cost_usd(),
+            "profiles": self.profiles,
+        }
+
+    def _start_profile(self, stage_name):
+        if stage_name not in self.profile_stages or not _profile_lock.acquire(blocking=False):
+            return None
+        import cProfile
+        import tracemalloc
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler, started_tracing
+
+    def _stop_profile(self, stage_name, profile_state):
+        import tracemalloc
+
+        profiler, started_tracing = profile_state
+        try:
+            profiler.disable()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            calls = self.stages.get(stage_name, {}).get("calls", 0)
+            stats_path = os.path.join(self.profile_dir, f"{self.job_id}_{stage_name}_{calls}.prof")
+            profiler.dump_stats(stats_path)
+            self.profiles[stage_name] = {"cprofile": stats_path, "peak_memory_kb": peak // 1024}
+        finally:
+            _profile_lock.release()
+
+
+def current_job():
+    return _current_job.get()
+
+
+@contextmanager
+def stage(stage_name):
+    """Time a pipeline stage into the current job (no-op outside a job)."""
+    job = _current_job.get()
+    if job is None:
+        yield
+        return
+    profile_state = job._start_profile(stage_name)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        job.add_stage_time(stage_name, time.perf_counter() - start_time)
+        if profile_state is not None:
+            job._stop_profile(stage_name, profile_state)
+
+
+def count(counter, n=1):
+    job = _current_job.get()
+    if job is not None:
+        job.count(counter, n)
+
+
+def record_llm_usage(response):
+    """
+        Count one LLM call and its token usage (GoogleGenAI and LlamaCppLLM put usage in
+        additional_kwargs).
+    """
+    job = _current_job.get()
+    if job is None:
+        return
+    job.count("llm_calls")
+    usage = getattr(response, "additional_kwargs", None) or {}
+    raw = getattr(response, "raw", None)
+    usage_metadata = (raw.get("usage_metadata") if isinstance(raw, dict) else None) or {}
+    if "prompt_tokens" not in usage and usage_metadata:
+        usage = {"prompt_tokens": usage_metadata.get("prompt_token_count"),
+                 "completion_tokens": usage_metadata.get("candidates_token_count"),
+                 "total_tokens": usage_metadata.get("total_token_count")}
+    if usage.get("local"):
+        # Local backends (llm_backends.py) have no per-token cost; count their tokens apart from
+        # the hosted ones
+        job.count("local_prompt_tokens", usage.get("prompt_tokens") or 0)
+        job.count("local_completion_tokens", usage.get("completion_tokens") or 0)
+    elif "prompt_tokens" in usage:
+        job.add_tokens(usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                       usage.get("total_tokens"), usage_metadata.get("cached_content_token_count"))
+
+
+class MetricsRegistry:
+    """Process-wide aggregate of finished jobs, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}  # status -> count
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.tokens = {"prompt": 0, "completion": 0, "total": 0, "cached": 0}
+        self.counters = {}
+        self.cost_usd = 0.0
+
+    def add(self, job):
+        job_json = job.to_json()
+        with self._lock:
+            self.jobs[job.status] = self.jobs.get(job.status, 0) + 1
+            for stage_name, entry in job_json["stages"].items():
+                self.stage_seconds[stage_name] = (self.stage_seconds.get(stage_name, 0.0) +
+                                                  entry["seconds"])
+                self.stage_calls[stage_name] = self.stage_calls.get(stage_name, 0) + entry["calls"]
+            for kind, n in job_json["tokens"].items():
+                self.tokens[kind] += n
+            for counter, n in job_json["counters"].items():
+                self.counters[counter] = self.counters.get(counter, 0) + n
+            self.cost_usd += job_json["cost_usd"] or 0.0
+
+    def render_prometheus(self):
+        with self._lock:
+            lines = ["# HELP pipeline_jobs_total Finished pipeline jobs by status.",
+                     "# TYPE pipeline_jobs_total counter"]
+            lines += [f'pipeline_jobs_total{{status="{status}"}} {n}'
+                      for status, n in sorted(self.jobs.items())]
+            lines += ["# HELP pipeline_stage_seconds Wall time spent per pipeline stage.",
+                      "# TYPE pipeline_stage_seconds summary"]
+            for stage_name in sorted(self.stage_seconds):
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{stage_name}"}} '
+                             f'{self.stage_seconds[stage_name]:.6f}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{stage_name}"}} '
+                             f'{self.stage_calls[stage_name]}')
+            lines += ["# HELP pipeline_llm_tokens_total LLM tokens reported by the model.",
+                      "# TYPE pipeline_llm_tokens_total counter"]
+            lines += [f'pipeline_llm_tokens_total{{kind="{kind}"}} {n}'
+                      for kind, n in self.tokens.items()]
+            for counter in sorted(self.counters):
+                lines += [f"# TYPE pipeline_{counter}_total counter",
+                          f"pipeline_{counter}_total {self.counters[counter]}"]
+            lines += [("# HELP pipeline_llm_cost_usd_total Estimated LLM cost "
+                       "(needs LLM_PRICE_* to be set)."),
+                      "# TYPE pipeline_llm_cost_usd_total counter",
+                      f"pipeline_llm_cost_usd_total {self.cost_usd:.6f}"]
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry():
+    return _registry
+
+
+def append_jsonl(path, record):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _jsonl_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+@contextmanager
+def track_job(job_id, jsonl_path=None, profile_stages=None, registry=None):
+    """
+        Open a job for the enclosed code; on exit it is added to the registry and appended to
+        jsonl_path.
+    """
+    job = JobMetrics(job_id, profile_stages)
+    token = _current_job.set(job)
+    start_time = time.perf_counter()
+    try:
+        yield job
+    except BaseException as e:
+        job.status = "failed"
+        job.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_job.reset(token)
+        job.elapsed_s = round(time.perf_counter() - start_time, 4)
+        (registry or _registry).add(job)
+        if jsonl_path:
+            append_jsonl(jsonl_path, job.to_json())
+
+
+def write_prometheus(path, registry=None):
+    """
+        Write the registry in the Prometheus text format (e.g. for the node_exporter textfile
+        collector).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write((registry or _registry).render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(port, registry=None, host="127.0.0.1"):
+    """
+        Serve GET /metrics from a daemon thread; returns the server (call shutdown() to stop it).
+        Only local clients can connect unless host opts in to a wider bind (e.g. "0.0.0.0").
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or _registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _RetryLogHandler(logging.Handler):
+    # llama-index's Gemini client retries with tenacity, which logs "Retrying ..." before each sleep
+    def emit(self, record):
+        if record.getMessage().startswith("Retrying"):
+            count("llm_retries")
+
+
+logging.getLogger("llama_index.llms.google_genai").addHandler(_RetryLogHandler(logging.WARNING))
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+llama_parse_api_key = ""
+
+# Pluggable lab PDF parsers. Every backend returns a list of per-page markdown/text strings, which
+# extraction_patient_info.normalize_lab_text merges into the S1 source text.
+#
+# Backends:
+#   llamaparse  - remote LlamaParse service (original behaviour)
+#   local       - offline pypdf layout text extraction plus table reconstruction, pages parsed in
+#                 a process pool
+#
+# Select a backend with the LAB_PARSER_BACKEND environment variable or get_lab_parser(backend=...).
+
+BULLET_RE = re.compile(r"^\s*([•●▪*-])\s+")
+CELL_SPLIT_RE = re.compile(r"\S+(?: \S+)*")
+
+
+class LabParser:
+    name = "base"
+
+    def cache_options(self):
+        """Options that change the parsed output; used as part of the parse cache key."""
+        return {"backend": self.name}
+
+    def parse(self, pdf_path):
+        raise NotImplementedError
+
+    async def aparse(self, pdf_path):
+        return await asyncio.to_thread(self.parse, pdf_path)
+
+
+class LlamaParseBackend(LabParser):
+    name = "llamaparse"
+
+    def __init__(self, result_type="markdown", language="en", num_workers=4):
+        self.result_type = result_type  # "markdown" and "text" are available
+        self.language = language
+        self.num_workers = num_workers  # if multiple files passed, split in `num_workers` API calls
+
+    def cache_options(self):
+        return {"backend": self.name, "result_type": self.result_type, "language": self.language}
+
+    def _parser(self):
+        from llama_parse import LlamaParse
+
+        # Without llama_parse_api_key the key (and the service URL, LLAMA_CLOUD_BASE_URL) come from
+        # the environment
+        key_kwargs = {"api_key": llama_parse_api_key} if llama_parse_api_key else {}
+        return LlamaParse(
+            **key_kwargs,
+            result_type=self.result_type,
+            num_workers=self.num_workers,
+            verbose=True,
+            language=self.language,
+        )
+
+    def parse(self, pdf_path):
+        parsed_documents = self._parser().load_data(pdf_path)
+        return [documents.text for documents in parsed_documents]
+
+    async def aparse(self, pdf_path):
+        parsed_documents = await self._parser().aload_data(pdf_path)
+        return [documents.text for documents in parsed_documents]
+
+
+def _split_cells(line):
+    """Split a layout line into (start, end, text) cells separated by runs of 2+ spaces."""
+    return [(m.start(), m.end(), m.group(0)) for m in CELL_SPLIT_RE.finditer(line)]
+
+
+def _column_gutters(lines, min_gap=2):
+    """Return the [start, end) character ranges that are blank in every line of the block."""
+    width = max(len(line) for line in lines)
+    blank = [all(i >= len(line) or line[i] == " " for line in lines) for i in range(width)]
+
+    gutters = []
+    i = 0
+    while i < width:
+        if blank[i]:
+            j = i
+            while j < width and blank[j]:
+                j += 1
+            if j - i >= min_gap and i > 0 and j < width:
+                gutters.append((i, j))
+            i = j
+        else:
+            i += 1
+    return gutters
+
+
+def _table_to_markdown(lines):
+    gutters = _column_gutters(lines)
+    if not gutters:
+        return None
+
+    bounds = [0] + [end for _, end in gutters]
+    ends = [start for start, _ in gutters] + [None]
+    rows = [[line[start:end].strip() for start, end in zip(bounds, ends)] for line in lines]
+
+    md_lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * len(rows[0])]
+    md_lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return md_lines
+
+
+def layout_text_to_markdown(layout_text):
+    """
+        Rebuild markdown from pypdf layout-mode text.
+
+        - Runs of 2+ consecutive lines that each have 2+ cells (text separated by wide gaps), and
+          that share at least one blank column gutter, become a markdown table.
+        - Bullet lines become markdown list items; their wrapped continuation lines are joined onto
+          them.
+        - Everything else is kept as left-stripped text, with blank lines collapsed.
+    """
+    lines = [line.rstrip() for line in layout_text.splitlines()]
+    md_lines = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if not line.strip():
+            if md_lines and md_lines[-1] != "":
+                md_lines.append("")
+            i += 1
+            continue
+
+        bullet = BULLET_RE.match(line)
+        if bullet:
+            item = line[bullet.end():].strip()
+            indent = bullet.end()
+            i += 1
+            # Continuation lines are indented to (at least) the bullet's text column.
+            while i < len(lines) and lines[i].strip() and not BULLET_RE.match(lines[i]) and \
+                    len(lines[i]) - len(lines[i].lstrip()) >= indent:
+                item += " " + lines[i].strip()
+                i += 1
+            md_lines.append("- " + re.sub(r"\s{2,}", " ", item))
+            continue
+
+        block = []
+        j = i
+        while j < len(lines) and lines[j].strip() and not BULLET_RE.match(lines[j]) and \
+                len(_split_cells(lines[j])) >= 2:
+            block.append(lines[j])
+            j += 1
+        if len(block) >= 2:
+            table = _table_to_markdown(block)
+            if table:
+                md_lines.extend(table)
+                i = j
+                continue
+
+        md_lines.append(re.sub(r"\s{2,}", " ", line.strip()))
+        i += 1
+
+    return "\n".join(md_lines).strip()
+
+
+_worker_reader = None
+
+
+def _init_worker(pdf_path):
+    global _worker_reader
+    _worker_reader = PdfReader(pdf_path)
+
+
+def _parse_pages(page_numbers):
+    return [layout_text_to_markdown(_worker_reader.pages[n].extract_text(extraction_mode="layout"))
+            for n in page_numbers]
+
+
+class LocalPdfParser(LabParser):
+    """
+        Offline parser built on pypdf layout extraction; no network access and no per-page cost.
+
+        Reports with at least parallel_min_pages pages are split into contiguous page chunks and
+        parsed across a process pool (one PdfReader per worker); shorter reports are parsed
+        in-process, since worker start-up would dominate.
+    """
+    name = "local"
+    # Bump whenever layout_text_to_markdown changes so cached local parses are invalidated.
+    version = 1
+
+    def __init__(self, max_workers=None, parallel_min_pages=4):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.parallel_min_pages = parallel_min_pages
+
+    def cache_options(self):
+        return {"backend": self.name, "version": self.version}
+
+    def parse(self, pdf_path):
+        reader = PdfReader(pdf_path)
+        page_count = len(reader.pages)
+
+        if page_count < self.parallel_min_pages or self.max_workers == 1:
+            return [layout_text_to_markdown(page.extract_text(extraction_mode="layout"))
+                    for page in reader.pages]
+
+        worker_count = min(self.max_workers, page_count)
+        chunk_size = -(-page_count // worker_count)
+        chunks = [list(range(start, min(start + chunk_size, page_count)))
+                  for start in range(0, page_count, chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker,
+                                 initargs=(pdf_path,)) as executor:
+            results = executor.map(_parse_pages, chunks)
+            return [page_text for chunk in results for page_text in chunk]
+
+
+LAB_PARSER_BACKENDS = {
+    LlamaParseBackend.name: LlamaParseBackend,
+    LocalPdfParser.name: LocalPdfParser,
+}
+
+
+def get_lab_parser(backend=None):
+    backend = backend or os.environ.get("LAB_PARSER_BACKEND", LlamaParseBackend.name)
+    if backend not in LAB_PARSER_BACKENDS:
+        raise ValueError(f"Unknown lab parser backend: {backend} "
+                         f"(available: {', '.join(LAB_PARSER_BACKENDS)})")
+    return LAB_PARSER_BACKENDS[backend]()
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+from typing import Any, Optional
+
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.llms import CustomLLM
+from llama_index.core.llms.callbacks import llm_completion_callback
+from pydantic import Field, PrivateAttr
+
+# Local CPU inference with llama.cpp (pip install llama-cpp-python) behind the llama-index LLM
+# interface, so the extraction code, the LLM response cache and as_structured_llm work unchanged;
+# see llm_backends.py.
+#
+# The model is a quantized GGUF file (e.g. a Q4_K_M build of Qwen2.5-1.5B/3B-Instruct or
+# Llama-3.2-3B-Instruct). Prompts are sent through the model's chat template as one user message.
+# With json_mode (the default) decoding is constrained by llama.cpp's JSON grammar, so completions
+# always parse as a JSON object, the same contract as the hosted model's responses. A llama.cpp
+# context runs one sequence at a time: requests are serialised on a lock (async callers wait in a
+# worker thread, not on the event loop), and max_tokens bounds the latency of each. A stream holds
+# the lock until it is exhausted or closed; astream_complete closes it when its consumer stops early
+# or is cancelled, so an abandoned stream never blocks later requests.
+
+
+class LlamaCppLLM(CustomLLM):
+    model_path: str = Field(description="Path to the GGUF model file")
+    model: str = Field(default="", description="Model name used in cache keys and metrics; "
+                                               "the file name if empty")
+    temperature: float = 0.1
+    max_tokens: int = 2048
+    context_window: int = 8192
+    n_threads: Optional[int] = None
+    n_batch: int = 512
+    json_mode: bool = True
+
+    _llama: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if not self.model:
+            self.model = os.path.basename(self.model_path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LlamaCppLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, num_output=self.max_tokens,
+                           model_name=self.model)
+
+    def _load(self):
+        # Loading maps the model file and allocates the KV cache, so it is done once, on first use
+        if self._llama is None:
+            from llama_cpp import Llama
+
+            self._llama = Llama(model_path=self.model_path, n_ctx=self.context_window,
+                                n_threads=self.n_threads, n_batch=self.n_batch, verbose=False)
+        return self._llama
+
+    def _chat_kwargs(self, prompt, **kwargs):
+        chat_kwargs = {"messages": [{"role": "user", "content": prompt}],
+                       "temperature": self.temperature,
+                       "max_tokens": kwargs.get("max_tokens", self.max_tokens)}
+        if self.json_mode:
+            chat_kwargs["response_format"] = {"type": "json_object"}
+        return chat_kwargs
+
+    @staticmethod
+    def _usage_kwargs(usage):
+        # Same keys as GoogleGenAI's additional_kwargs; "local" keeps these tokens out of the hosted
+        # cost estimate
+        return {"prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "total_tokens": usage.get("total_tokens"), "local": True}
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        with self._lock:
+            out = self._load().create_chat_completion(**self._chat_kwargs(prompt, **kwargs))
+        return CompletionResponse(text=out["choices"][0]["message"]["content"] or "", raw=out,
+                                  additional_kwargs=self._usage_kwargs(out.get("usage") or {}))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            text = ""
+            completion_tokens = 0
+            with self._lock:
+                chunks = self._load().create_chat_completion(stream=True,
+                                                             **self._chat_kwargs(prompt, **kwargs))
+                try:
+                    for chunk in chunks:
+                        delta = chunk["choices"][0]["delta"].get("content") or ""
+                        if not delta:
+                            continue
+                        text += delta
+                        completion_tokens += 1
+                        yield CompletionResponse(text=text, delta=delta, raw=chunk)
+                finally:
+                    # Closing this generator early stops decoding before the lock is released
+                    chunks.close()
+            # llama.cpp streams one token per chunk and reports no usage; count the prompt once at
+            # the end
+            prompt_tokens = len(self._load().tokenize(prompt.encode("utf-8")))
+            yield CompletionResponse(text=text, delta="", additional_kwargs=self._usage_kwargs(
+                {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}))
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False,
+                        **kwargs: Any) -> CompletionResponse:
+        return await asyncio.to_thread(self.complete, prompt, formatted, **kwargs)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        responses = self.stream_complete(prompt, formatted, **kwargs)
+        done = object()
+
+        async def gen():
+            # Each token is produced in a worker thread so the event loop keeps serving other
+            # requests
+            pending = None
+            try:
+                while True:
+                    pending = asyncio.ensure_future(asyncio.to_thread(next, responses, done))
+                    # Shielded: on cancellation the token in flight still finishes in its thread
+                    response = await asyncio.shield(pending)
+                    if response is done:
+                        return
+                    yield response
+            finally:
+                # Release the model lock now rather than when the stream is garbage-collected; a
+                # generator cannot be closed while its thread is still producing a token, so that
+                # waits for the token
+                if pending is not None and not pending.done():
+                    pending.add_done_callback(lambda _: responses.close())
+                else:
+                    responses.close()
+
+        return gen()
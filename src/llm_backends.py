@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+from functools import lru_cache
+
+# Pluggable LLM backends. Every backend is a llama-index LLM (complete / acomplete /
+# stream_complete / as_structured_llm) that takes the same extraction prompts and returns the same
+# JSON contract, so prompt_llm, pydantic_defs.prompt_llm_structured and soap_eval are
+# backend-agnostic.
+#
+# Backends:
+#   gemini    - hosted Gemini through GoogleGenAI (utils.get_llamaindex_gemini; original behaviour)
+#   llamacpp  - local CPU inference on a quantized GGUF model with llama.cpp (llamacpp_llm.py):
+#                 LLAMACPP_MODEL_PATH       GGUF file (required)
+#                 LLAMACPP_THREADS          CPU threads (default: llama.cpp's choice)
+#                 LLAMACPP_CONTEXT_WINDOW   context size in tokens (default 8192; extraction prompts
+#                                           are ~3k)
+#                 LLAMACPP_MAX_TOKENS       completion cap, which bounds per-request latency
+#                                           (default 2048)
+#
+# Select a backend with the LLM_BACKEND environment variable or get_llm(backend=...).
+# LLM_GROUP_BACKENDS routes individual field groups of grouped extraction (utils.get_field_groups),
+# e.g. "dates=llamacpp,checkboxes=llamacpp" keeps high-volume, low-complexity fields on-premises
+# while the rest go to LLM_BACKEND. Cache keys include the model name, so responses from different
+# backends never mix; tokens from local backends are counted as local_prompt_tokens /
+# local_completion_tokens and left out of the hosted cost estimate. Each backend is built once per
+# process and shared, so get_llm() is a cheap lookup after the first call.
+
+DEFAULT_LLM_BACKEND = "gemini"
+
+
+@lru_cache(maxsize=None)
+def _gemini_llm():
+    # One client per process: building GoogleGenAI fetches the model's metadata with a blocking HTTP
+    # request
+    from utils import get_llamaindex_gemini
+
+    return get_llamaindex_gemini()
+
+
+@lru_cache(maxsize=None)
+def _llamacpp_llm():
+    # One instance per process: the model is loaded once and shared by all callers
+    from llamacpp_llm import LlamaCppLLM
+
+    model_path = os.environ.get("LLAMACPP_MODEL_PATH")
+    if not model_path:
+        raise ValueError("LLM_BACKEND=llamacpp needs LLAMACPP_MODEL_PATH (a GGUF model file)")
+    threads = os.environ.get("LLAMACPP_THREADS")
+    return LlamaCppLLM(model_path=model_path, n_threads=int(threads) if threads else None,
+                       context_window=int(os.environ.get("LLAMACPP_CONTEXT_WINDOW", 8192)),
+                       max_tokens=int(os.environ.get("LLAMACPP_MAX_TOKENS", 2048)))
+
+
+LLM_BACKENDS = {
+    "gemini": _gemini_llm,
+    "llamacpp": _llamacpp_llm,
+}
+_llm_build_lock = threading.Lock()  # concurrent first calls build a backend once, not once each
+
+
+def get_llm(backend=None):
+    backend = backend or os.environ.get("LLM_BACKEND", DEFAULT_LLM_BACKEND)
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend} (available: {', '.join(LLM_BACKENDS)})")
+    with _llm_build_lock:
+        return LLM_BACKENDS[backend]()
+
+
+async def aget_llm(backend=None):
+    """
+        get_llm for coroutines: a first build (blocking network or model loading) runs off the event
+        loop.
+    """
+    return await asyncio.to_thread(get_llm, backend)
+
+
+def without_retries(llm):
+    """
+        llm, or a copy sharing its client that does not retry failed requests itself (GoogleGenAI's
+        max_retries), for callers with their own retry loop.
+    """
+    if getattr(llm, "max_retries", 0) <= 0:
+        return llm
+    return llm.model_copy(update={"max_retries": 0})
+
+
+def get_group_backends():
+    """
+        {field group name: backend} from LLM_GROUP_BACKENDS ("group=backend,..."); unlisted groups
+        use get_llm().
+    """
+    group_backends = {}
+    for item in os.environ.get("LLM_GROUP_BACKENDS", "").split(","):
+        if item.strip():
+            group_name, _, backend = item.partition("=")
+            group_backends[group_name.strip()] = backend.strip()
+    return group_backends
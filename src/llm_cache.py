@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+from disk_cache import DiskCache
+from context_cache import arequest_for_prompt, request_for_prompt
+from instrumentation import count, record_llm_usage, stage
+
+# Persistent cache for LLM responses, keyed on (model name, temperature, rendered prompt, response
+# kind). Byte-identical prompts (same schema, SOAP note, lab text and demographics) are answered
+# from disk, so re-runs, evaluation loops and retries after downstream failures cost nothing. Misses
+# are sent through context_cache.request_for_prompt, which may replace the static prompt prefix by a
+# provider-side cache. Only completions holding a JSON object are stored: a truncated or malformed
+# answer is asked for again on the next run instead of being replayed from disk until it expires.
+#
+# Configuration (environment variables):
+#   LLM_CACHE_DISABLED=1       bypass the cache entirely
+#   LLM_CACHE_DIR              cache directory (default ./output/cache/llm)
+#   LLM_CACHE_TTL_SECONDS      entry lifetime (default: no expiry)
+#   LLM_CACHE_MAX_ENTRIES      LRU entry limit (default: unlimited)
+#   LLM_CACHE_MAX_BYTES        LRU size limit (default: 512 MB)
+
+_response_cache = None
+
+
+def _env_number(name, default=None):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def get_llm_response_cache():
+    global _response_cache
+    if os.environ.get("LLM_CACHE_DISABLED") == "1":
+        return None
+    if _response_cache is None:
+        max_entries = _env_number("LLM_CACHE_MAX_ENTRIES")
+        _response_cache = DiskCache(
+            os.environ.get("LLM_CACHE_DIR", "./output/cache/llm"),
+            max_entries=int(max_entries) if max_entries is not None else None,
+            max_bytes=int(_env_number("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+            ttl_seconds=_env_number("LLM_CACHE_TTL_SECONDS"),
+        )
+    return _response_cache
+
+
+def llm_cache_key(llm, prompt, kind="text"):
+    """kind separates free-text completions from structured ones (which depend on a schema too)."""
+    return DiskCache.make_key(getattr(llm, "model", None), getattr(llm, "temperature", None), kind,
+                              prompt)
+
+
+def _holds_json_object(text):
+    """Whether text holds a JSON object where extraction_patient_info.extract_json_object looks."""
+    match = re.search(r"\{.*\}", text or "", flags=re.S)
+    if not match:
+        return False
+    try:
+        return isinstance(json.loads(match.group(0)), dict)
+    except json.JSONDecodeError:
+        return False
+
+
+def _cached_completion(text):
+    from llama_index.core.base.llms.types import CompletionResponse
+
+    return CompletionResponse(text=text, additional_kwargs={"cache_hit": True})
+
+
+def complete_with_cache(llm, prompt):
+    with stage("llm"):
+        cache = get_llm_response_cache()
+        if cache is None:
+            text, kwargs = request_for_prompt(llm, prompt)
+            out = llm.complete(text, **kwargs)
+            record_llm_usage(out)
+            return out
+
+        key = llm_cache_key(llm, prompt)
+        cached_text = cache.get(key)
+        if cached_text is not None:
+            count("llm_cache_hits")
+            return _cached_completion(cached_text)
+
+        count("llm_cache_misses")
+        text, kwargs = request_for_prompt(llm, prompt)
+        out = llm.complete(text, **kwargs)
+        record_llm_usage(out)
+        if _holds_json_object(out.text):
+            cache.set(key, out.text)
+        return out
+
+
+async def acomplete_with_cache(llm, prompt):
+    with stage("llm"):
+        cache = get_llm_response_cache()
+        if cache is None:
+            text, kwargs = await arequest_for_prompt(llm, prompt)
+            out = await llm.acomplete(text, **kwargs)
+            record_llm_usage(out)
+            return out
+
+        key = llm_cache_key(llm, prompt)
+        cached_text = cache.get(key)
+        if cached_text is not None:
+            count("llm_cache_hits")
+            return _cached_completion(cached_text)
+
+        count("llm_cache_misses")
+        text, kwargs = await arequest_for_prompt(llm, prompt)
+        out = await llm.acomplete(text, **kwargs)
+        record_llm_usage(out)
+        if _holds_json_object(out.text):
+            cache.set(key, out.text)
+        return out
@@ -0,0 +1,434 @@
+# Generated by build_area_code_table.py from phonenumbers 9.0.41 metadata. Do not edit.
+# NANP area code -> (country, state/province codes, geocoder description)
+
+NANP_AREA_CODES = {
+    '201': ('US', ('NJ',), 'New Jersey'),
+    '202': ('US', ('DC',), 'Washington D.C.'),
+    '203': ('US', ('CT',), 'Connecticut'),
+    '204': ('CA', ('MB',), 'Manitoba'),
+    '205': ('US', ('AL',), 'Alabama'),
+    '206': ('US', ('WA',), 'Washington State'),
+    '207': ('US', ('ME',), 'Maine'),
+    '208': ('US', ('ID',), 'Idaho'),
+    '209': ('US', ('CA',), 'California'),
+    '210': ('US', ('TX',), 'San Antonio, TX'),
+    '212': ('US', ('NY',), 'New York, NY'),
+    '213': ('US', ('CA',), 'Los Angeles, CA'),
+    '214': ('US', ('TX',), 'Texas'),
+    '215': ('US', ('PA',), 'Pennsylvania'),
+    '216': ('US', ('OH',), 'Ohio'),
+    '217': ('US', ('IL',), 'Illinois'),
+    '218': ('US', ('MN',), 'Minnesota'),
+    '219': ('US', ('IN',), 'Indiana'),
+    '220': ('US', ('OH',), 'Ohio'),
+    '223': ('US', ('PA',), 'Pennsylvania'),
+    '224': ('US', ('IL',), 'Illinois'),
+    '225': ('US', ('LA',), 'Louisiana'),
+    '226': ('CA', ('ON',), 'Ontario'),
+    '227': ('US', ('MD',), 'Maryland'),
+    '228': ('US', ('MS',), 'Mississippi'),
+    '229': ('US', ('GA',), 'Georgia'),
+    '231': ('US', ('MI',), 'Michigan'),
+    '234': ('US', ('OH',), 'Ohio'),
+    '235': ('US', ('MO',), 'Missouri'),
+    '236': ('CA', ('BC',), 'British Columbia'),
+    '239': ('US', ('FL',), 'Florida'),
+    '240': ('US', ('MD',), 'Maryland'),
+    '248': ('US', ('MI',), 'Michigan'),
+    '249': ('CA', ('ON',), 'Ontario'),
+    '250': ('CA', ('BC',), 'British Columbia'),
+    '251': ('US', ('AL',), 'Alabama'),
+    '252': ('US', ('NC',), 'North Carolina'),
+    '253': ('US', ('WA',), 'Washington State'),
+    '254': ('US', ('TX',), 'Texas'),
+    '256': ('US', ('AL',), 'Alabama'),
+    '257': ('CA', ('BC',), 'British Colombia'),
+    '260': ('US', ('IN',), 'Indiana'),
+    '262': ('US', ('WI',), 'Wisconsin'),
+    '263': ('CA', ('QC',), 'Montreal, QC'),
+    '267': ('US', ('PA',), 'Pennsylvania'),
+    '269': ('US', ('MI',), 'Michigan'),
+    '270': ('US', ('KY',), 'Kentucky'),
+    '272': ('US', ('PA',), 'Pennsylvania'),
+    '273': ('CA', ('QC',), 'Quebec'),
+    '274': ('US', ('WI',), 'Wisconsin'),
+    '276': ('US', ('VA',), 'Virginia'),
+    '279': ('US', ('CA',), 'California'),
+    '281': ('US', ('TX',), 'Texas'),
+    '283': ('US', ('OH',), 'Ohio'),
+    '289': ('CA', ('ON',), 'Ontario'),
+    '301': ('US', ('MD',), 'Maryland'),
+    '302': ('US', ('DE',), 'Delaware'),
+    '303': ('US', ('CO',), 'Colorado'),
+    '304': ('US', ('WV',), 'West Virginia'),
+    '305': ('US', ('FL',), 'Florida'),
+    '306': ('CA', ('SK',), 'Saskatchewan'),
+    '307': ('US', ('WY',), 'Wyoming'),
+    '308': ('US', ('NE',), 'Nebraska'),
+    '309': ('US', ('IL',), 'Illinois'),
+    '310': ('US', ('CA',), 'California'),
+    '312': ('US', ('IL',), 'Chicago, IL'),
+    '313': ('US', ('MI',), 'Michigan'),
+    '314': ('US', ('MO',), 'Missouri'),
+    '315': ('US', ('NY',), 'New York'),
+    '316': ('US', ('KS',), 'Kansas'),
+    '317': ('US', ('IN',), 'Indiana'),
+    '318': ('US', ('LA',), 'Louisiana'),
+    '319': ('US', ('IA',), 'Iowa'),
+    '320': ('US', ('MN',), 'Minnesota'),
+    '321': ('US', ('FL',), 'Florida'),
+    '323': ('US', ('CA',), 'California'),
+    '324': ('US', ('FL',), 'Florida'),
+    '325': ('US', ('TX',), 'Texas'),
+    '326': ('US', ('OH',), 'Ohio'),
+    '327': ('US', ('AR',), 'Arkansas'),
+    '329': ('US', ('NY',), 'New York'),
+    '330': ('US', ('OH',), 'Ohio'),
+    '331': ('US', ('IL',), 'Illinois'),
+    '332': ('US', ('NY',), 'New York, NY'),
+    '334': ('US', ('AL',), 'Alabama'),
+    '336': ('US', ('NC',), 'North Carolina'),
+    '337': ('US', ('LA',), 'Louisiana'),
+    '339': ('US', ('MA',), 'Massachusetts'),
+    '340': ('VI', ('VI',), 'U.S. Virgin Islands'),
+    '341': ('US', ('CA',), 'California'),
+    '343': ('CA', ('ON',), 'Ontario'),
+    '346': ('US', ('TX',), 'Texas'),
+    '347': ('US', ('NY',), 'New York'),
+    '350': ('US', ('CA',), 'California'),
+    '351': ('US', ('MA',), 'Massachusetts'),
+    '352': ('US', ('FL',), 'Florida'),
+    '353': ('US', ('WI',), 'Wisconsin'),
+    '354': ('CA', ('QC',), 'Quebec'),
+    '360': ('US', ('WA',), 'Washington State'),
+    '361': ('US', ('TX',), 'Texas'),
+    '363': ('US', ('NY',), 'New York'),
+    '364': ('US', ('KY',), 'Kentucky'),
+    '365': ('CA', ('ON',), 'Ontario'),
+    '367': ('CA', ('QC',), 'Quebec'),
+    '368': ('CA', ('AB',), 'Alberta'),
+    '369': ('US', ('CA',), 'California'),
+    '380': ('US', ('OH',), 'Ohio'),
+    '382': ('CA', ('ON',), 'Ontario'),
+    '385': ('US', ('UT',), 'Utah'),
+    '386': ('US', ('FL',), 'Florida'),
+    '401': ('US', ('RI',), 'Rhode Island'),
+    '402': ('US', ('NE',), 'Omaha, NE'),
+    '403': ('CA', ('AB',), 'Alberta'),
+    '404': ('US', ('GA',), 'Georgia'),
+    '405': ('US', ('OK',), 'Oklahoma'),
+    '406': ('US', ('MT',), 'Montana'),
+    '407': ('US', ('FL',), 'Florida'),
+    '408': ('US', ('CA',), 'California'),
+    '409': ('US', ('TX',), 'Texas'),
+    '410': ('US', ('MD',), 'Maryland'),
+    '412': ('US', ('PA',), 'Pennsylvania'),
+    '413': ('US', ('MA',), 'Massachusetts'),
+    '414': ('US', ('WI',), 'Wisconsin'),
+    '415': ('US', ('CA',), 'San Francisco, CA'),
+    '416': ('CA', ('ON',), 'Ontario'),
+    '417': ('US', ('MO',), 'Missouri'),
+    '418': ('CA', ('QC',), 'Quebec'),
+    '419': ('US', ('OH',), 'Ohio'),
+    '423': ('US', ('TN',), 'Tennessee'),
+    '424': ('US', ('CA',), 'California'),
+    '425': ('US', ('WA',), 'Washington State'),
+    '428': ('CA', ('NB',), 'New Brunswick'),
+    '430': ('US', ('TX',), 'Texas'),
+    '431': ('CA', ('MB',), 'Manitoba'),
+    '432': ('US', ('TX',), 'Texas'),
+    '434': ('US', ('VA',), 'Virginia'),
+    '435': ('US', ('UT',), 'Utah'),
+    '437': ('CA', ('ON',), 'Toronto, ON'),
+    '438': ('CA', ('QC',), 'Quebec'),
+    '440': ('US', ('OH',), 'Ohio'),
+    '442': ('US', ('CA',), 'California'),
+    '443': ('US', ('MD',), 'Maryland'),
+    '445': ('US', ('PA',), 'Philadelphia, PA'),
+    '447': ('US', ('IL',), 'Illinois'),
+    '448': ('US', ('FL',), 'Florida'),
+    '450': ('CA', ('QC',), 'Quebec'),
+    '458': ('US', ('OR',), 'Oregon'),
+    '463': ('US', ('IN',), 'Indiana'),
+    '464': ('US', ('IL',), 'Illinois'),
+    '468': ('CA', ('QC',), 'Quebec'),
+    '469': ('US', ('TX',), 'Texas'),
+    '470': ('US', ('GA',), 'Georgia'),
+    '472': ('US', ('NC',), 'North Carolina'),
+    '474': ('CA', ('SK',), 'Saskatchewan'),
+    '475': ('US', ('CT',), 'Connecticut'),
+    '478': ('US', ('GA',), 'Georgia'),
+    '479': ('US', ('AR',), 'Arkansas'),
+    '480': ('US', ('AZ',), 'Arizona'),
+    '484': ('US', ('PA',), 'Pennsylvania'),
+    '501': ('US', ('AR',), 'Arkansas'),
+    '502': ('US', ('KY',), 'Kentucky'),
+    '503': ('US', ('OR',), 'Oregon'),
+    '504': ('US', ('LA',), 'Louisiana'),
+    '505': ('US', ('NM',), 'New Mexico'),
+    '506': ('CA', ('NB',), 'New Brunswick'),
+    '507': ('US', ('MN',), 'Minnesota'),
+    '508': ('US', ('MA',), 'Massachusetts'),
+    '509': ('US', ('WA',), 'Washington State'),
+    '510': ('US', ('CA',), 'California'),
+    '512': ('US', ('TX',), 'Texas'),
+    '513': ('US', ('OH',), 'Ohio'),
+    '514': ('CA', ('QC',), 'Quebec'),
+    '515': ('US', ('IA',), 'Iowa'),
+    '516': ('US', ('NY',), 'New York'),
+    '517': ('US', ('MI',), 'Michigan'),
+    '518': ('US', ('NY',), 'New York'),
+    '519': ('CA', ('ON',), 'Ontario'),
+    '520': ('US', ('AZ',), 'Arizona'),
+    '530': ('US', ('CA',), 'California'),
+    '531': ('US', ('NE',), 'Nebraska'),
+    '534': ('US', ('WI',), 'Wisconsin'),
+    '539': ('US', ('OK',), 'Oklahoma'),
+    '540': ('US', ('VA',), 'Virginia'),
+    '541': ('US', ('OR',), 'Oregon'),
+    '548': ('CA', ('ON',), 'Ontario'),
+    '551': ('US', ('NJ',), 'New Jersey'),
+    '557': ('US', ('MO',), 'Missouri'),
+    '559': ('US', ('CA',), 'California'),
+    '561': ('US', ('FL',), 'Florida'),
+    '562': ('US', ('CA',), 'California'),
+    '563': ('US', ('IA',), 'Iowa'),
+    '564': ('US', ('WA',), 'Washington State'),
+    '567': ('US', ('OH',), 'Ohio'),
+    '570': ('US', ('PA',), 'Pennsylvania'),
+    '571': ('US', ('VA',), 'Virginia'),
+    '572': ('US', ('OK',), 'Oklahoma'),
+    '573': ('US', ('MO',), 'Missouri'),
+    '574': ('US', ('IN',), 'Indiana'),
+    '575': ('US', ('NM',), 'New Mexico'),
+    '579': ('CA', ('QC',), 'Quebec'),
+    '580': ('US', ('OK',), 'Oklahoma'),
+    '581': ('CA', ('QC',), 'Quebec'),
+    '582': ('US', ('PA',), 'Pennsylvania'),
+    '584': ('CA', ('MB',), 'Manitoba'),
+    '585': ('US', ('NY',), 'New York'),
+    '586': ('US', ('MI',), 'Michigan'),
+    '587': ('CA', ('AB',), 'Alberta'),
+    '600': ('CA', (), 'Canada'),
+    '601': ('US', ('MS',), 'Mississippi'),
+    '602': ('US', ('AZ',), 'Arizona'),
+    '603': ('US', ('NH',), 'New Hampshire'),
+    '604': ('CA', ('BC',), 'British Columbia'),
+    '605': ('US', ('SD',), 'South Dakota'),
+    '606': ('US', ('KY',), 'Kentucky'),
+    '607': ('US', ('NY',), 'New York'),
+    '608': ('US', ('WI',), 'Wisconsin'),
+    '609': ('US', ('NJ',), 'New Jersey'),
+    '610': ('US', ('PA',), 'Pennsylvania'),
+    '612': ('US', ('MN',), 'Minnesota'),
+    '613': ('CA', ('ON',), 'Ontario'),
+    '614': ('US', ('OH',), 'Ohio'),
+    '615': ('US', ('TN',), 'Tennessee'),
+    '616': ('US', ('MI',), 'Michigan'),
+    '617': ('US', ('MA',), 'Massachusetts'),
+    '618': ('US', ('IL',), 'Illinois'),
+    '619': ('US', ('CA',), 'California'),
+    '620': ('US', ('KS',), 'Kansas'),
+    '622': ('CA', (), 'Canada'),
+    '623': ('US', ('AZ',), 'Arizona'),
+    '626': ('US', ('CA',), 'California'),
+    '628': ('US', ('CA',), 'California'),
+    '629': ('US', ('TN',), 'Tennessee'),
+    '630': ('US', ('IL',), 'Illinois'),
+    '631': ('US', ('NY',), 'New York'),
+    '633': ('CA', (), 'Canada'),
+    '636': ('US', ('MO',), 'Missouri'),
+    '639': ('CA', ('SK',), 'Saskatchewan'),
+    '640': ('US', ('NJ',), 'New Jersey'),
+    '641': ('US', ('IA',), 'Iowa'),
+    '645': ('US', ('FL',), 'Florida'),
+    '646': ('US', ('NY',), 'New York'),
+    '647': ('CA', ('ON',), 'Ontario'),
+    '650': ('US', ('CA',), 'California'),
+    '651': ('US', ('MN',), 'Minnesota'),
+    '656': ('US', ('FL',), 'Florida'),
+    '657': ('US', ('CA',), 'California'),
+    '658': ('JM', (), 'Jamaica'),
+    '659': ('US', ('AL',), 'Alabama'),
+    '660': ('US', ('MO',), 'Missouri'),
+    '661': ('US', ('CA',), 'California'),
+    '662': ('US', ('MS',), 'Mississippi'),
+    '667': ('US', ('MD',), 'Maryland'),
+    '669': ('US', ('CA',), 'California'),
+    '670': ('MP', ('MP',), 'Northern Mariana Islands'),
+    '671': ('GU', ('GU',), 'Guam'),
+    '672': ('CA', ('BC',), 'British Columbia'),
+    '678': ('US', ('GA',), 'Georgia'),
+    '680': ('US', ('NY',), 'New York'),
+    '681': ('US', ('WV',), 'West Virginia'),
+    '682': ('US', ('TX',), 'Texas'),
+    '683': ('CA', ('ON',), 'Ontario'),
+    '686': ('US', ('VA',), 'Virginia'),
+    '689': ('US', ('FL',), 'Florida'),
+    '701': ('US', ('ND',), 'North Dakota'),
+    '702': ('US', ('NV',), 'Nevada'),
+    '703': ('US', ('VA',), 'Virginia'),
+    '704': ('US', ('NC',), 'North Carolina'),
+    '705': ('CA', ('ON',), 'Ontario'),
+    '706': ('US', ('GA',), 'Georgia'),
+    '707': ('US', ('CA',), 'Vallejo, CA'),
+    '708': ('US', ('IL',), 'Illinois'),
+    '709': ('CA', ('NL',), 'Newfoundland and Labrador'),
+    '712': ('US', ('IA',), 'Iowa'),
+    '713': ('US', ('TX',), 'Texas'),
+    '714': ('US', ('CA',), 'California'),
+    '715': ('US', ('WI',), 'Wisconsin'),
+    '716': ('US', ('NY',), 'New York'),
+    '717': ('US', ('PA',), 'Pennsylvania'),
+    '718': ('US', ('NY',), 'New York'),
+    '719': ('US', ('CO',), 'Colorado'),
+    '720': ('US', ('CO',), 'Colorado'),
+    '724': ('US', ('PA',), 'Pennsylvania'),
+    '725': ('US', ('NV',), 'Nevada'),
+    '726': ('US', ('TX',), 'San Antonio, TX'),
+    '727': ('US', ('FL',), 'Florida'),
+    '728': ('US', ('FL',), 'Palm Beach, FL'),
+    '730': ('US', ('IL',), 'Illinois'),
+    '731': ('US', ('TN',), 'Tennessee'),
+    '732': ('US', ('NJ',), 'New Jersey'),
+    '734': ('US', ('MI',), 'Michigan'),
+    '737': ('US', ('TX',), 'Texas'),
+    '738': ('US', ('CA',), 'California'),
+    '740': ('US', ('OH',), 'Ohio'),
+    '742': ('CA', ('ON',), 'Ontario'),
+    '743': ('US', ('NC',), 'North Carolina'),
+    '747': ('US', ('CA',), 'California'),
+    '748': ('US', ('CO',), 'Colorado'),
+    '753': ('CA', ('ON',), 'Ontario'),
+    '754': ('US', ('FL',), 'Florida'),
+    '757': ('US', ('VA',), 'Virginia'),
+    '760': ('US', ('CA',), 'California'),
+    '762': ('US', ('GA',), 'Georgia'),
+    '763': ('US', ('MN',), 'Minnesota'),
+    '765': ('US', ('IN',), 'Indiana'),
+    '769': ('US', ('MS',), 'Mississippi'),
+    '770': ('US', ('GA',), 'Georgia'),
+    '771': ('US', ('DC',), 'Washington D.C.'),
+    '772': ('US', ('FL',), 'Florida'),
+    '773': ('US', ('IL',), 'Chicago, IL'),
+    '774': ('US', ('MA',), 'Massachusetts'),
+    '775': ('US', ('NV',), 'Nevada'),
+    '778': ('CA', ('BC',), 'British Columbia'),
+    '779': ('US', ('IL',), 'Illinois'),
+    '780': ('CA', ('AB',), 'Alberta'),
+    '781': ('US', ('MA',), 'Massachusetts'),
+    '782': ('CA', ('NS', 'PE'), 'Nova Scotia/Prince Edward Island'),
+    '784': ('VC', (), 'Saint Vincent And The Grenadines'),
+    '785': ('US', ('KS',), 'Kansas'),
+    '786': ('US', ('FL',), 'Florida'),
+    '787': ('PR', ('PR',), 'Puerto Rico'),
+    '801': ('US', ('UT',), 'Windsor North, Orem, UT'),
+    '802': ('US', ('VT',), 'Vermont'),
+    '803': ('US', ('SC',), 'South Carolina'),
+    '804': ('US', ('VA',), 'Virginia'),
+    '805': ('US', ('CA',), 'California'),
+    '806': ('US', ('TX',), 'Texas'),
+    '807': ('CA', ('ON',), 'Ontario'),
+    '808': ('US', ('HI',), 'Hawaii'),
+    '809': ('DO', (), 'Dominican Republic'),
+    '810': ('US', ('MI',), 'Michigan'),
+    '812': ('US', ('IN',), 'Indiana'),
+    '813': ('US', ('FL',), 'Florida'),
+    '814': ('US', ('PA',), 'Pennsylvania'),
+    '815': ('US', ('IL',), 'Illinois'),
+    '816': ('US', ('MO',), 'Missouri'),
+    '817': ('US', ('TX',), 'Texas'),
+    '818': ('US', ('CA',), 'California'),
+    '819': ('CA', ('QC',), 'Quebec'),
+    '820': ('US', ('CA',), 'California'),
+    '821': ('US', ('SC',), 'South Carolina'),
+    '825': ('CA', ('AB',), 'Alberta'),
+    '826': ('US', ('VA',), 'Virginia'),
+    '828': ('US', ('NC',), 'North Carolina'),
+    '829': ('DO', (), 'Dominican Republic'),
+    '830': ('US', ('TX',), 'Texas'),
+    '831': ('US', ('CA',), 'California'),
+    '832': ('US', ('TX',), 'Texas'),
+    '835': ('US', ('PA',), 'Pennsylvania'),
+    '838': ('US', ('NY',), 'New York'),
+    '839': ('US', ('SC',), 'South Carolina'),
+    '840': ('US', ('CA',), 'California'),
+    '843': ('US', ('SC',), 'South Carolina'),
+    '845': ('US', ('NY',), 'New York'),
+    '847': ('US', ('IL',), 'Illinois'),
+    '848': ('US', ('NJ',), 'New Jersey'),
+    '849': ('DO', (), 'Dominican Republic'),
+    '850': ('US', ('FL',), 'Florida'),
+    '854': ('US', ('SC',), 'South Carolina'),
+    '856': ('US', ('NJ',), 'New Jersey'),
+    '857': ('US', ('MA',), 'Massachusetts'),
+    '858': ('US', ('CA',), 'California'),
+    '859': ('US', ('KY',), 'Kentucky'),
+    '860': ('US', ('CT',), 'Connecticut'),
+    '862': ('US', ('NJ',), 'New Jersey'),
+    '863': ('US', ('FL',), 'Florida'),
+    '864': ('US', ('SC',), 'South Carolina'),
+    '865': ('US', ('TN',), 'Tennessee'),
+    '867': ('CA', ('NT', 'NU', 'YT'), 'Northwest Territories/Nunavut/Yukon'),
+    '870': ('US', ('AR',), 'Arkansas'),
+    '872': ('US', ('IL',), 'Chicago, IL'),
+    '873': ('CA', ('QC',), 'Quebec'),
+    '876': ('JM', (), 'Jamaica'),
+    '878': ('US', ('PA',), 'Pennsylvania'),
+    '879': ('CA', ('NL',), 'Newfoundland and Labrador'),
+    '901': ('US', ('TN',), 'Tennessee'),
+    '902': ('CA', ('NS', 'PE'), 'Nova Scotia/Prince Edward Island'),
+    '903': ('US', ('TX',), 'Texas'),
+    '904': ('US', ('FL',), 'Florida'),
+    '905': ('CA', ('ON',), 'Ontario'),
+    '906': ('US', ('MI',), 'Michigan'),
+    '907': ('US', ('AK',), 'Alaska'),
+    '908': ('US', ('NJ',), 'New Jersey'),
+    '909': ('US', ('CA',), 'California'),
+    '910': ('US', ('NC',), 'North Carolina'),
+    '912': ('US', ('GA',), 'Georgia'),
+    '913': ('US', ('KS',), 'Kansas'),
+    '914': ('US', ('NY',), 'New York'),
+    '915': ('US', ('TX',), 'Texas'),
+    '916': ('US', ('CA',), 'California'),
+    '917': ('US', ('NY',), 'New York'),
+    '918': ('US', ('OK',), 'Oklahoma'),
+    '919': ('US', ('NC',), 'North Carolina'),
+    '920': ('US', ('WI',), 'Wisconsin'),
+    '925': ('US', ('CA',), 'California'),
+    '928': ('US', ('AZ',), 'Arizona'),
+    '929': ('US', ('NY',), 'New York'),
+    '930': ('US', ('IN',), 'Indiana'),
+    '931': ('US', ('TN',), 'Tennessee'),
+    '934': ('US', ('NY',), 'New York, NY'),
+    '936': ('US', ('TX',), 'Texas'),
+    '937': ('US', ('OH',), 'Ohio'),
+    '938': ('US', ('AL',), 'Alabama'),
+    '939': ('PR', ('PR',), 'Puerto Rico'),
+    '940': ('US', ('TX',), 'Texas'),
+    '941': ('US', ('FL',), 'Florida'),
+    '942': ('CA', ('ON',), 'Toronto, ON'),
+    '943': ('US', ('GA',), 'Georgia'),
+    '945': ('US', ('TX',), 'Texas'),
+    '947': ('US', ('MI',), 'Michigan'),
+    '948': ('US', ('VA',), 'Virginia'),
+    '949': ('US', ('CA',), 'California'),
+    '951': ('US', ('CA',), 'California'),
+    '952': ('US', ('MN',), 'Minnesota'),
+    '954': ('US', ('FL',), 'Florida'),
+    '956': ('US', ('TX',), 'Texas'),
+    '959': ('US', ('CT',), 'Connecticut'),
+    '970': ('US', ('CO',), 'Colorado'),
+    '971': ('US', ('OR',), 'Oregon'),
+    '972': ('US', ('TX',), 'Texas'),
+    '973': ('US', ('NJ',), 'New Jersey'),
+    '975': ('US', ('MO',), 'Missouri'),
+    '978': ('US', ('MA',), 'Massachusetts'),
+    '979': ('US', ('TX',), 'Texas'),
+    '980': ('US', ('NC',), 'North Carolina'),
+    '983': ('US', ('CO',), 'Colorado'),
+    '984': ('US', ('NC',), 'North Carolina'),
+    '985': ('US', ('LA',), 'Louisiana'),
+    '986': ('US', ('ID',), 'Idaho'),
+    '989': ('US', ('MI',), 'Michigan'),
+}
@@ -9,18 +9,15 @@ model = PaddleDetectionLayoutModel(
     label_map={0: "Text", 1: "Title", 2: "List", 3: "Table", 4: "Figure"}
 )
 
-import fitz
+from rasterize import render_pages
 file_path = "./data/form_scanned.pdf"
 dpi = 300  # choose desired dpi here
-zoom = dpi / 72  # zoom factor, standard: 72 dpi
-magnify = fitz.Matrix(zoom, zoom)  # magnifies in x, resp. y direction
-doc = fitz.open(file_path)  # open document
-for page in doc:
-    pix = page.get_pixmap(matrix=magnify)  # render page to an image
-    pix.save(f"page-{page.number}.png")
+# Pages are rendered straight into arrays (in a process pool for multi-page scans), with no
+# page-N.png round trip
+pages = render_pages(file_path, dpi=dpi, gray=False)
 
 
-img = cv2.imread("./page-0.png")
+img = cv2.cvtColor(pages[0], cv2.COLOR_RGB2BGR)  # same BGR layout cv2.imread gave
 # 2. Load a pre-trained model (e.g., for academic papers)
 
 ocr_agent = lp.TesseractAgent.with_tesseract_executable(
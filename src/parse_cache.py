@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+from disk_cache import DiskCache
+
+# Persistent cache for lab PDF parsing, keyed on the SHA-256 of the PDF bytes plus the parser
+# options. Two entries are kept per document:
+#   - raw:        the per-page text returned by the parser, exactly as received
+#   - normalized: the post-normalization text, additionally keyed on the normalization version
+# so changing the normalization logic only recomputes from the raw entry and never re-parses.
+#
+# Configuration (environment variables):
+#   PARSE_CACHE_DISABLED=1     bypass the cache entirely
+#   PARSE_CACHE_DIR            cache directory (default ./output/cache/lab_parse)
+
+_parse_cache = None
+
+
+def get_parse_cache():
+    global _parse_cache
+    if os.environ.get("PARSE_CACHE_DISABLED") == "1":
+        return None
+    if _parse_cache is None:
+        _parse_cache = DiskCache(os.environ.get("PARSE_CACHE_DIR", "./output/cache/lab_parse"))
+    return _parse_cache
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lab_parse_cache_keys(pdf_path, parser_options, normalization_version):
+    """Return (raw_key, normalized_key) for a PDF parsed with parser_options."""
+    pdf_hash = file_sha256(pdf_path)
+    raw_key = DiskCache.make_key("raw", pdf_hash, parser_options)
+    normalized_key = DiskCache.make_key("normalized", raw_key, normalization_version)
+    return raw_key, normalized_key
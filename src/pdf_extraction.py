@@ -1,84 +1,164 @@
 from pypdf import PdfReader
 import json
 
-def get_bbox(reader):
-    data_dict_bbox = {}
-    for page in reader.pages:
-        for annot_ref in page["/Annots"]:
-            annot = annot_ref.get_object()
-            if annot.get('/FT') == '/Tx':
-                data_dict_bbox[annot.get("/T").strip().lower()] = annot.get('/Rect')
-    return data_dict_bbox
-
-def process_pdf(reader):
-
-    data_dict_bbox = get_bbox(reader)
+# Form schema extraction.
+#
+# index_fields walks every page's /Annots once and records, for each terminal form field, its
+# qualified name, the pages and rectangles of its widgets and its /Kids, so multi-page forms with
+# hundreds of fields (and pages without any annotations) are handled in one traversal. process_pdf
+# turns that index into schema.json; pdf_populate uses the same index to touch only the pages
+# holding fields that change.
+
+RADIO_FLAG = 1 << 15
+PUSHBUTTON_FLAG = 1 << 16
+
+
+def qualified_field_name(field):
+    names = []
+    while field is not None:
+        if "/T" in field:
+            names.append(str(field["/T"]))
+        field = field.get("/Parent")
+        field = field.get_object() if field is not None else None
+    return ".".join(reversed(names))
+
+
+def inherited_attribute(field, key, default=None):
+    """
+        A field attribute, looked up through /Parent as inheritable entries (/FT, /Ff, /V, /DA)
+        are.
+    """
+    while field is not None:
+        if key in field:
+            return field[key]
+        field = field.get("/Parent")
+        field = field.get_object() if field is not None else None
+    return default
+
+
+class FieldEntry:
+    def __init__(self, name, field):
+        self.name = name
+        self.field = field
+        self.widgets = []  # (page index, widget annotation) in page and /Annots order
+        self.kids = [kid.get_object() for kid in field.get("/Kids", [])]
+
+    @property
+    def pages(self):
+        return sorted({page_index for page_index, _ in self.widgets})
+
+    @property
+    def page(self):
+        return self.widgets[0][0] if self.widgets else None
+
+    @property
+    def rects(self):
+        return [widget["/Rect"] for _, widget in self.widgets if "/Rect" in widget]
+
+    @property
+    def field_type(self):
+        return inherited_attribute(self.field, "/FT")
+
+    @property
+    def flags(self):
+        return int(inherited_attribute(self.field, "/Ff", 0))
+
+
+def _field_tree_order(pdf):
+    """
+        Qualified field name -> position in the AcroForm /Fields tree (names only; no pages are
+        visited).
+    """
+    order = {}
+
+    def walk(field, parent_name):
+        field = field.get_object()
+        partial_name = field.get("/T")
+        if partial_name is None:
+            name = parent_name
+        else:
+            name = f"{parent_name}.{partial_name}" if parent_name else str(partial_name)
+        order.setdefault(name, len(order))
+        for kid in field.get("/Kids", []):
+            walk(kid, name)
+
+    acro_form = pdf.root_object.get("/AcroForm")
+    if acro_form is not None:
+        for field in acro_form.get_object().get("/Fields", []):
+            walk(field, "")
+    return order
+
+
+def index_fields(pdf):
+    """
+        {qualified field name: FieldEntry} for every field with a widget, from one pass over the
+        pages of a PdfReader or PdfWriter. Fields are in AcroForm /Fields order, as
+        reader.get_fields() lists them; widgets of fields missing from /Fields keep page order,
+        after the rest.
+    """
+    fields = {}
+    for page_index, page in enumerate(pdf.pages):
+        annotations = page.get("/Annots")
+        if annotations is None:
+            continue
+        for annot_ref in annotations.get_object():
+            annotation = annot_ref.get_object()
+            if annotation.get("/Subtype") != "/Widget":
+                continue
+            # A widget is either merged with its field or a kid of it (checkbox groups, repeated
+            # text fields)
+            if "/T" in annotation:
+                field = annotation
+            elif annotation.get("/Parent") is not None:
+                field = annotation["/Parent"].get_object()
+            else:
+                continue
+            name = qualified_field_name(field)
+            entry = fields.get(name)
+            if entry is None:
+                entry = fields[name] = FieldEntry(name, field)
+            entry.widgets.append((page_index, annotation))
+
+    order = _field_tree_order(pdf)
+    return dict(sorted(fields.items(), key=lambda item: order.get(item[0], len(order))))
 
-    RADIO_FLAG = 1 << 15
-    PUSHBUTTON_FLAG = 1 << 16
 
-    fields = reader.get_fields()
-    field_raw_data = []
+def process_pdf(reader):
     field_json_data = dict()
 
-    for name, field in fields.items():
-        name_ = name.strip().lower()
-
-        field_type = field.get('/FT')
-        value = field.get('/V')
+    for name, entry in index_fields(reader).items():
+        field = entry.field
+        field_type = entry.field_type
         actual_name = field.get('/TU')
+        normalized_name = field.get("/T").strip().lower()
 
-        data_dict = {}
         if field_type == '/Tx':
-
-            data_dict["name"] = actual_name + " , " + field.get("/T").strip().lower()
-            data_dict["field_type"] = "text"
-            data_dict["bbox"] = data_dict_bbox.get(field.get("/T").strip().lower())
-
-            field_json_data[field.get("/T").strip().lower()] = {"label": actual_name,
-                                                                "normalized_name": field.get("/T").strip().lower(),
-                                                                "bbox": data_dict["bbox"],
-                                                                "type": "text",
-                                                                "pdf_field_name": name}
+            rects = entry.rects
+            field_json_data[normalized_name] = {"label": actual_name,
+                                                "normalized_name": normalized_name,
+                                                "bbox": rects[0] if rects else None,
+                                                "type": "text",
+                                                "pdf_field_name": name,
+                                                "page": entry.page}
 
         elif field_type == '/Btn':
-            flags = field.get('/Ff', 0)
+            flags = entry.flags
 
             is_radio = flags & RADIO_FLAG
             is_pushbutton = flags & PUSHBUTTON_FLAG
 
             if not is_radio and not is_pushbutton:
-                data_dict["field_type"] = "checkbox"
-                is_ticked = value != "/Off" and value is not None
-                status = "Ticked" if is_ticked else "Empty"
-
-
-                data_dict["name"] = actual_name + " , " + field.get("/T").strip().lower()
-                data_dict["checkbox_opts"] = []
-                data_dict["bbox"] = []
-
-                if "/Kids" in field:
-                    for kid_ref in field["/Kids"]:
-                        kid = kid_ref.get_object()
-                        data_dict["checkbox_opts"].append(list(kid['/AP']['/N'].keys())[0][1:])
-                        if "/Rect" in kid:
-                            data_dict["bbox"].append(kid['/Rect'])
-                else:
-                    if "/Rect" in field:
-                        data_dict["bbox"].append(field['/Rect'])
-
-
-                field_json_data[field.get("/T").strip().lower()] = {"label": actual_name,
-                                                                    "normalized_name": field.get("/T").strip().lower(),
-                                                                    "bbox": data_dict["bbox"],
-                                                                    "type": "checkbox",
-                                                                    "checkbox_opts" : data_dict["checkbox_opts"],
-                                                                    "pdf_field_name": name}
-        else:
-            pass
-
-        if len(data_dict) > 0:
-            field_raw_data.append(data_dict)
+                # Options are the "on" appearance states of the kids; a lone checkbox lists none
+                checkbox_opts = [list(widget['/AP']['/N'].keys())[0][1:]
+                                 for _, widget in entry.widgets if widget is not field]
+
+                field_json_data[normalized_name] = {"label": actual_name,
+                                                    "normalized_name": normalized_name,
+                                                    "bbox": entry.rects,
+                                                    "type": "checkbox",
+                                                    "checkbox_opts": checkbox_opts,
+                                                    "pdf_field_name": name,
+                                                    "page": entry.page}
 
     return field_json_data
 
@@ -0,0 +1,128 @@
+import re
+from io import BytesIO
+
+from pypdf.generic import (ArrayObject, ByteStringObject, DecodedStreamObject, DictionaryObject,
+                           NameObject, NumberObject)
+
+# PDF incremental updates (ISO 32000-1, 7.5.6).
+#
+# An incremental update is appended to the unchanged bytes of a PDF: the new and changed objects, a
+# cross-reference section listing only those objects, and a trailer whose /Prev points at the
+# original cross-reference section. Readers resolve every other object from the original, so a
+# filled form costs the template bytes once plus an update that grows with the number of fields
+# filled (pdf_populate.TemplatePopulator with incremental=True). The update's cross-reference
+# section has the same form as the original's: a cross-reference stream after one, a classic xref
+# table and trailer after the other, so the file stays readable by whatever read the template.
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s*%%EOF", re.S)
+TRAILER_KEYS = ["/Root", "/Info", "/ID"]  # carried over from the original trailer
+
+
+class IncrementalBase:
+    """
+        A PDF that updates are appended to: its bytes, where its last cross-reference section starts
+        and which kind it is, and the entries of its trailer that every update repeats (from a
+        PdfReader over the same bytes, whose trailer merges every section's).
+    """
+
+    def __init__(self, data, reader):
+        trailer = reader.trailer
+        if "/Encrypt" in trailer:
+            raise ValueError("Incremental updates of encrypted PDFs are not supported")
+        matches = list(STARTXREF_RE.finditer(data, max(len(data) - 2048, 0)))
+        if not matches:
+            raise ValueError("No startxref at the end of the PDF")
+        self.data = data
+        self.startxref = int(matches[-1].group(1))
+        self.xref_stream = not data[self.startxref:self.startxref + 4] == b"xref"
+        self.size = int(trailer["/Size"])
+        self.trailer = {key: trailer.raw_get(key) for key in TRAILER_KEYS if key in trailer}
+        if "/ID" in self.trailer:
+            # pypdf may decode an identifier as text; it must be written back as the same bytes
+            self.trailer["/ID"] = ArrayObject(
+                ByteStringObject(getattr(part, "original_bytes", part))
+                for part in self.trailer["/ID"].get_object())
+
+
+def build_update(base, objects):
+    """
+        The bytes of an incremental update to base holding objects,
+        {(object number, generation): object}. They follow base.data directly: a complete PDF is
+        base.data + build_update(base, objects).
+    """
+    buffer = BytesIO()
+    if not base.data.endswith((b"\n", b"\r")):
+        buffer.write(b"\n")
+    offsets = {}
+    for (idnum, generation), obj in sorted(objects.items()):
+        offsets[idnum] = (len(base.data) + buffer.tell(), generation)
+        buffer.write(f"{idnum} {generation} obj\n".encode())
+        obj.write_to_stream(buffer)
+        buffer.write(b"\nendobj\n")
+
+    size = max([base.size] + [idnum + 1 for idnum in offsets])
+    xref_offset = len(base.data) + buffer.tell()
+    if base.xref_stream:
+        # The cross-reference stream is an object itself, numbered after everything else, and lists
+        # itself
+        offsets[size] = (xref_offset, 0)
+        size += 1
+        _write_xref_stream(buffer, base, offsets, size, xref_offset)
+    else:
+        _write_xref_table(buffer, base, offsets, size)
+    buffer.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+    return buffer.getvalue()
+
+
+def _subsections(offsets):
+    """
+        Runs of consecutive object numbers:
+        [(first object number, [(offset, generation), ...]), ...].
+    """
+    runs = []
+    for idnum in sorted(offsets):
+        if runs and runs[-1][0] + len(runs[-1][1]) == idnum:
+            runs[-1][1].append(offsets[idnum])
+        else:
+            runs.append((idnum, [offsets[idnum]]))
+    return runs
+
+
+def _trailer(base, size):
+    trailer = DictionaryObject({NameObject(key): value for key, value in base.trailer.items()})
+    trailer[NameObject("/Size")] = NumberObject(size)
+    trailer[NameObject("/Prev")] = NumberObject(base.startxref)
+    return trailer
+
+
+def _write_xref_table(buffer, base, offsets, size):
+    buffer.write(b"xref\n")
+    for first, entries in _subsections(offsets):
+        buffer.write(f"{first} {len(entries)}\n".encode())
+        for offset, generation in entries:
+            buffer.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+    buffer.write(b"trailer\n")
+    _trailer(base, size).write_to_stream(buffer)
+    buffer.write(b"\n")
+
+
+def _write_xref_stream(buffer, base, offsets, size, xref_offset):
+    offset_width = max((max(offset for offset, _ in offsets.values()).bit_length() + 7) // 8, 1)
+    index, rows = ArrayObject(), []
+    for first, entries in _subsections(offsets):
+        index += [NumberObject(first), NumberObject(len(entries))]
+        rows += [b"\x01" + offset.to_bytes(offset_width, "big") + generation.to_bytes(2, "big")
+                 for offset, generation in entries]
+
+    xref = DecodedStreamObject()
+    xref.set_data(b"".join(rows))
+    xref.update(_trailer(base, size))
+    xref.update({
+        NameObject("/Type"): NameObject("/XRef"),
+        NameObject("/Index"): index,
+        NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(offset_width),
+                                       NumberObject(2)]),
+    })
+    buffer.write(f"{size - 1} 0 obj\n".encode())
+    xref.write_to_stream(buffer)
+    buffer.write(b"\nendobj\n")
@@ -1,19 +1,20 @@
+from contextlib import contextmanager
+from io import BytesIO
 from pypdf import PdfReader, PdfWriter
 import json
+import os
+import threading
+import time
 
-reader = PdfReader("./data/form_fillable.pdf")
-writer = PdfWriter()
+from form_appearance import FormAppearances
+from instrumentation import stage
+from pdf_extraction import index_fields, inherited_attribute
+from pdf_incremental import IncrementalBase, build_update
 
-def create_llm_answer_field_dict():
-    with open('./output/out_extracted.json', 'r') as file:
-        llm_out_answer_dict = json.load(file)
-
-    llm_out_answer_dict = json.loads(llm_out_answer_dict)
-    with open('./output/schema.json', 'r') as file:
-        field_data_dict = json.load(file)
 
+def build_answer_dict(llm_out_answer_dict, field_data_dict):
     answer_dict = dict()
-    
+
     for key in field_data_dict.keys():
         val = llm_out_answer_dict[key]["value"]
         sec_key = field_data_dict[key]["pdf_field_name"]
@@ -29,20 +30,175 @@ def create_llm_answer_field_dict():
     return answer_dict
 
 
-def main_populate():
-    answer_dict = create_llm_answer_field_dict()
+def create_llm_answer_field_dict():
+    with open('./output/out_extracted.json', 'r') as file:
+        llm_out_answer_dict = json.load(file)
+
+    llm_out_answer_dict = json.loads(llm_out_answer_dict)
+    with open('./output/schema.json', 'r') as file:
+        field_data_dict = json.load(file)
+
+    return build_answer_dict(llm_out_answer_dict, field_data_dict)
+
+
+def populate_pdf(answer_dict, output_path, template_path="./data/form_fillable.pdf", flatten=False,
+                 incremental=False):
+    # Templates are parsed once per process and reused for every answer set (see TemplatePopulator).
+    with stage("population"):
+        get_template_populator(template_path, flatten, incremental).fill(answer_dict, output_path)
+
+
+class TemplatePopulator:
+    """
+        Fills many answer sets into one fillable template without re-reading or re-copying it.
 
-    fields = reader.get_fields()
+        The template is parsed once into a PdfWriter that is kept in memory, together with the field
+        index from pdf_extraction.index_fields (which pages hold each field's widgets). The writer
+        remembers the value each field holds; fill() works out which fields end up with a different
+        value (its answers, plus fields an earlier fill set that are now reset to the template's own
+        value), updates only those fields' widgets, with their appearance streams
+        (form_appearance.py), and writes the result straight to its own file. With flatten=True
+        every output is flattened to page content. fill() is serialized with a lock, so one
+        populator can be shared by worker threads.
 
-    writer.append(reader)
+        With incremental=True the writer keeps the template's object numbers, and each output is the
+        template's bytes followed by an incremental update (pdf_incremental.py) holding only the
+        objects of the fields that differ from the template, with their appearances; fill_update()
+        produces the update alone, for storing one copy of the template and an update per form.
+    """
 
-    writer.update_page_form_field_values(
-        writer.pages[0],
-        fields= answer_dict,
-        auto_regenerate=False,
-    )
+    def __init__(self, template_path="./data/form_fillable.pdf", flatten=False, incremental=False):
+        self.template_path = template_path
+        self.flatten = flatten
+        self.incremental = incremental
+        if incremental:
+            with open(template_path, "rb") as f:
+                template_bytes = f.read()
+            self.writer = PdfWriter(BytesIO(template_bytes), incremental=True)
+            self.base = IncrementalBase(template_bytes, PdfReader(BytesIO(template_bytes)))
+        else:
+            self.writer = PdfWriter(clone_from=PdfReader(template_path))
+        self.appearances = FormAppearances(self.writer)
+        self._lock = threading.Lock()
+
+        self.fields = index_fields(self.writer)
+        self.field_pages = {}  # qualified field name -> page indexes holding its widgets
+        # qualified field name -> value that restores the template's own state
+        self.field_defaults = {}
+        for field_name, entry in self.fields.items():
+            self.field_pages[field_name] = entry.pages
+            default = inherited_attribute(entry.field, "/V")
+            if default is None:
+                default = "/Off" if entry.field_type == "/Btn" else ""
+            self.field_defaults[field_name] = str(default)
+
+        # field name -> value it holds in the writer, for fields not at their default
+        self._values = {}
+        self._field_objects = {}  # field name -> references of the objects its updates have changed
+        self.last_changed_pages = []
+        self.last_write_s = 0.0
+        self.last_write_bytes = 0
+
+    def _set_values(self, answer_dict):
+        targets = {field_name: self.field_defaults[field_name] for field_name in self._values}
+        for field_name, value in answer_dict.items():
+            if field_name not in self.field_pages:
+                continue
+            targets[field_name] = self.field_defaults[field_name] if value is None else value
+
+        changed_pages = set()
+        for field_name, value in targets.items():
+            if self._values.get(field_name, self.field_defaults[field_name]) == value:
+                continue
+            changed = self.appearances.set_value(self.fields[field_name], value)
+            field_objects = self._field_objects.setdefault(field_name, {})
+            field_objects.update((ref.idnum, ref) for ref in changed)
+            changed_pages.update(self.field_pages[field_name])
+
+        self._values = {field_name: value for field_name, value in targets.items()
+                        if value != self.field_defaults[field_name]}
+        self.last_changed_pages = sorted(changed_pages)
+
+    def _update(self, extra_objects=()):
+        """
+            The incremental update carrying the writer's current state of every field not at its
+            default.
+        """
+        refs = list(self.appearances.shared_objects) + list(extra_objects)
+        # Fields reset to their default are left out, so readers find the template's own objects for
+        # them; a flattened page draws every appearance it still references from the writer, reset
+        # fields' included
+        field_names = self._field_objects if self.flatten else self._values
+        for field_name in field_names:
+            refs += self._field_objects[field_name].values()
+        objects = {(ref.idnum, ref.generation): ref.get_object() for ref in refs}
+        return build_update(self.base, objects)
+
+    def _write(self, output_path, update_only=False):
+        if self.incremental:
+            with (self.appearances.flattened() if self.flatten else _no_changes()) as flattened:
+                update = self._update(flattened)
+            with open(output_path, "wb") as f:
+                if not update_only:
+                    f.write(self.base.data)
+                f.write(update)
+            return len(update) if update_only else len(self.base.data) + len(update)
+        if self.flatten:
+            with self.appearances.flattened():
+                self.writer.write(output_path)
+        else:
+            self.writer.write(output_path)
+        return os.path.getsize(output_path)
+
+    def fill(self, answer_dict, output_path):
+        with self._lock:
+            self._set_values(answer_dict)
+            start_time = time.perf_counter()
+            self.last_write_bytes = self._write(output_path)
+            self.last_write_s = time.perf_counter() - start_time
+
+    def fill_update(self, answer_dict, update_path):
+        """
+            Writes only the incremental update for answer_dict (incremental=True): the template's
+            bytes followed by the update's are the filled PDF.
+        """
+        if not self.incremental:
+            raise ValueError("fill_update needs a TemplatePopulator with incremental=True")
+        with self._lock:
+            self._set_values(answer_dict)
+            start_time = time.perf_counter()
+            self.last_write_bytes = self._write(update_path, update_only=True)
+            self.last_write_s = time.perf_counter() - start_time
+
+    def fill_many(self, answer_dicts, output_paths):
+        for answer_dict, output_path in zip(answer_dicts, output_paths):
+            self.fill(answer_dict, output_path)
+
+
+@contextmanager
+def _no_changes():
+    yield []
+
+
+_template_populators = {}
+_template_populators_lock = threading.Lock()
+
+
+def get_template_populator(template_path="./data/form_fillable.pdf", flatten=False,
+                           incremental=False):
+    with _template_populators_lock:
+        populator = _template_populators.get((template_path, flatten, incremental))
+        if populator is None:
+            populator = TemplatePopulator(template_path, flatten, incremental)
+            _template_populators[(template_path, flatten, incremental)] = populator
+        return populator
+
+
+def main_populate():
+    answer_dict = create_llm_answer_field_dict()
 
-    writer.write("./output/pdf_populated.pdf")
+    # Every page holding an answered field is filled, not just the first
+    populate_pdf(answer_dict, "./output/pdf_populated.pdf")
 
 if __name__ == "__main__":
     main_populate()
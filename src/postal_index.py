@@ -0,0 +1,201 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+
+# Compact postal code -> (state/province code, place name) index for the US and Canada.
+#
+# Built once from the GeoNames postal code dumps (see build_postal_index.py) into a single binary
+# file that is memory-mapped on first lookup. Every possible code has a fixed slot, so a lookup is
+# one arithmetic slot computation and one read - no pandas, no network, nothing parsed at import
+# time.
+#
+# File layout (little endian):
+#   header   magic "PCIX", version, then (offset, slot count) for the US table, the CA table and the
+#            string table
+#   US table 100000 slots, one per 5-digit ZIP code
+#   CA table 26 * 10 * 26 slots, one per forward sortation area (letter digit letter, e.g. "M5V")
+#   slot     2-byte state/province code ("\0\0" when the code does not exist) + u32 offset of the
+#            place name
+#   strings  u16 length + UTF-8 bytes per place name; places sharing a code are joined with ", " as
+#            pgeocode does
+#
+# The file is not shipped (GeoNames data, built per deployment). Without it, lookups fall back to
+# pgeocode (which downloads the GeoNames data on first use) and a warning is logged once;
+# POSTAL_LOOKUP_FALLBACK=none turns the fallback off for deployments that must not reach the
+# network, and lookups then fail with PostalIndexMissing.
+
+logger = logging.getLogger(__name__)
+
+POSTAL_INDEX_MAGIC = b"PCIX"
+POSTAL_INDEX_VERSION = 1
+DEFAULT_POSTAL_INDEX_PATH = "./data/postal_index.bin"
+
+HEADER = struct.Struct("<4sIIIIIII")
+SLOT = struct.Struct("<2sI")
+STRING_LENGTH = struct.Struct("<H")
+
+US_SLOTS = 100000
+CA_SLOTS = 26 * 10 * 26
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def us_slot(postal_code):
+    """Slot of a US ZIP code ("12345" or ZIP+4 "12345-6789"), or None if it is not one."""
+    digits = str(postal_code).strip().split("-")[0].replace(" ", "")
+    if len(digits) != 5 or not digits.isdigit():
+        return None
+    return int(digits)
+
+
+def ca_slot(postal_code):
+    """
+        Slot of a Canadian postal code's forward sortation area ("M5V 3L9", "M5V3L9" or "M5V"), or
+        None.
+    """
+    code = str(postal_code).strip().upper().replace(" ", "")
+    if len(code) < 3:
+        return None
+    letter_1, digit, letter_2 = code[0], code[1], code[2]
+    if letter_1 not in LETTERS or not digit.isdigit() or letter_2 not in LETTERS:
+        return None
+    return (LETTERS.index(letter_1) * 10 + int(digit)) * 26 + LETTERS.index(letter_2)
+
+
+SLOT_FUNCTIONS = {"us": us_slot, "ca": ca_slot}
+
+
+def write_postal_index(entries_by_country, path):
+    """
+        entries_by_country: {"us": {slot: (state code, place name)}, "ca": {...}}
+        Writes the binary index atomically to path.
+    """
+    strings = bytearray()
+    string_offsets = {}
+
+    def string_offset(text):
+        if text not in string_offsets:
+            encoded = text.encode("utf-8")[:0xFFFF]
+            string_offsets[text] = len(strings)
+            strings.extend(STRING_LENGTH.pack(len(encoded)))
+            strings.extend(encoded)
+        return string_offsets[text]
+
+    tables = []
+    for country, slot_count in [("us", US_SLOTS), ("ca", CA_SLOTS)]:
+        table = bytearray(SLOT.size * slot_count)
+        for slot, (state_code, place_name) in entries_by_country.get(country, {}).items():
+            state = state_code.encode("ascii")[:2].ljust(2, b" ")
+            SLOT.pack_into(table, slot * SLOT.size, state, string_offset(place_name or ""))
+        tables.append(table)
+
+    us_offset = HEADER.size
+    ca_offset = us_offset + len(tables[0])
+    strings_offset = ca_offset + len(tables[1])
+    header = HEADER.pack(POSTAL_INDEX_MAGIC, POSTAL_INDEX_VERSION, us_offset, US_SLOTS, ca_offset,
+                         CA_SLOTS, strings_offset, len(strings))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(tables[0])
+        f.write(tables[1])
+        f.write(strings)
+    os.replace(tmp_path, path)
+
+
+class PostalIndexMissing(FileNotFoundError):
+    pass
+
+
+def postal_index_path():
+    return os.environ.get("POSTAL_INDEX_PATH", DEFAULT_POSTAL_INDEX_PATH)
+
+
+def pgeocode_fallback_enabled():
+    """
+        False when POSTAL_LOOKUP_FALLBACK=none forbids pgeocode's online lookups while the index is
+        missing.
+    """
+    return os.environ.get("POSTAL_LOOKUP_FALLBACK", "").strip().lower() != "none"
+
+
+def missing_index_error():
+    return PostalIndexMissing(f"Postal code index {postal_index_path()} has not been built (run "
+                              f"build_postal_index.py), and POSTAL_LOOKUP_FALLBACK=none turns off "
+                              f"pgeocode")
+
+
+class PostalCodeIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, us_offset, us_slots, ca_offset, ca_slots, strings_offset, _ = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != POSTAL_INDEX_MAGIC or version != POSTAL_INDEX_VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a version {POSTAL_INDEX_VERSION} postal index: {path}")
+        self._tables = {"us": (us_offset, us_slots), "ca": (ca_offset, ca_slots)}
+        self._strings_offset = strings_offset
+
+    def lookup(self, postal_code, country):
+        """Return (state/province code, place name) for a postal code, or None if it is unknown."""
+        country = country.lower()
+        slot = SLOT_FUNCTIONS[country](postal_code)
+        if slot is None:
+            return None
+        table_offset, slot_count = self._tables[country]
+        if slot >= slot_count:
+            return None
+
+        state, place_offset = SLOT.unpack_from(self._mm, table_offset + slot * SLOT.size)
+        if state == b"\0\0":
+            return None
+        string_start = self._strings_offset + place_offset
+        (length,) = STRING_LENGTH.unpack_from(self._mm, string_start)
+        string_start += STRING_LENGTH.size
+        place_name = self._mm[string_start:string_start + length].decode("utf-8")
+        return state.decode("ascii").strip(), place_name
+
+    def slot_table(self, country):
+        """
+            numpy view over a country's slots (fields "state", "place") for vectorized lookups; no
+            copy is made.
+        """
+        import numpy as np
+        table_offset, slot_count = self._tables[country.lower()]
+        dtype = np.dtype([("state", "S2"), ("place", "<u4")])
+        return np.frombuffer(self._mm, dtype=dtype, count=slot_count, offset=table_offset)
+
+    def close(self):
+        self._mm.close()
+
+
+_postal_index = None
+_postal_index_loaded = False
+_postal_index_lock = threading.Lock()
+
+
+def get_postal_index():
+    """
+        Open the index on first use (POSTAL_INDEX_PATH, default ./data/postal_index.bin).
+        Returns None when the file is missing; callers then look codes up with pgeocode, or raise
+        missing_index_error() when not pgeocode_fallback_enabled().
+    """
+    global _postal_index, _postal_index_loaded
+    if not _postal_index_loaded:
+        with _postal_index_lock:
+            if not _postal_index_loaded:
+                path = postal_index_path()
+                _postal_index = PostalCodeIndex(path) if os.path.exists(path) else None
+                if _postal_index is None and pgeocode_fallback_enabled():
+                    logger.warning("Postal code index %s has not been built (run "
+                                   "build_postal_index.py); validating postal codes with pgeocode",
+                                   path)
+                _postal_index_loaded = True
+    return _postal_index
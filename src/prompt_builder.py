@@ -0,0 +1,205 @@
+import hashlib
+from functools import lru_cache
+
+from utils import get_source_priority_list_per_field
+
+# Extraction prompt construction.
+#
+# A prompt is a static prefix followed by a per-patient payload:
+#   prefix   instructions, extraction rules, output format, examples and the form's FIELDS TO FILL
+#            list; compiled once per field list (compile_prompt) and byte-identical for every
+#            patient, so the provider can cache it (implicit prefix caching, or explicit context
+#            caching - see context_cache.py)
+#   payload  the SOURCES block, starting with EXTRACTION_PAYLOAD_HEADER (split_prompt splits on it)
+# Sources are rendered as separate blocks so that a prompt can carry only the sources that matter
+# for the fields it asks about (see build_pruned_prompt).
+
+SOURCE_ORDER = ["S1", "S2", "S3"]
+SOURCE_TITLES = {
+    "S1": "Lab result form (unstructured text)",
+    "S2": "SOAP notes (unstructured text)",
+    "S3": "Patient personal data (JSON)",
+}
+OMITTED_SOURCE_TEXT = "(omitted: not a priority source for the fields requested)"
+
+EXTRACTION_PROMPT_PREFIX = (
+    "You are an information extraction system.\n"
+    "Use ONLY the information in the provided sources. Do NOT guess, infer, or fabricate.\n\n"
+    "However, you have a general understanding of how medical bureaucracy and insurance policy "
+    "works in Canada and the United States.\n\n"
+    "For example, in Canada policy number is represented as a healthcard number.\n\n"
+
+    "EXTRACTION RULES:\n"
+    "0) Field spec echo (required):\n"
+    "   - For each output key, set field_spec to the EXACT matching line from FIELDS TO FILL that "
+    "begins with that key.\n"
+    "   - Copy it verbatim (including checkbox options if present).\n"
+    "   - If you cannot find a matching line, set field_spec = null.\n"
+    "1) Coverage: Fill as many fields as possible. If not explicitly stated, set value = null.\n"
+    "2) Conflicts: If sources disagree, prefer S3 > S2 > S1. If still ambiguous, set null.\n"
+    "3) Formatting:\n"
+    "   - Dates: YYYY-MM-DD when available; otherwise keep partial (YYYY-MM or YYYY) as a string.\n"
+    "   - Phone: digits only. If a full phone appears, ignore separators(-), split into areacode "
+    "(3 digits), first part (3 digits), second part (4 digits) when possible. Always follow the "
+    "standard phone number format (3 digits - 3 digits - 4 digits)\n"
+    "   - Height/weight: keep numeric + unit if present; otherwise numeric only.\n"
+    "4) Checkbox fields:\n"
+    "   - Return the selected option exactly as listed in the field options.\n"
+    "   - If multiple selections are explicitly indicated, return a list of strings.\n"
+    "   - If selection is not explicit, return null.\n"
+    "5) Evidence requirement:\n"
+    "   - Every non-null value MUST include at least one citation with a short supporting "
+    "quote/snippet.\n\n"
+
+    "OUTPUT (JSON only; no extra text):\n"
+    "Return a single JSON object keyed by the field keys. Each field maps to an object with:\n"
+    '  - "field_spec": the exact matching line from FIELDS TO FILL for this key (copy verbatim)\n'
+    '  - "value": extracted value (string/number/list) or null, this must only the answer phrase '
+    'without anything else. For example, diagnosis must only be the name of diagnosis.\n'
+    '  - "citations": [] if value is null; otherwise a list of '
+    '{ "source": "S1|S2|S3", "quote": "..." }\n'
+    '  - "reasoning": brief explanation of how the value was chosen, including conflict resolution '
+    'if applicable\n'
+    '  - "confidence": a number 0.0-1.0 with a brief justification in reasoning (e.g., direct '
+    'match vs ambiguous)\n\n'
+
+    "Confidence guidance (explain briefly in reasoning):\n"
+    "- 0.90-1.00: explicit exact match in a single source (e.g., S3 JSON field or clear statement "
+    "in notes); increase if corroborated across sources, if the document itself mentions any "
+    "doubt, lower the confidence.\n"
+    "- 0.60-0.89: explicit but requires mild normalization (date/phone split) or clearly implied "
+    "by nearby context.\n"
+    "- 0.30-0.59: weak/partial evidence, competing candidates, or incomplete value.\n"
+    "- 0.00: value is null\n\n"
+
+    "Required JSON schema example:\n"
+    "{\n"
+    '  "first name": {\n'
+    '    "field_spec": "first name: Patient First Name",\n'
+    '    "value": "John",\n'
+    '    "citations": [\n'
+    '      {"source": "S2", "quote": "Patient: John Doe"}\n'
+    "    ],\n"
+    '    "reasoning": "First name appears explicitly in S2.",\n'
+    '    "confidence": 0.85\n'
+    "  },\n"
+    '  "hand": {\n'
+    '    "field_spec": "hand: Dominant hand (options: Right, Left)",\n'
+    '    "value": "Right",\n'
+    '    "citations": [\n'
+    '      {"source": "S3", "quote": "\\"dominant_hand\\": \\"Right\\""}\n'
+    "    ],\n"
+    '    "reasoning": "Dominant hand explicitly stated in S3; checkbox option matches exactly.",\n'
+    '    "confidence": 0.95\n'
+    "  }\n"
+    "}\n\n"
+
+    "FIELDS TO FILL:\n"
+)
+
+EXTRACTION_PAYLOAD_HEADER = "SOURCES (cite these explicitly):\n"
+EXTRACTION_PAYLOAD_FOOTER = ("Return the JSON object for the FIELDS TO FILL above, "
+                             "using only these sources.\n")
+
+
+def render_sources(patient_demographic_data, soap_content, lab_result_text, sources=SOURCE_ORDER):
+    source_texts = {"S1": lab_result_text, "S2": soap_content, "S3": patient_demographic_data}
+    source_blocks = []
+    for source in SOURCE_ORDER:
+        source_text = source_texts[source] if source in sources else OMITTED_SOURCE_TEXT
+        source_blocks.append(f"[{source}] {SOURCE_TITLES[source]}:\n{source_text}\n\n")
+    return "".join(source_blocks)
+
+
+class CompiledPrompt:
+    """
+        The static prefix for one field list, rendered once; render() appends a patient's payload to
+        it.
+    """
+
+    def __init__(self, field_list_str):
+        self.prefix = EXTRACTION_PROMPT_PREFIX + field_list_str + "\n\n"
+        self.prefix_sha256 = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def payload(sources_str):
+        return EXTRACTION_PAYLOAD_HEADER + sources_str + EXTRACTION_PAYLOAD_FOOTER
+
+    def render(self, sources_str):
+        return self.prefix + self.payload(sources_str)
+
+
+@lru_cache(maxsize=256)
+def compile_prompt(field_list_str):
+    """
+        CompiledPrompt for a FIELDS TO FILL list (a form template, its LLM subset or one field
+        group).
+    """
+    return CompiledPrompt(field_list_str)
+
+
+def split_prompt(prompt):
+    """(static prefix, payload) of an extraction prompt, or (None, prompt) for any other prompt."""
+    index = prompt.find(EXTRACTION_PAYLOAD_HEADER)
+    if index <= 0 or not prompt.startswith(EXTRACTION_PROMPT_PREFIX):
+        return None, prompt
+    return prompt[:index], prompt[index:]
+
+
+def build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text, field_data,
+                            sources=SOURCE_ORDER):
+    sources_str = render_sources(patient_demographic_data, soap_content, lab_result_text, sources)
+    return compile_prompt(field_data).render(sources_str)
+
+
+def select_sources(field_names, cutoff=None):
+    """
+        Sources needed for a set of fields: the union of the top `cutoff` sources of each field in
+        utils.get_source_priority_list_per_field. cutoff=None keeps every source; fields missing
+        from the table always keep every source.
+    """
+    if cutoff is None:
+        return list(SOURCE_ORDER)
+
+    priority = get_source_priority_list_per_field()
+    selected = set()
+    for field_name in field_names:
+        selected.update(priority.get(field_name, SOURCE_ORDER)[:cutoff])
+    return [source for source in SOURCE_ORDER if source in selected]
+
+
+def count_tokens(text):
+    """
+        Approximate token count (llama-index default tokenizer); used for relative savings, not
+        billing.
+    """
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text))
+
+
+def build_pruned_prompt(patient_demographic_data, soap_content, lab_result_text, field_data,
+                        field_names, cutoff=None):
+    """
+        Build the extraction prompt for field_names with only their priority sources included.
+
+        Returns (prompt, report); report holds the sources kept and the prompt's token count next to
+        the token count of the same prompt with every source included.
+    """
+    sources = select_sources(field_names, cutoff)
+    messages = build_extraction_prompt(patient_demographic_data, soap_content, lab_result_text,
+                                       field_data, sources)
+    prompt_tokens = count_tokens(messages)
+    if len(sources) == len(SOURCE_ORDER):
+        full_prompt_tokens = prompt_tokens
+    else:
+        full_prompt_tokens = count_tokens(build_extraction_prompt(patient_demographic_data,
+                                                                  soap_content, lab_result_text,
+                                                                  field_data))
+    report = {
+        "sources": sources,
+        "prompt_tokens": prompt_tokens,
+        "full_prompt_tokens": full_prompt_tokens,
+        "saved_tokens": full_prompt_tokens - prompt_tokens,
+    }
+    return messages, report
@@ -1,7 +1,9 @@
 from pydantic import BaseModel, Field, create_model, field_validator
 from typing import Optional, List, Union, Dict, Any, Type
 import json
-from utils import get_llamaindex_gemini
+from llm_backends import get_llm
+from llm_cache import get_llm_response_cache, llm_cache_key
+from instrumentation import count, record_llm_usage, stage
 
 
 class Citation(BaseModel):
@@ -102,7 +104,7 @@ def prompt_llm_structured(
     """
     Extract information using structured output with Pydantic model.
     """
-    llm = get_llamaindex_gemini()
+    llm = get_llm()
     MedicalFormExtraction = create_pydantic_model(field_names_json)
 
     # Create structured LLM with Pydantic model
@@ -117,10 +119,26 @@ def prompt_llm_structured(
         json_data=json.dumps(patient_demographic_data, indent=2)
     )
 
+    # Structured responses are cached as the model dump; the key includes the output schema
+    cache = get_llm_response_cache()
+    schema_json = json.dumps(MedicalFormExtraction.model_json_schema(), sort_keys=True)
+    cache_key = llm_cache_key(llm, formatted_prompt, kind=schema_json)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            count("llm_cache_hits")
+            return MedicalFormExtraction.model_validate(cached)
+        count("llm_cache_misses")
+
     # Get structured response
-    response = structured_llm.complete(formatted_prompt)
+    with stage("llm"):
+        response = structured_llm.complete(formatted_prompt)
+    record_llm_usage(response)
 
     # The response.raw is the Pydantic model instance
     extraction_result = response.raw
 
+    if cache is not None:
+        cache.set(cache_key, extraction_result.model_dump())
+
     return extraction_result
@@ -0,0 +1,255 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# In-memory page rasterization for OCR and layout models.
+#
+# Pages are rendered with PyMuPDF straight into NumPy arrays: no PNG files, and no encode/decode
+# round trip.
+#   in-process    pixmap_to_array wraps the pixmap's sample buffer without copying; the array keeps
+#                 the pixmap alive
+#   process pool  render_pages spreads pages over worker processes (one open document per worker, as
+#                 in lab_parsers.LocalPdfParser). Each worker copies its pixmap once into a shared
+#                 memory block, and the parent maps that block as an array, so page pixels are never
+#                 pickled through the pool
+# Each RasterRequest has its own dpi and optional clip (PDF points, origin top left as in PyMuPDF),
+# so a layout model can get whole pages at low resolution while OCR gets just the regions it reads,
+# at high resolution.
+#
+#   with render_pages("./data/form_scanned.pdf", dpi=300) as pages:
+#       for image in pages:  # uint8 (height, width) arrays, or (height, width, 3) with gray=False
+#           layout = model.detect(image)
+#
+#   # iter_pages streams long scans, rendering a few pages ahead
+#   for request, image in iter_pages("./scan.pdf", dpi=300):
+#       text = ocr(image)
+#
+# Arrays from render_pages are views of shared memory and are only valid inside the with block;
+# those from iter_pages only until the next page is taken. Copy any that must outlive that.
+
+DEFAULT_DPI = 300
+
+
+class RasterRequest:
+    def __init__(self, page_number, dpi=DEFAULT_DPI, clip=None):
+        self.page_number = page_number
+        self.dpi = dpi
+        self.clip = tuple(clip) if clip is not None else None
+
+    def __repr__(self):
+        return f"RasterRequest(page_number={self.page_number}, dpi={self.dpi}, clip={self.clip})"
+
+
+class _PixmapBuffer:
+    # Exposes a pixmap's samples through the array interface; NumPy keeps this object (and so the
+    # pixmap) as the array's base, which the bare samples_mv memoryview would not
+    def __init__(self, pixmap):
+        self.pixmap = pixmap
+        if pixmap.n == 1:
+            shape, strides = (pixmap.height, pixmap.width), (pixmap.stride, 1)
+        else:
+            shape, strides = (pixmap.height, pixmap.width, pixmap.n), (pixmap.stride, pixmap.n, 1)
+        self.__array_interface__ = {"version": 3, "shape": shape, "strides": strides,
+                                    "typestr": "|u1", "data": (pixmap.samples_ptr, False)}
+
+
+def pixmap_to_array(pixmap):
+    """
+        Zero-copy uint8 view of a PyMuPDF pixmap: (height, width) for grayscale, (height, width, n)
+        otherwise.
+    """
+    return np.asarray(_PixmapBuffer(pixmap))
+
+
+def render_pixmap(page, request, gray=True, annots=True):
+    import pymupdf
+
+    clip = pymupdf.Rect(request.clip) if request.clip is not None else None
+    return page.get_pixmap(dpi=request.dpi, clip=clip,
+                           colorspace=pymupdf.csGRAY if gray else pymupdf.csRGB, alpha=False,
+                           annots=annots)
+
+
+def render_page(pdf_path, page_number=0, dpi=DEFAULT_DPI, clip=None, gray=True):
+    """One page (or its clip) as an array, rendered in-process."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        request = RasterRequest(page_number, dpi, clip)
+        return pixmap_to_array(render_pixmap(doc[page_number], request, gray))
+
+
+def page_requests(pdf_path, dpi=DEFAULT_DPI):
+    """A RasterRequest for every page of the document."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        return [RasterRequest(page_number, dpi) for page_number in range(doc.page_count)]
+
+
+_worker_doc = None
+
+
+def _init_worker(pdf_path):
+    global _worker_doc
+    import pymupdf
+
+    _worker_doc = pymupdf.open(pdf_path)
+
+
+def _render_to_shared_memory(indexed_requests, gray):
+    """
+        [(index, RasterRequest)] -> [(index, shared memory name, shape)]; the parent owns (and
+        unlinks) the blocks.
+    """
+    results = []
+    for index, request in indexed_requests:
+        image = pixmap_to_array(render_pixmap(_worker_doc[request.page_number], request, gray))
+        block = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+        np.ndarray(image.shape, dtype=np.uint8, buffer=block.buf)[...] = image
+        results.append((index, block.name, image.shape))
+        block.close()
+    return results
+
+
+def _release(block):
+    try:
+        block.close()
+    except BufferError:
+        pass  # a caller still holds a view; the mapping goes away with it
+    block.unlink()
+
+
+def _attach(name, shape):
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+
+
+class RenderedPages:
+    """
+        Arrays for a list of RasterRequests, in request order; a context manager that releases any
+        shared memory.
+    """
+
+    def __init__(self, requests, arrays, blocks=()):
+        self.requests = requests
+        self.arrays = arrays
+        self._blocks = list(blocks)
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def __iter__(self):
+        return iter(self.arrays)
+
+    def __getitem__(self, index):
+        return self.arrays[index]
+
+    def close(self):
+        self.arrays = []
+        for block in self._blocks:
+            _release(block)
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def render_pages(pdf_path, requests=None, dpi=DEFAULT_DPI, gray=True, max_workers=None,
+                 parallel_min_pages=4, chunk_size=None):
+    """
+        Render RasterRequests (default: every page at dpi). Fewer than parallel_min_pages requests,
+        or max_workers=1, render in-process as zero-copy pixmap views; otherwise requests are split
+        into chunks (chunk_size requests each, by default spread evenly over the workers) and
+        rendered in a process pool into shared memory.
+    """
+    import pymupdf
+
+    requests = requests if requests is not None else page_requests(pdf_path, dpi)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if len(requests) < parallel_min_pages or max_workers == 1:
+        with pymupdf.open(pdf_path) as doc:
+            return RenderedPages(requests, [pixmap_to_array(render_pixmap(doc[request.page_number],
+                                                                          request, gray))
+                                            for request in requests])
+
+    worker_count = min(max_workers, len(requests))
+    chunk_size = chunk_size or -(-len(requests) // worker_count)
+    indexed = list(enumerate(requests))
+    chunks = [indexed[start:start + chunk_size] for start in range(0, len(indexed), chunk_size)]
+
+    arrays = [None] * len(requests)
+    blocks = []
+    # Workers register their blocks with the resource tracker; start it here so forked workers share
+    # this process's tracker and the unlink in close() clears the registration
+    resource_tracker.ensure_running()
+    try:
+        with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker,
+                                 initargs=(pdf_path,)) as executor:
+            for chunk_results in executor.map(_render_to_shared_memory, chunks,
+                                              [gray] * len(chunks)):
+                for index, name, shape in chunk_results:
+                    block, arrays[index] = _attach(name, shape)
+                    blocks.append(block)
+    except BaseException:
+        RenderedPages(requests, arrays, blocks).close()
+        raise
+    return RenderedPages(requests, arrays, blocks)
+
+
+def iter_pages(pdf_path, requests=None, dpi=DEFAULT_DPI, gray=True, max_workers=None,
+               parallel_min_pages=4, prefetch=None):
+    """
+        Yield (RasterRequest, array) in request order. With a process pool at most prefetch pages
+        (default two per worker) are rendered ahead of the consumer, and each page's shared memory
+        is released as soon as the next one is taken, so memory stays flat however long the scan is.
+    """
+    import pymupdf
+
+    requests = requests if requests is not None else page_requests(pdf_path, dpi)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if len(requests) < parallel_min_pages or max_workers == 1:
+        with pymupdf.open(pdf_path) as doc:
+            for request in requests:
+                yield request, pixmap_to_array(render_pixmap(doc[request.page_number], request,
+                                                             gray))
+        return
+
+    worker_count = min(max_workers, len(requests))
+    prefetch = prefetch or 2 * worker_count
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker,
+                             initargs=(pdf_path,)) as executor:
+        pending = deque()
+        next_index = 0
+        try:
+            while pending or next_index < len(requests):
+                while next_index < len(requests) and len(pending) < prefetch:
+                    pending.append(executor.submit(_render_to_shared_memory,
+                                                   [(next_index, requests[next_index])], gray))
+                    next_index += 1
+                [(index, name, shape)] = pending.popleft().result()
+                block, image = _attach(name, shape)
+                try:
+                    yield requests[index], image
+                finally:
+                    del image
+                    _release(block)
+        finally:
+            # The consumer stopped early (or a render failed): free the pages rendered ahead
+            for future in pending:
+                if future.cancel():
+                    continue
+                try:
+                    [(_, name, shape)] = future.result()
+                except Exception:
+                    continue
+                _release(_attach(name, shape)[0])
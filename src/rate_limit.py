@@ -0,0 +1,78 @@
+import asyncio
+import random
+import time
+
+# Client-side rate limiting and retries for long-running loops over a remote
+# API (e.g. soap_eval.run_eval).
+#
+# TokenBucket   at most `rate` acquisitions per second on average, with bursts of up to `capacity`;
+#               acquire() waits until enough tokens have refilled. Asyncio-only (one event loop).
+# retry_async   retries transient failures (HTTP 408/429/5xx, connection errors and timeouts) with
+#               exponential backoff and full jitter: attempt n sleeps
+#               uniform(0, min(max_delay, base_delay * 2^n)), so many concurrent workers that fail
+#               together do not retry in lock-step.
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+def is_retryable_error(exc):
+    """
+        True for errors worth retrying: rate limits, server errors, timeouts and dropped
+        connections.
+    """
+    # google.genai APIError has .code, httpx.HTTPStatusError has .response.status_code
+    status = getattr(exc, "code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if type(exc).__module__.startswith("httpx"):
+        import httpx
+        return isinstance(exc, httpx.TransportError)
+    return False
+
+
+async def retry_async(make_call, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                      retryable=is_retryable_error, on_retry=None):
+    """
+        Await make_call() until it succeeds, retrying errors for which retryable(exc) is true.
+        on_retry(attempt, exc, delay) is called before each backoff sleep. The last error is
+        re-raised.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return await make_call()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if on_retry is not None:
+                on_retry(attempt + 1, e, delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,543 @@
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+# Reader for scanned (image-only) copies of a known fillable form.
+#
+# Instead of whole-page layout detection and OCR (ocr_experiment.py), the scan is aligned to the
+# fillable template and only the field rectangles from the form schema (the same
+# bbox/normalized_name specs as schema.json, from the template registry) are read:
+#   1. render   the scan and the template page (without its widgets) to grayscale at `dpi`
+#   2. deskew   estimate the scan's rotation from the row profile of its ink (printed form lines
+#               make the profile sharpest when level) and rotate it back
+#   3. register find the scale and offset mapping template pixels onto the deskewed scan by phase
+#               correlation of the two ink images, which are dominated by the printed boxes and
+#               rules around the field rectangles, then refine it to an affine map from tile-by-tile
+#               offsets (residual rotation, uneven scanner scale)
+#   4. read     crop every field rectangle through that mapping and whiten the ink the blank
+#               template has there (labels, rules, box borders), leaving only what was written.
+#               Checkbox options are decided by the remaining ink density; text regions with no ink
+#               left are null without OCR; the rest are OCR'd with Tesseract (pytesseract, one text
+#               line per region) in batches across a process pool
+# Values are returned keyed by the schema's normalized field names, as {field_spec, value,
+# citations, reasoning, confidence} results (source "SCAN") that merge with demographics fast-path
+# and LLM results.
+#
+# Tesseract is the optional OCR dependency (the ocr extra, pip install -e ".[ocr]", plus the
+# tesseract binary; TESSERACT_CMD overrides its path). It is imported only once a region has ink to
+# read.
+
+INK_THRESHOLD = 160  # grayscale below this is ink
+REGISTRATION_DPI = 50  # deskew and registration run on a downsampled copy
+MAX_SKEW_DEGREES = 5.0
+SCALE_CANDIDATES = np.linspace(0.95, 1.05, 21)
+REFINE_TILE_PX = 256  # tile size for the local offsets behind the affine refinement
+REFINE_MIN_INK = 0.01
+REFINE_MIN_PEAK = 0.05
+TEXT_INK_MIN = 0.004  # share of ink pixels below which a text region is blank
+CHECKBOX_INK_MIN = 0.08  # share of non-printed ink in a checkbox for it to count as ticked
+PRINTED_THRESHOLD = 245  # template grayscale below this is printing
+PRINT_MARGIN_PX = 3  # printed ink is widened by this much to absorb registration error and blur
+REGION_PAD_POINTS = (1.0, 2.0)  # (horizontal, vertical) padding; writing often overruns underlines
+
+SCAN_CONFIDENCE = 0.9  # confidence of ticked checkboxes; OCR word confidences are scaled by it
+# A ticked lone checkbox (no checkbox_opts) reads as this; population maps it to the on-state
+LONE_CHECKBOX_VALUE = "Yes"
+
+
+def render_page(pdf_path, page_number=0, dpi=200, annots=True):
+    """(grayscale uint8 array of one page, page height in points); see rasterize.py."""
+    import pymupdf
+    from rasterize import RasterRequest, pixmap_to_array, render_pixmap
+
+    with pymupdf.open(pdf_path) as doc:
+        page = doc[page_number]
+        pixmap = render_pixmap(page, RasterRequest(page_number, dpi), annots=annots)
+        return pixmap_to_array(pixmap), page.rect.height
+
+
+def downsample(image, factor):
+    """Block-mean downsampling by an integer factor."""
+    if factor <= 1:
+        return image.astype(np.float32)
+    height, width = (image.shape[0] // factor) * factor, (image.shape[1] // factor) * factor
+    blocks = image[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def ink_mask(image):
+    return image < INK_THRESHOLD
+
+
+def estimate_skew(image, max_degrees=MAX_SKEW_DEGREES):
+    """
+        Rotation of the page content in degrees (counter-clockwise positive), from its ink row
+        profile.
+    """
+    ys, xs = np.nonzero(ink_mask(image))
+    if len(xs) == 0:
+        return 0.0
+    xs = xs - image.shape[1] / 2
+
+    def sharpness(angle):
+        # Ink rows after undoing `angle`; level text lines and rules concentrate ink in few rows
+        rows = np.round(ys + xs * np.tan(np.radians(angle))).astype(np.int64)
+        counts = np.bincount(rows - rows.min())
+        return float(np.dot(counts, counts))
+
+    coarse = np.arange(-max_degrees, max_degrees + 1e-9, 0.5)
+    best = max(coarse, key=sharpness)
+    fine = np.arange(best - 0.5, best + 0.5 + 1e-9, 0.05)
+    return float(max(fine, key=sharpness))
+
+
+def rotate(image, degrees):
+    from PIL import Image
+
+    if abs(degrees) < 1e-3:
+        return image
+    rotated = Image.fromarray(image).rotate(degrees, resample=Image.BILINEAR, fillcolor=255)
+    return np.asarray(rotated)
+
+
+def resize(image, scale):
+    from PIL import Image
+
+    height, width = image.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return np.asarray(Image.fromarray(image.astype(np.uint8)).resize(size, Image.BILINEAR))
+
+
+def phase_correlation(reference, moving):
+    """(dy, dx, peak) such that moving[y + dy, x + dx] ~ reference[y, x]."""
+    height = max(reference.shape[0], moving.shape[0])
+    width = max(reference.shape[1], moving.shape[1])
+    spectrum_ref = np.fft.rfft2(reference, s=(height, width))
+    spectrum_mov = np.fft.rfft2(moving, s=(height, width))
+    cross_power = spectrum_mov * np.conj(spectrum_ref)
+    cross_power /= np.abs(cross_power) + 1e-9
+    correlation = np.fft.irfft2(cross_power, s=(height, width))
+    dy, dx = np.unravel_index(np.argmax(correlation), correlation.shape)
+    peak = float(correlation[dy, dx])
+    # Shifts past the half-way point wrap around to negative offsets
+    if dy > height // 2:
+        dy -= height
+    if dx > width // 2:
+        dx -= width
+    return int(dy), int(dx), peak
+
+
+def register(template, scan, scales=SCALE_CANDIDATES):
+    """
+        (scale, offset_y, offset_x, peak) mapping template pixels onto scan pixels:
+            scan_y = scale * template_y + offset_y, likewise for x.
+        Both images are at the same nominal dpi; scale absorbs scanner resolution and print-scaling
+        drift.
+    """
+    scan_ink = ink_mask(scan).astype(np.float32)
+    best = None
+    for scale in scales:
+        scaled = ink_mask(resize(template, scale)).astype(np.float32)
+        dy, dx, peak = phase_correlation(scaled, scan_ink)
+        if best is None or peak > best[3]:
+            best = (float(scale), float(dy), float(dx), peak)
+    return best
+
+
+class Alignment:
+    """
+        Mapping from template page coordinates (PDF points, origin bottom left) to deskewed scan
+        pixels: template pixels at dpi, then the affine matrix (2x3, [x, y, 1] -> [x, y]) onto the
+        scan.
+    """
+
+    def __init__(self, page_height, dpi, skew_degrees, matrix, peak=0.0, tiles=0):
+        self.page_height = page_height
+        self.dpi = dpi
+        self.skew_degrees = skew_degrees
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.peak = peak
+        self.tiles = tiles
+
+    def map_points(self, points):
+        """Template pixel (x, y) points -> scan pixel points."""
+        points = np.asarray(points, dtype=np.float64)
+        return points @ self.matrix[:, :2].T + self.matrix[:, 2]
+
+    def to_pixels(self, bbox, pad=(0.0, 0.0)):
+        """
+            Pixel box (top, bottom, left, right) around a PDF rectangle [x0, y0, x1, y1] on the
+            deskewed scan.
+        """
+        x0, y0, x1, y1 = [float(v) for v in bbox]
+        points_to_pixels = self.dpi / 72
+        left = (min(x0, x1) - pad[0]) * points_to_pixels
+        right = (max(x0, x1) + pad[0]) * points_to_pixels
+        top = (self.page_height - max(y0, y1) - pad[1]) * points_to_pixels
+        bottom = (self.page_height - min(y0, y1) + pad[1]) * points_to_pixels
+        corners = self.map_points([(left, top), (right, top), (left, bottom), (right, bottom)])
+        return (round(corners[:, 1].min()), round(corners[:, 1].max()),
+                round(corners[:, 0].min()), round(corners[:, 0].max()))
+
+    def warp(self, template, shape):
+        """The template page rendered onto the scan's pixel grid (shape), white outside the page."""
+        from PIL import Image
+
+        # PIL maps output pixels back to input pixels, so it takes the inverse transform
+        inverse = np.linalg.inv(np.vstack([self.matrix, [0.0, 0.0, 1.0]]))[:2]
+        warped = Image.fromarray(template).transform((shape[1], shape[0]), Image.AFFINE,
+                                                     tuple(inverse.ravel()),
+                                                     resample=Image.BILINEAR, fillcolor=255)
+        return np.asarray(warped)
+
+    def to_json(self):
+        return {"skew_degrees": round(self.skew_degrees, 3),
+                "matrix": np.round(self.matrix, 5).tolist(),
+                "peak": round(self.peak, 4), "tiles": self.tiles}
+
+
+def refine_affine(template, scan, alignment, tile=REFINE_TILE_PX):
+    """
+        Fit an affine map from local offsets: the template warped by the current alignment is
+        phase-correlated with the scan tile by tile, and the inked tiles give point matches for a
+        least-squares fit (one outlier pass). This absorbs residual rotation, anisotropic scale and
+        shear that a scale-and-offset registration leaves.
+    """
+    warped_ink = ink_mask(alignment.warp(template, scan.shape)).astype(np.float32)
+    scan_ink = ink_mask(scan).astype(np.float32)
+    inverse = np.linalg.inv(np.vstack([alignment.matrix, [0.0, 0.0, 1.0]]))[:2]
+
+    template_points, scan_points = [], []
+    for top in range(0, scan.shape[0] - tile + 1, tile):
+        for left in range(0, scan.shape[1] - tile + 1, tile):
+            reference = warped_ink[top:top + tile, left:left + tile]
+            moving = scan_ink[top:top + tile, left:left + tile]
+            if reference.mean() < REFINE_MIN_INK or moving.mean() < REFINE_MIN_INK:
+                continue
+            dy, dx, peak = phase_correlation(reference, moving)
+            if peak < REFINE_MIN_PEAK or max(abs(dy), abs(dx)) > tile // 4:
+                continue
+            center = np.array([left + tile / 2, top + tile / 2])
+            template_points.append(inverse[:, :2] @ center + inverse[:, 2])
+            scan_points.append(center + [dx, dy])
+    if len(template_points) < 6:
+        return alignment
+
+    template_points, scan_points = np.array(template_points), np.array(scan_points)
+    design = np.hstack([template_points, np.ones((len(template_points), 1))])
+    keep = np.ones(len(design), dtype=bool)
+    for _ in range(2):
+        solution, *_ = np.linalg.lstsq(design[keep], scan_points[keep], rcond=None)
+        residuals = np.linalg.norm(design @ solution - scan_points, axis=1)
+        keep = residuals <= max(2.0, 3 * np.median(residuals))
+    return Alignment(alignment.page_height, alignment.dpi, alignment.skew_degrees, solution.T,
+                     alignment.peak, int(keep.sum()))
+
+
+def align(template, scan, page_height, dpi):
+    """
+        Deskew scan (a page rendered at dpi) and register it to template; returns (deskewed scan,
+        Alignment).
+    """
+    factor = max(1, round(dpi / REGISTRATION_DPI))
+    skew = estimate_skew(downsample(scan, factor))
+    deskewed = rotate(scan, -skew)
+    scale, _, _, _ = register(downsample(template, factor), downsample(deskewed, factor))
+    # The coarse offset is only good to `factor` pixels; one full-resolution correlation at that
+    # scale refines it
+    offset_y, offset_x, peak = phase_correlation(
+        ink_mask(resize(template, scale)).astype(np.float32), ink_mask(deskewed).astype(np.float32))
+    matrix = [[scale, 0.0, offset_x], [0.0, scale, offset_y]]
+    coarse = Alignment(page_height, dpi, skew, matrix, peak)
+    return deskewed, refine_affine(template, deskewed, coarse)
+
+
+def crop(image, box):
+    top, bottom, left, right = box
+    top, left = max(top, 0), max(left, 0)
+    return image[top:max(bottom, top), left:max(right, left)]
+
+
+def dilate(mask, radius):
+    """Binary dilation by a (2 * radius + 1)-pixel square, separably along rows and columns."""
+    for axis in (0, 1):
+        grown = mask.copy()
+        for shift in range(1, radius + 1):
+            forward = [slice(None), slice(None)]
+            backward = [slice(None), slice(None)]
+            forward[axis], backward[axis] = slice(shift, None), slice(None, -shift)
+            grown[tuple(forward)] |= mask[tuple(backward)]
+            grown[tuple(backward)] |= mask[tuple(forward)]
+        mask = grown
+    return mask
+
+
+def printed_mask(template, alignment, shape):
+    """
+        Where the blank template has ink, mapped onto the deskewed scan (shape) and widened by
+        PRINT_MARGIN_PX.
+    """
+    # Any non-white template pixel counts: light tints (shaded section bands) come out as dithered
+    # ink on a scan
+    return dilate(alignment.warp(template, shape) < PRINTED_THRESHOLD, PRINT_MARGIN_PX)
+
+
+def remove_printed(region, printed):
+    """
+        The region with the form's own printing (labels, rules, box borders) whitened, leaving what
+        was written.
+    """
+    region = region.copy()
+    region[printed] = 255
+    return region
+
+
+def trim_to_ink(region, margin=4):
+    """
+        The region cropped to the bounding box of its ink plus margin pixels, so OCR sees only the
+        writing.
+    """
+    rows, columns = np.nonzero(ink_mask(region))
+    if len(rows) == 0:
+        return region
+    return region[max(rows.min() - margin, 0):rows.max() + margin + 1,
+                  max(columns.min() - margin, 0):columns.max() + margin + 1]
+
+
+def ink_share(region):
+    return float(ink_mask(region).mean()) if region.size else 0.0
+
+
+def scan_field_result(field_spec, value, quote, reasoning, confidence):
+    return {
+        "field_spec": field_spec,
+        "value": value,
+        "citations": [{"source": "SCAN", "quote": quote}] if value is not None else [],
+        "reasoning": reasoning,
+        "confidence": confidence if value is not None else 0.0,
+    }
+
+
+_worker_tesseract_config = None
+
+
+def _import_pytesseract():
+    try:
+        import pytesseract
+    except ImportError as e:
+        raise ImportError("Reading scanned forms needs pytesseract: pip install -e \".[ocr]\" and "
+                          "install the tesseract binary") from e
+    return pytesseract
+
+
+def _init_ocr_worker(tesseract_cmd, tesseract_config):
+    global _worker_tesseract_config
+    pytesseract = _import_pytesseract()
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _worker_tesseract_config = tesseract_config
+
+
+def _ocr_regions(regions):
+    """[(field name, PNG bytes)] -> [(field name, text, mean word confidence 0-1)]."""
+    from PIL import Image
+
+    pytesseract = _import_pytesseract()
+
+    results = []
+    for field_name, png in regions:
+        data = pytesseract.image_to_data(Image.open(io.BytesIO(png)),
+                                         config=_worker_tesseract_config,
+                                         output_type=pytesseract.Output.DICT)
+        words = [(word, float(conf)) for word, conf in zip(data["text"], data["conf"])
+                 if word.strip() and float(conf) >= 0]
+        text = " ".join(word for word, _ in words)
+        confidence = sum(conf for _, conf in words) / len(words) / 100 if words else 0.0
+        results.append((field_name, text, confidence))
+    return results
+
+
+class ScannedFormReader:
+    """
+        Reads field values from scans of one fillable form. The template page renders are kept, so a
+        reader can be reused for many scans of the same form. OCR runs in-process for fewer than
+        parallel_min_regions inked text regions; otherwise regions are split into batch_size batches
+        across max_workers processes.
+    """
+
+    def __init__(self, template_path, field_data=None, dpi=200, max_workers=None, batch_size=8,
+                 parallel_min_regions=8, tesseract_cmd=None, tesseract_config="--psm 7"):
+        if field_data is None:
+            from form_registry import get_template_registry
+            field_data = get_template_registry().get(template_path).field_data
+        self.template_path = template_path
+        self.field_data = field_data
+        self.dpi = dpi
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.parallel_min_regions = parallel_min_regions
+        self.tesseract_cmd = tesseract_cmd or os.environ.get("TESSERACT_CMD")
+        self.tesseract_config = tesseract_config
+        self._templates = {}  # page number -> (grayscale render without widgets, page height)
+
+    def template_page(self, page_number):
+        if page_number not in self._templates:
+            self._templates[page_number] = render_page(self.template_path, page_number, self.dpi,
+                                                       annots=False)
+        return self._templates[page_number]
+
+    def fields_by_page(self):
+        pages = {}
+        for field_name, spec in self.field_data.items():
+            pages.setdefault(spec.get("page", 0), {})[field_name] = spec
+        return pages
+
+    def read(self, scan_path):
+        """
+            Return ({normalized field name: scan field result}, report with alignment, timings and
+            region counts).
+        """
+        from utils import generate_combined_string
+
+        start_time = time.perf_counter()
+        results = {}
+        ocr_regions = []
+        report = {"pages": {}, "regions": 0, "blank_regions": 0, "ocr_regions": 0, "checkboxes": 0}
+        page_pixels = 0
+
+        for page_number, page_fields in sorted(self.fields_by_page().items()):
+            template, page_height = self.template_page(page_number)
+            scan, _ = render_page(scan_path, page_number, self.dpi)
+            page_pixels += scan.size
+            deskewed, alignment = align(template, scan, page_height, self.dpi)
+            printed = printed_mask(template, alignment, deskewed.shape)
+            report["pages"][page_number] = alignment.to_json()
+            _, spec_lines = generate_combined_string(page_fields)
+
+            for (field_name, spec), field_spec in zip(page_fields.items(), spec_lines):
+                if spec["type"] == "checkbox":
+                    results[field_name] = self.read_checkbox(spec, field_spec, deskewed, printed,
+                                                             alignment)
+                    report["checkboxes"] += 1
+                    continue
+
+                report["regions"] += 1
+                box = alignment.to_pixels(spec["bbox"], REGION_PAD_POINTS)
+                region = remove_printed(crop(deskewed, box), crop(printed, box))
+                if ink_share(region) < TEXT_INK_MIN:
+                    results[field_name] = scan_field_result(
+                        field_spec, None, None, "Field region is blank on the scan", 0.0)
+                    report["blank_regions"] += 1
+                else:
+                    ocr_regions.append((field_name, field_spec, trim_to_ink(region)))
+
+        report["ocr_regions"] = len(ocr_regions)
+        # Pixels handed to OCR as a share of the scanned page area, versus 1.0 for whole-page OCR
+        ocr_pixels = sum(region.size for _, _, region in ocr_regions)
+        report["ocr_pixel_share"] = round(ocr_pixels / max(page_pixels, 1), 4)
+        for field_name, field_spec, text, confidence in self.ocr(ocr_regions):
+            value = text.strip() or None
+            results[field_name] = scan_field_result(field_spec, value, value,
+                                                    "OCR of the field region on the scan",
+                                                    round(SCAN_CONFIDENCE * confidence, 3))
+
+        report["elapsed_s"] = round(time.perf_counter() - start_time, 3)
+        results = {field_name: results[field_name] for field_name in self.field_data
+                   if field_name in results}
+        return results, report
+
+    def read_checkbox(self, spec, field_spec, deskewed, printed, alignment):
+        # A lone checkbox lists no options: its one widget stands for the "on" state
+        options = spec["checkbox_opts"] or [LONE_CHECKBOX_VALUE]
+        option_ink = []
+        for option, bbox in zip(options, spec["bbox"]):
+            box = alignment.to_pixels(bbox)
+            region = remove_printed(crop(deskewed, box), crop(printed, box))
+            option_ink.append((ink_share(region), option))
+        if not option_ink:
+            return scan_field_result(field_spec, None, None,
+                                     "Checkbox has no rectangle in the schema", 0.0)
+
+        extra_ink, option = max(option_ink)
+        if extra_ink < CHECKBOX_INK_MIN:
+            return scan_field_result(field_spec, None, None, "No option is ticked on the scan", 0.0)
+        return scan_field_result(field_spec, option, f"[x] {option}", "Ticked option on the scan",
+                                 SCAN_CONFIDENCE)
+
+    def ocr(self, regions):
+        """[(field name, field spec, region)] -> [(field name, field spec, text, confidence)]."""
+        from PIL import Image
+
+        if not regions:
+            return []
+        specs = {field_name: field_spec for field_name, field_spec, _ in regions}
+        encoded = []
+        for field_name, _, region in regions:
+            buffer = io.BytesIO()
+            Image.fromarray(region).save(buffer, format="PNG")
+            encoded.append((field_name, buffer.getvalue()))
+
+        if len(encoded) < self.parallel_min_regions or self.max_workers == 1:
+            _init_ocr_worker(self.tesseract_cmd, self.tesseract_config)
+            ocr_results = _ocr_regions(encoded)
+        else:
+            batches = [encoded[start:start + self.batch_size]
+                       for start in range(0, len(encoded), self.batch_size)]
+            workers = min(self.max_workers, len(batches))
+            initargs = (self.tesseract_cmd, self.tesseract_config)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker,
+                                     initargs=initargs) as executor:
+                ocr_results = [result for batch in executor.map(_ocr_regions, batches)
+                               for result in batch]
+        return [(field_name, specs[field_name], text, confidence)
+                for field_name, text, confidence in ocr_results]
+
+
+@lru_cache(maxsize=None)
+def get_scanned_form_reader(template_path):
+    """One reader per fillable form, so its template renders are shared by all its scans."""
+    return ScannedFormReader(template_path)
+
+
+def split_scanned_fields(scanned_results, field_data_json):
+    """
+        Return (fields read from the scan, schema of the fields still to extract); mirrors
+        split_prefilled_fields.
+    """
+    prefilled = {name: result for name, result in scanned_results.items()
+                 if result["value"] is not None}
+    remaining_field_data = {name: spec for name, spec in field_data_json.items()
+                            if name not in prefilled}
+    return prefilled, remaining_field_data
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Read field values from a scanned copy of a fillable form.")
+    arg_parser.add_argument("scan", nargs="?", default="./data/form_scanned.pdf")
+    arg_parser.add_argument("--form", default="./data/form_fillable.pdf",
+                            help="The fillable template")
+    arg_parser.add_argument("--dpi", type=int, default=200)
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--output", default="./output/scanned_form.json")
+    args = arg_parser.parse_args()
+
+    reader = ScannedFormReader(args.form, dpi=args.dpi, max_workers=args.workers)
+    results, report = reader.read(args.scan)
+    print(json.dumps(report, indent=4))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"fields": results, "report": report}, f, indent=4, ensure_ascii=False)
+    read_count = sum(result["value"] is not None for result in results.values())
+    print(f"{read_count}/{len(results)} fields read -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import logging
+import os
 import re
 from collections import defaultdict
 
@@ -6,8 +11,10 @@ from typing import List, Optional
 from pydantic import BaseModel, Field, field_validator
 import re
 
-from utils import get_llamaindex_gemini
-from llama_index.core import PromptTemplate
+from instrumentation import append_jsonl, count, record_llm_usage, stage, track_job
+from llm_backends import aget_llm, get_llm, without_retries
+from llm_cache import get_llm_response_cache, llm_cache_key
+from rate_limit import TokenBucket, retry_async
 
 DATE_REGEX = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
@@ -40,9 +47,11 @@ class SoapExtraction(BaseModel):
 
 
 
-def extract_structured() -> SoapExtraction:
-    template = (
-        """
+SOAP_DATA_PATH = "./data/soap_training_data.json"
+SOAP_EVAL_CHECKPOINT = "./output/soap_eval_checkpoint.jsonl"
+
+SOAP_PROMPT_TEMPLATE = (
+    """
     You are a clinical information extraction system.
 
     Extract ONLY information explicitly stated in the SOAP note.
@@ -52,24 +61,29 @@ def extract_structured() -> SoapExtraction:
     SOAP NOTE:
     {soap_note}
     """
-    )
+)
+
 
-    train_data = load_json("./data/soap_training_data.json")
-    final_str = ""
-    for d in train_data:
-        final_str = d["input_text"]  + "\n" + "-----------------" + "\n" +  final_str
+def format_soap_prompt(text):
+    from llama_index.core import PromptTemplate
+
+    return PromptTemplate(SOAP_PROMPT_TEMPLATE).format(soap_note=text)
+
+
+def extract_structured(backend=None) -> List[SoapExtraction]:
+    """Sequential extraction, one note at a time; run_eval is the concurrent, resumable version."""
+    train_data = load_json(SOAP_DATA_PATH)
 
     text_list = [d["input_text"] for d in train_data]
-    llm = get_llamaindex_gemini()
+    llm = get_llm(backend)
 
     # Create structured LLM with Pydantic model
     structured_llm = llm.as_structured_llm(output_cls=SoapExtraction)
-    prompt_template = PromptTemplate(template)
 
     # Format the prompt
     responses = []
     for text in text_list:
-        formatted_prompt = prompt_template.format(soap_note=text)
+        formatted_prompt = format_soap_prompt(text)
         # Get structured response
         response = structured_llm.complete(formatted_prompt)
         responses.append(response.raw)
@@ -78,6 +92,144 @@ def extract_structured() -> SoapExtraction:
 
     return extraction_result
 
+
+# Concurrent evaluation runner for large eval sets.
+#
+#   python soap_eval.py --concurrency 16 --rpm 300
+#
+# - at most max_concurrency requests in flight, and a token bucket holding the request rate to
+#   requests_per_minute (retries included)
+# - transient errors (429/5xx/timeouts) are retried with jittered exponential backoff
+#   (rate_limit.retry_async); an example that still fails is recorded as failed and left out of
+#   the metrics
+# - every finished example is appended to a JSONL checkpoint keyed by example id and a hash of its
+#   note, so an interrupted run resumes with the examples that have no successful result yet
+#   (failed ones are retried); an edited note invalidates its checkpoint entry
+# - metrics are accumulated as results arrive (EvalAccumulator) and printed every progress_every
+#   examples
+# Structured responses also go through the LLM response cache, like
+# pydantic_defs.prompt_llm_structured.
+
+def example_key(index, example):
+    return str(example.get("id", index))
+
+
+def note_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(checkpoint_path, dataset):
+    """
+        {example key: SoapExtraction} for the examples the checkpoint has a current successful
+        result for.
+    """
+    if not os.path.exists(checkpoint_path):
+        return {}
+    current_sha = {example_key(i, example): note_sha256(example["input_text"])
+                   for i, example in enumerate(dataset)}
+    done = {}
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # line cut short when the previous run was killed mid-write
+            key = entry.get("key")
+            if current_sha.get(key) != entry.get("input_sha256"):
+                continue
+            # Later lines win, so a successful retry replaces an earlier failure
+            if entry.get("output") is not None:
+                done[key] = SoapExtraction.model_validate(entry["output"])
+            else:
+                done.pop(key, None)
+    return done
+
+
+async def aextract_one(llm, structured_llm, text):
+    formatted_prompt = format_soap_prompt(text)
+    cache = get_llm_response_cache()
+    schema_json = json.dumps(SoapExtraction.model_json_schema(), sort_keys=True)
+    cache_key = llm_cache_key(llm, formatted_prompt, kind=schema_json)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            count("llm_cache_hits")
+            return SoapExtraction.model_validate(cached)
+        count("llm_cache_misses")
+
+    with stage("llm"):
+        response = await structured_llm.acomplete(formatted_prompt)
+    record_llm_usage(response)
+    if cache is not None:
+        cache.set(cache_key, response.raw.model_dump())
+    return response.raw
+
+
+async def run_eval(dataset_path=SOAP_DATA_PATH, checkpoint_path=SOAP_EVAL_CHECKPOINT,
+                   max_concurrency=8, requests_per_minute=60, max_attempts=5, progress_every=50,
+                   backend=None):
+    """
+        Return (evaluate()-style results over the successful examples, {example key: error} for
+        failed ones). backend selects the LLM (see llm_backends.py); checkpointed results are reused
+        whichever backend made them, so use a separate checkpoint per backend when comparing them.
+    """
+    logger = logging.getLogger(__name__)
+    dataset = load_json(dataset_path)
+    done = load_checkpoint(checkpoint_path, dataset)
+
+    accumulator = EvalAccumulator()
+    pending = []
+    for i, example in enumerate(dataset):
+        key = example_key(i, example)
+        if key in done:
+            accumulator.add(example["ground_truth"], done[key])
+        else:
+            pending.append((key, example))
+    if done:
+        print(f"Resuming: {len(done)}/{len(dataset)} examples already in {checkpoint_path}")
+    if not pending:
+        return accumulator.results(), {}
+
+    # retry_async below is the only retry layer, so each attempt is one request and one rate limiter
+    # token
+    llm = without_retries(await aget_llm(backend))
+    structured_llm = llm.as_structured_llm(output_cls=SoapExtraction)
+    bucket = TokenBucket(requests_per_minute / 60, capacity=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    failures = {}
+
+    def on_retry(attempt, exc, delay):
+        count("llm_retries")
+        logger.warning("Retrying SOAP extraction (attempt %d) in %.1fs after %s: %s", attempt + 1,
+                       delay, type(exc).__name__, exc)
+
+    async def evaluate_example(key, example):
+        async def attempt():
+            await bucket.acquire()
+            return await aextract_one(llm, structured_llm, example["input_text"])
+
+        entry = {"key": key, "input_sha256": note_sha256(example["input_text"]), "output": None,
+                 "error": None}
+        async with semaphore:
+            try:
+                pred = await retry_async(attempt, max_attempts=max_attempts, on_retry=on_retry)
+            except Exception as e:
+                pred = None
+                entry["error"] = failures[key] = f"{type(e).__name__}: {e}"
+
+        if pred is not None:
+            entry["output"] = pred.model_dump()
+            accumulator.add(example["ground_truth"], pred)
+        append_jsonl(checkpoint_path, entry)
+
+        finished = accumulator.examples + len(failures)
+        if progress_every and finished % progress_every == 0:
+            print(f"[{finished}/{len(dataset)}] {json.dumps(accumulator.results())}")
+
+    await asyncio.gather(*(evaluate_example(key, example) for key, example in pending))
+    return accumulator.results(), failures
+
+
 FIELDS = [
     "patient_age",
     "chief_complaint",
@@ -106,60 +258,87 @@ def check_format(field, value):
         return isinstance(value, str) and DATE_REGEX.match(value)
     return isinstance(value, str)
 
-def evaluate(dataset, outputs):
-
-    field_correct = defaultdict(int)
-    field_total = defaultdict(int)
-    formatting_errors = 0
-    total_fields = 0
-
-    hallucinations = 0
-    hallucination_opportunities = 0
-
-    for ord, example in enumerate(dataset):
-        truth = example["ground_truth"]
-        pred = outputs[ord]
+class EvalAccumulator:
+    """
+        Running totals behind evaluate(): add() one (ground truth, prediction) pair at a time,
+        results() any time.
+    """
 
+    def __init__(self):
+        self.field_correct = defaultdict(int)
+        self.field_total = defaultdict(int)
+        self.formatting_errors = 0
+        self.total_fields = 0
+        self.hallucinations = 0
+        self.hallucination_opportunities = 0
+        self.examples = 0
+
+    def add(self, truth, pred):
+        self.examples += 1
         for field in FIELDS:
             gt_value = truth[field]
             pred_value = getattr(pred, field)
 
-            field_total[field] += 1
-            total_fields += 1
+            self.field_total[field] += 1
+            self.total_fields += 1
 
             # Accuracy
             if is_correct(pred_value, gt_value):
-                field_correct[field] += 1
+                self.field_correct[field] += 1
 
             # Formatting
             if not check_format(field, pred_value):
-                formatting_errors += 1
+                self.formatting_errors += 1
 
             # Hallucination check
             if gt_value is None:
-                hallucination_opportunities += 1
+                self.hallucination_opportunities += 1
                 if pred_value not in (None, [], ""):
-                    hallucinations += 1
+                    self.hallucinations += 1
+
+    def results(self):
+        return {
+            "field_accuracy": {
+                field: round(self.field_correct[field] / self.field_total[field], 3)
+                if self.field_total[field] else 0.0
+                for field in FIELDS
+            },
+            "formatting_error_rate": round(self.formatting_errors / self.total_fields, 3)
+            if self.total_fields else 0.0,
+            "hallucination_rate": round(
+                self.hallucinations / self.hallucination_opportunities, 3
+            ) if self.hallucination_opportunities else 0.0
+        }
 
-    results = {
-        "field_accuracy": {
-            field: round(field_correct[field] / field_total[field], 3)
-            for field in FIELDS
-        },
-        "formatting_error_rate": round(formatting_errors / total_fields, 3),
-        "hallucination_rate": round(
-            hallucinations / hallucination_opportunities, 3
-        ) if hallucination_opportunities else 0.0
-    }
 
-    return results
+def evaluate(dataset, outputs):
+    accumulator = EvalAccumulator()
+    for ord, example in enumerate(dataset):
+        accumulator.add(example["ground_truth"], outputs[ord])
+    return accumulator.results()
 
 def main():
-    result = extract_structured()
-    dataset = load_json("./data/soap_training_data.json")
-    outputs = result
-
-    results = evaluate(dataset, outputs)
+    arg_parser = argparse.ArgumentParser(description="Evaluate structured SOAP note extraction.")
+    arg_parser.add_argument("--data", default=SOAP_DATA_PATH)
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight LLM requests")
+    arg_parser.add_argument("--rpm", type=float, default=60,
+                            help="Max LLM requests per minute (retries included)")
+    arg_parser.add_argument("--max-attempts", type=int, default=5,
+                            help="Attempts per note on transient errors")
+    arg_parser.add_argument("--checkpoint", default=SOAP_EVAL_CHECKPOINT)
+    arg_parser.add_argument("--restart", action="store_true",
+                            help="Discard the checkpoint and start over")
+    arg_parser.add_argument("--progress-every", type=int, default=50)
+    arg_parser.add_argument("--backend", default=None,
+                            help="LLM backend (default: LLM_BACKEND or gemini)")
+    args = arg_parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    with track_job("soap_eval", "./output/metrics.jsonl"):
+        results, failures = asyncio.run(run_eval(args.data, args.checkpoint, args.concurrency,
+                                                 args.rpm, args.max_attempts, args.progress_every,
+                                                 args.backend))
 
     print("\n=== Evaluation Results ===")
     print("\nField-Level Accuracy:")
@@ -168,6 +347,10 @@ def main():
 
     print(f"\nFormatting Error Rate: {results['formatting_error_rate']}")
     print(f"Hallucination Rate: {results['hallucination_rate']}")
+    if failures:
+        print(f"\n{len(failures)} notes failed (re-run to retry them):")
+        for key, error in failures.items():
+            print(f"  {key}: {error}")
 
 if __name__ == "__main__":
     main()
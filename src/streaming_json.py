@@ -0,0 +1,108 @@
+import json
+
+# Incremental parser for the extraction output format: a single top-level JSON object whose values
+# are per-field objects. Text is fed as it streams from the LLM, and each field is emitted as soon
+# as its value closes, so downstream stages can start before the completion finishes and a truncated
+# response still yields every field completed before the cut. Text before the first "{" (prose,
+# ```json fences) is ignored.
+
+
+class IncrementalFieldParser:
+    def __init__(self):
+        self.done = False
+
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        self._key_chars = None  # collecting a top-level key while not None
+        self._key = None  # last complete top-level key
+        self._value_chars = None  # collecting the current top-level value while not None
+
+    def feed(self, text):
+        """
+            Consume a chunk of streamed text; return a list of (field name, value) completed in it.
+        """
+        completed = []
+        for ch in text:
+            if self.done:
+                break
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._value_chars is not None:
+                self._feed_value(ch, completed)
+            else:
+                self._feed_top_level(ch)
+        return completed
+
+    def _feed_top_level(self, ch):
+        # Between values at depth 1: only keys, ":" and "," (or the closing brace) appear here.
+        if self._key_chars is not None:
+            if self._escape:
+                self._escape = False
+                self._key_chars.append(ch)
+            elif ch == "\\":
+                self._escape = True
+                self._key_chars.append(ch)
+            elif ch == '"':
+                self._key = json.loads('"' + "".join(self._key_chars) + '"')
+                self._key_chars = None
+            else:
+                self._key_chars.append(ch)
+        elif ch == '"' and self._key is None:
+            self._key_chars = []
+        elif ch == ":" and self._key is not None:
+            self._value_chars = []
+        elif ch == "}":
+            self.done = True
+
+    def _feed_value(self, ch, completed):
+        chars = self._value_chars
+
+        if self._in_string:
+            chars.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return
+
+        if ch == '"':
+            self._in_string = True
+            chars.append(ch)
+        elif ch in "{[":
+            self._depth += 1
+            chars.append(ch)
+        elif ch in "}]" and self._depth > 1:
+            self._depth -= 1
+            chars.append(ch)
+            if self._depth == 1:
+                self._emit(completed)
+        elif self._depth == 1 and ch in ",}":
+            # End of a scalar value (null, number, string, true/false) or of a value already emitted
+            if "".join(chars).strip():
+                self._emit(completed)
+            self._value_chars = None
+            self._key = None
+            if ch == "}":
+                self.done = True
+        else:
+            chars.append(ch)
+
+    def _emit(self, completed):
+        raw_value = "".join(self._value_chars).strip()
+        # Leave the value collected but empty so the following "," or "}" closes it without
+        # re-emitting
+        self._value_chars = []
+        try:
+            value = json.loads(raw_value)
+        except ValueError:
+            return
+        completed.append((self._key, value))
@@ -1,6 +1,9 @@
-from llama_index.llms.google_genai import GoogleGenAI
 import json
 
+from instrumentation import stage
+
+gemini_api_key_2 = ""  # falls back to the GOOGLE_API_KEY environment variable when empty
+
 
 def compare_with_ground_truth(llm_data_dict):
     def normalize_value(value):
@@ -114,29 +117,43 @@ def compare_with_ground_truth(llm_data_dict):
     return results
 
 
-def get_field_data():
+def generate_combined_string(fields_dict):
+    lines = []
+
+    for field_name, field_data in fields_dict.items():
+        if field_data['type'] == 'checkbox':
+            options = ', '.join(field_data['checkbox_opts'])
+            lines.append(f"• {field_name} , {field_data['label']} (Options: {options})")
+        else:
+            lines.append(f"• {field_name} : {field_data['label']}")
+
+    return '\n'.join(lines), lines
+
 
-    with open('./output/schema.json', 'r') as file:
-        field_data = json.load(file)
+def get_field_data(pdf_path=None):
+    """
+        Return (prompt field list string, prompt lines, schema dict).
 
-    def generate_combined_string(fields_dict):
-        lines = []
+        With pdf_path, the compiled schema comes from the form template registry (compiled once per
+        form, then loaded by fingerprint). Without it, ./output/schema.json is read as before.
+    """
+    with stage("schema"):
+        if pdf_path is not None:
+            from form_registry import get_template_registry
+            template = get_template_registry().get(pdf_path)
+            return template.prompt_str, template.prompt_lines, template.field_data
 
-        for field_name, field_data in fields_dict.items():
-            if field_data['type'] == 'checkbox':
-                options = ', '.join(field_data['checkbox_opts'])
-                lines.append(f"• {field_name} , {field_data['label']} (Options: {options})")
-            else:
-                lines.append(f"• {field_name} : {field_data['label']}")
+        with open('./output/schema.json', 'r') as file:
+            field_data = json.load(file)
 
-        return '\n'.join(lines), lines
+        # Usage
+        combined_str, line_list = generate_combined_string(field_data)
+        return combined_str, line_list, field_data
 
-    # Usage
-    combined_str, line_list = generate_combined_string(field_data)
-    return combined_str, line_list, field_data
 
+def get_llamaindex_gemini() -> "GoogleGenAI":
+    from llama_index.llms.google_genai import GoogleGenAI
 
-def get_llamaindex_gemini() -> GoogleGenAI:
     SAFE = [
         {
             "category": "HARM_CATEGORY_DANGEROUS",
@@ -261,3 +278,42 @@ def get_source_priority_list_per_field():
         "delivery": ["S1", "S2", "S3"],
     }
     return FIELD_SOURCE_PRIORITY
+
+
+def get_field_groups(field_data):
+    """
+        Split a form schema into field groups that can be extracted by independent, concurrent LLM
+        requests.
+
+        Groups (first matching rule wins; empty groups are dropped):
+          identity_contact = name, phones, address, employer/insurance identifiers
+          dates            = all d/m/y date parts
+          medications      = medication / dose / frequency rows
+          diagnoses        = primary and secondary diagnoses
+          checkboxes       = checkbox fields and their free-text companions (e.g. doctor_other)
+          other            = everything else (vitals, ...)
+
+        Returns {group name: {field name: field spec}} preserving schema order inside each group.
+    """
+    identity_contact = {"first name", "areacode", "phonea", "phoneb", "areacode1", "phonea1",
+                        "phoneb1", "address", "employer name", "company_name", "contract", "cert"}
+
+    def group_of(field_name, field_spec):
+        if field_name in identity_contact:
+            return "identity_contact"
+        if field_name.startswith("date_"):
+            return "dates"
+        if field_name.startswith(("medication", "dose", "often")):
+            return "medications"
+        if field_name.startswith("diagnosis_"):
+            return "diagnoses"
+        if field_spec["type"] == "checkbox" or field_name.endswith("_other"):
+            return "checkboxes"
+        return "other"
+
+    groups = {name: {} for name in ["identity_contact", "dates", "medications", "diagnoses",
+                                    "checkboxes", "other"]}
+    for field_name, field_spec in field_data.items():
+        groups[group_of(field_name, field_spec)][field_name] = field_spec
+
+    return {name: fields for name, fields in groups.items() if fields}